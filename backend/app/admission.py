@@ -0,0 +1,182 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import numpy as np
+from app.metrics import ADMISSION_REJECTIONS, ADMISSION_WAITING
+
+# ==============================
+# Config
+# ==============================
+# Per-sensor token bucket: sustained readings per second and burst size
+SENSOR_RATE = float(os.getenv("PREDICT_SENSOR_RATE", "1.0"))
+SENSOR_BURST = float(os.getenv("PREDICT_SENSOR_BURST", "10"))
+# Global cap on /predict calls doing model + DB work at once, with a short
+# bounded queue in front; anything beyond is shed immediately
+MAX_CONCURRENCY = int(os.getenv("PREDICT_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("PREDICT_QUEUE_TIMEOUT", "2.0"))
+# Bucket table size cap: past it the least recently seen sensor's slot is
+# reused once its bucket has refilled, otherwise new ids are turned away
+MAX_TRACKED_SENSORS = int(os.getenv("PREDICT_MAX_TRACKED_SENSORS", "100000"))
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    One token bucket per sensor in two arrays (tokens, last refill time).
+    Refill is computed lazily on each take, so idle sensors cost nothing.
+    slots is kept in least-recently-used order for eviction when full.
+    """
+
+    def __init__(self, rate, burst, capacity=256, max_tracked=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_tracked = max_tracked or MAX_TRACKED_SENSORS
+        self.slots = OrderedDict()
+        self.tokens = np.zeros(capacity)
+        self.stamp = np.zeros(capacity)
+        self._lock = threading.Lock()
+
+    def _slot(self, key, now):
+        """
+        Slot for key, or the seconds a new key must wait while the table
+        is full of buckets that are still refilling.
+        """
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.slots.move_to_end(key)
+            return slot, 0.0
+
+        if len(self.slots) >= self.max_tracked:
+            # Only a bucket that has refilled can go: dropping it loses
+            # nothing, where dropping a drained one would hand its sensor
+            # a fresh burst
+            oldest, slot = next(iter(self.slots.items()))
+            refill = (self.burst - self.tokens[slot]) / self.rate - (now - self.stamp[slot])
+            if refill > 0:
+                return None, refill
+            del self.slots[oldest]
+        else:
+            slot = len(self.slots)
+        if slot >= len(self.tokens):
+            grow = len(self.tokens)
+            self.tokens = np.concatenate([self.tokens, np.zeros(grow)])
+            self.stamp = np.concatenate([self.stamp, np.zeros(grow)])
+        self.slots[key] = slot
+        self.tokens[slot] = self.burst
+        self.stamp[slot] = now
+        return slot, 0.0
+
+    def take(self, key, now=None):
+        """
+        Spend one token. Returns 0 when admitted, else seconds until a
+        token will be available.
+        """
+        now = now or time.monotonic()
+        with self._lock:
+            slot, wait = self._slot(key, now)
+            if slot is None:
+                return wait
+            tokens = min(self.burst, self.tokens[slot] + (now - self.stamp[slot]) * self.rate)
+            self.stamp[slot] = now
+            if tokens >= 1.0:
+                self.tokens[slot] = tokens - 1.0
+                return 0.0
+            self.tokens[slot] = tokens
+            return (1.0 - tokens) / self.rate
+
+
+class ConcurrencyGate:
+    """
+    Event-loop side limiter: waiting happens on the loop, not in a
+    threadpool thread, so queued ingestion never starves other routes.
+    """
+
+    def __init__(self, limit, max_queue, timeout):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise Rejected("queue_full", 1)
+            self.waiting += 1
+            ADMISSION_WAITING.set(self.waiting)
+            try:
+                await self._acquire()
+            finally:
+                self.waiting -= 1
+                ADMISSION_WAITING.set(self.waiting)
+        else:
+            await self._semaphore.acquire()
+
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _acquire(self):
+        """
+        Acquire with the queue timeout. asyncio.wait_for on 3.10 can time
+        out after the acquire has already won a permit and drop it, so the
+        acquire runs as its own task and any permit it ends up holding
+        after we stop waiting is handed back.
+        """
+        task = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            self._abandon(task)
+            raise
+        if not done:
+            self._abandon(task)
+            raise Rejected("queue_timeout", 1)
+
+    def _abandon(self, task):
+        def give_back(task):
+            if not task.cancelled() and task.exception() is None:
+                self._semaphore.release()
+
+        task.cancel()
+        task.add_done_callback(give_back)
+
+
+buckets = TokenBuckets(SENSOR_RATE, SENSOR_BURST)
+gate = ConcurrencyGate(MAX_CONCURRENCY, MAX_QUEUE, QUEUE_TIMEOUT)
+
+
+@asynccontextmanager
+async def admit(sensor_id):
+    """
+    Admission for one reading: the sensor's bucket first (cheap, rejects
+    a flooding client without touching the shared queue), then the gate.
+    Raises Rejected with a Retry-After hint in whole seconds.
+    """
+    wait = buckets.take(sensor_id)
+    if wait:
+        ADMISSION_REJECTIONS.labels("sensor_rate").inc()
+        raise Rejected("sensor_rate", max(1, math.ceil(wait)))
+
+    try:
+        async with gate.slot():
+            yield
+    except Rejected as e:
+        ADMISSION_REJECTIONS.labels(e.reason).inc()
+        raise
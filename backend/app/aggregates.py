@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Window Layout
+# ==============================
+# name -> (span seconds, bucket seconds); each window is a ring of span/bucket
+# slots, so an update touches one slot and expired slots are recycled in place
+WINDOWS = {
+    "1h": (3600, 60),
+    "8h": (8 * 3600, 300),
+    "24h": (24 * 3600, 900),
+}
+
+WARMUP_ENABLED = os.getenv("AGGREGATES_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+def window_bucket(window, now=None):
+    """
+    Index of the bucket `now` falls in for a window: the means of a window
+    change as its oldest bucket expires, with no new reading to show for it.
+    """
+    return int((now or time.time()) // WINDOWS[window][1])
+
+
+class RingWindow:
+    """
+    Bucketed sliding window for many keys at once: row = key, column = ring
+    slot. Each slot remembers which bucket it currently holds, so a stale
+    slot is reset on the first write of a newer bucket.
+    """
+
+    def __init__(self, span, bucket, capacity=64):
+        self.span = span
+        self.bucket = bucket
+        self.n = span // bucket
+        self.sums = np.zeros((capacity, self.n))
+        self.counts = np.zeros((capacity, self.n), dtype=np.int64)
+        self.epochs = np.full((capacity, self.n), -1, dtype=np.int64)
+
+    def grow(self, capacity):
+        extra = capacity - len(self.sums)
+        self.sums = np.vstack([self.sums, np.zeros((extra, self.n))])
+        self.counts = np.vstack([self.counts, np.zeros((extra, self.n), dtype=np.int64)])
+        self.epochs = np.vstack([self.epochs, np.full((extra, self.n), -1, dtype=np.int64)])
+
+    def add(self, row, t, value):
+        b = int(t // self.bucket)
+        i = b % self.n
+        if self.epochs[row, i] != b:
+            if self.epochs[row, i] > b:
+                return  # older than anything the window still holds
+            self.epochs[row, i] = b
+            self.sums[row, i] = 0.0
+            self.counts[row, i] = 0
+        self.sums[row, i] += value
+        self.counts[row, i] += 1
+
+    def totals(self, rows, now):
+        """
+        (sums, counts) over the live buckets of each requested row.
+        """
+        live = self.epochs[rows] > int(now // self.bucket) - self.n
+        return (self.sums[rows] * live).sum(axis=1), (self.counts[rows] * live).sum(axis=1)
+
+
+class WindowedMeans:
+    """
+    Rolling means of one value for a family of keys (sensors or regions)
+    over every window in WINDOWS.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.windows = {name: RingWindow(span, bucket) for name, (span, bucket) in WINDOWS.items()}
+
+    def add(self, key, t, value):
+        row = self.slots.get(key)
+        if row is None:
+            row = len(self.slots)
+            capacity = len(next(iter(self.windows.values())).sums)
+            if row == capacity:
+                for w in self.windows.values():
+                    w.grow(capacity * 2)
+            self.slots[key] = row
+        for w in self.windows.values():
+            w.add(row, t, value)
+
+    def means(self, window, now):
+        """
+        {key: (mean, count)} for keys with at least one reading in window.
+        """
+        if not self.slots:
+            return {}
+        keys = list(self.slots)
+        rows = np.array([self.slots[k] for k in keys], dtype=np.int64)
+        sums, counts = self.windows[window].totals(rows, now)
+        return {
+            k: (float(s / c), int(c))
+            for k, s, c in zip(keys, sums, counts)
+            if c > 0
+        }
+
+    def mean(self, key, window, now):
+        row = self.slots.get(key)
+        if row is None:
+            return None
+        sums, counts = self.windows[window].totals(np.array([row]), now)
+        return float(sums[0] / counts[0]) if counts[0] else None
+
+
+class RegionAggregates:
+    def __init__(self):
+        self.sensors = WindowedMeans()
+        self.regions = WindowedMeans()
+        self._lock = threading.Lock()
+
+    def add(self, sensor_id, region_id, t, aqi):
+        with self._lock:
+            self.sensors.add(sensor_id, t, aqi)
+            if region_id is not None:
+                self.regions.add(region_id, t, aqi)
+
+    def region_means(self, window, now=None):
+        with self._lock:
+            return self.regions.means(window, now or time.time())
+
+    def sensor_means(self, window, now=None):
+        with self._lock:
+            return self.sensors.means(window, now or time.time())
+
+    def window_mean(self, scope, key, window, now=None):
+        """
+        Rolling mean for one sensor or region, None without readings.
+        """
+        family = self.sensors if scope == "sensor" else self.regions
+        with self._lock:
+            return family.mean(key, window, now or time.time())
+
+    def warm_up(self, region_of, cutoffs):
+        """
+        Seed the windows from the last 24h of readings once at startup,
+        streamed through a server-side cursor, one shard after another.
+        cutoffs holds each shard's highest reading id, all read before this
+        worker took or heard of any reading: later ones arrive through the
+        live path instead, so none is counted twice.
+        """
+        from app.db import SHARDS
+
+        loaded = sum(
+            self._warm_up_shard(shard, cutoff, region_of) for shard, cutoff in zip(SHARDS, cutoffs)
+        )
+        logger.info("Rolling aggregates warmed up from %d readings", loaded)
+
+    def _warm_up_shard(self, shard, cutoff, region_of):
+        from app.db import get_shard_connection
+
+        span = max(span for span, _ in WINDOWS.values())
+        conn = get_shard_connection(shard)
+        try:
+            stream = conn.cursor(name="aggregates_warmup")
+            stream.itersize = 5000
+            stream.execute("""
+                SELECT sensor_id,
+                       EXTRACT(EPOCH FROM timestamp AT TIME ZONE current_setting('TimeZone')),
+                       predicted_aqi
+                FROM sensor_readings
+                WHERE timestamp > now() - make_interval(secs => %s)
+                  AND id <= %s
+                  AND predicted_aqi IS NOT NULL
+            """, (span, cutoff))
+
+            loaded = 0
+            for sensor_id, t, aqi in stream:
+                self.add(sensor_id, region_of(sensor_id), float(t), float(aqi))
+                loaded += 1
+            stream.close()
+            conn.rollback()
+            return loaded
+        finally:
+            conn.close()
+
+
+aggregates = RegionAggregates()
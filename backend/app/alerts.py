@@ -0,0 +1,366 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from app.aggregates import WINDOWS
+
+logger = logging.getLogger(__name__)
+
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL")
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5"))
+# Default hysteresis: a firing rule resolves once the value drops below this
+# fraction of its threshold, unless the rule sets clear_threshold itself
+DEFAULT_CLEAR_FRACTION = 0.9
+
+SCOPES = ("sensor", "region")
+METRICS = ("aqi", "PM2_5", "PM10", "NO2", "CO", "SO2", "O3", "NH3")
+RULE_WINDOWS = ("reading",) + tuple(WINDOWS)
+
+# First key of the two-int advisory locks that make a worker a subject's
+# owner, plus the scope's position in SCOPES; the subject id is the second
+ADVISORY_LOCK_CLASS = 4038
+# How often a worker tries to claim the subjects nobody owns
+CLAIM_INTERVAL = float(os.getenv("ALERT_CLAIM_INTERVAL", "10"))
+
+
+# ==============================
+# Sinks
+# ==============================
+class LogSink:
+    def send(self, event):
+        logger.warning("Alert %s: %s", event["state"], event)
+
+
+class WebhookSink:
+    """
+    POSTs each alert event as JSON. Any HTTP endpoint will do, including a
+    local stand-in during development.
+    """
+
+    def __init__(self, url, timeout=ALERT_WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, event):
+        requests.post(self.url, json=event, timeout=self.timeout).raise_for_status()
+
+
+def default_sink():
+    return WebhookSink(ALERT_WEBHOOK_URL) if ALERT_WEBHOOK_URL else LogSink()
+
+
+# ==============================
+# Rule Engine
+# ==============================
+class Rule:
+    __slots__ = ("id", "name", "scope", "target_id", "metric", "window",
+                 "threshold", "clear_threshold", "consecutive")
+
+    def __init__(self, row):
+        (self.id, self.name, self.scope, self.target_id, self.metric, self.window,
+         self.threshold, clear_threshold, self.consecutive) = row
+        self.clear_threshold = (
+            clear_threshold if clear_threshold is not None else self.threshold * DEFAULT_CLEAR_FRACTION
+        )
+
+
+def step(rule, streak, firing, value):
+    """
+    Advance one (rule, subject) state by one value. A rule fires once after
+    `consecutive` breaches in a row and resolves once the value falls to
+    clear_threshold (hysteresis); in between it stays as it is. Returns
+    (streak, firing, transition) with transition "firing", "resolved" or None.
+    """
+    if value > rule.threshold:
+        streak += 1
+        if not firing and streak >= rule.consecutive:
+            return streak, True, "firing"
+        return streak, firing, None
+
+    if firing and value <= rule.clear_threshold:
+        return 0, False, "resolved"
+    return 0, firing, None
+
+
+class AlertEngine:
+    """
+    Rules are compiled into an index keyed by (scope, target id), with a
+    None target for fleet-wide rules. A reading only evaluates the rules
+    under its own sensor, its region and the two wildcard keys, so cost per
+    reading does not grow with the total number of rules.
+
+    Every worker sees every reading (its own, and the others' through the
+    event bus) and advances the per (rule, subject) state of step() in
+    memory, so evaluating a reading never touches the database. Each
+    subject (a sensor or region) has one owner: the worker holding its
+    advisory lock on the engine's own connection. Only the owner records
+    what fires or resolves, on the dispatcher thread, and the firing flag
+    in alert_state guards against recording a transition twice. An owner's
+    locks go with its connection; the next worker to claim the subject
+    takes over the firing flags as stored.
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink or default_sink()
+        self._index = {}
+        self._rules = {}
+        self._dirty = True
+        self._lock = threading.Lock()
+        # (rule_id, subject_id) -> [streak, firing]
+        self._state = {}
+        # (scope, subject_id) this worker owns, and those seen but not claimed
+        self._owned = set()
+        self._unowned = set()
+        self._conn = None
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alerts")
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _compile(self):
+        from app.db import with_cursor, execute
+
+        def load(cursor):
+            execute(cursor, "alert_rules_load", """
+                SELECT id, name, scope, target_id, metric, time_window,
+                       threshold, clear_threshold, consecutive
+                FROM alert_rules
+                WHERE is_active
+            """)
+            return [Rule(r) for r in cursor.fetchall()]
+
+        index = {}
+        for rule in with_cursor(load):
+            index.setdefault((rule.scope, rule.target_id), []).append(rule)
+        self._index = index
+        self._rules = {rule.id: rule for rules in index.values() for rule in rules}
+        for key in [key for key in self._state if key[0] not in self._rules]:
+            del self._state[key]
+
+    def evaluate(self, sensor_id, region_id, values, window_mean):
+        """
+        Check one reading. `values` maps metric -> reading value and
+        window_mean(scope, subject_id, window) returns a rolling mean AQI.
+        """
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._dirty = False
+                    try:
+                        self._compile()
+                    except Exception:
+                        self._dirty = True
+                        raise
+
+        index = self._index
+        candidates = (
+            index.get(("sensor", sensor_id), [])
+            + index.get(("sensor", None), [])
+            + (index.get(("region", region_id), []) if region_id is not None else [])
+            + (index.get(("region", None), []) if region_id is not None else [])
+        )
+        if not candidates:
+            return
+
+        events = []
+        with self._lock:
+            for rule in candidates:
+                subject_id = sensor_id if rule.scope == "sensor" else region_id
+
+                if rule.window == "reading":
+                    value = values.get(rule.metric)
+                else:
+                    value = window_mean(rule.scope, subject_id, rule.window)
+                if value is None:
+                    continue
+
+                state = self._state.get((rule.id, subject_id))
+                if state is None:
+                    state = self._state[(rule.id, subject_id)] = [0, False]
+                    if (rule.scope, subject_id) not in self._owned:
+                        self._unowned.add((rule.scope, subject_id))
+                state[0], state[1], transition = step(rule, state[0], state[1], value)
+                if transition:
+                    events.append(self._event(rule, transition, subject_id, sensor_id, value))
+
+        for event in events:
+            self._dispatcher.submit(self._settle, event)
+
+    def run(self):
+        """
+        Background loop: claims the subjects nobody owns, so a worker that
+        stopped is taken over within CLAIM_INTERVAL.
+        """
+        while True:
+            time.sleep(CLAIM_INTERVAL)
+            self._dispatcher.submit(self._claim_unowned)
+
+    # The methods below run on the dispatcher thread, the only user of
+    # self._conn
+
+    def _settle(self, event):
+        """
+        Record and deliver a transition if this worker owns its subject,
+        claiming the subject first when it has no owner yet.
+        """
+        subject = (event["scope"], event["subject_id"])
+        try:
+            claiming = subject not in self._owned
+            if claiming and not self._own([subject]):
+                return
+            if self._store(event):
+                self._deliver(event)
+            if claiming:
+                self._adopt([subject])
+        except Exception:
+            logger.exception("Could not record alert %s", event)
+
+    def _claim_unowned(self):
+        with self._lock:
+            unowned = list(self._unowned)
+        if not unowned:
+            return
+        try:
+            claimed = self._own(unowned)
+            if claimed:
+                self._adopt(claimed)
+        except Exception:
+            logger.exception("Claiming alert subjects failed, retrying next interval")
+
+    def _own(self, subjects):
+        claimed = self._claim(subjects)
+        with self._lock:
+            self._owned.update(claimed)
+            self._unowned.difference_update(claimed)
+        return claimed
+
+    def _adopt(self, subjects):
+        # A new owner goes on from the firing flags as recorded, so an alert
+        # is neither fired twice nor left open
+        subjects = set(subjects)
+        with self._lock:
+            keys = [
+                key for key in self._state
+                if key[0] in self._rules and (self._rules[key[0]].scope, key[1]) in subjects
+            ]
+        if not keys:
+            return
+        stored = self._stored_firing(keys)
+        with self._lock:
+            for key, firing in stored.items():
+                state = self._state.get(key)
+                if state is not None:
+                    state[1] = firing
+
+    def _transaction(self, fn, *args):
+        from app.db import get_connection
+
+        if self._conn is None or self._conn.closed:
+            with self._lock:
+                # Session advisory locks went with the old connection
+                self._unowned |= self._owned
+                self._owned = set()
+            self._conn = get_connection()
+        try:
+            cursor = self._conn.cursor()
+            result = fn(cursor, *args)
+            self._conn.commit()
+            cursor.close()
+            return result
+        except Exception:
+            if not self._conn.closed:
+                self._conn.rollback()
+            raise
+
+    def _claim(self, subjects):
+        """
+        Try each subject's advisory lock; returns the subjects now owned.
+        """
+        from app.db import execute
+
+        def lock(cursor):
+            execute(cursor, "alert_owner_claim", """
+                SELECT k.scope, k.subject_id
+                FROM unnest(%s::int[], %s::int[]) AS k (scope, subject_id)
+                WHERE pg_try_advisory_lock(%s + k.scope, k.subject_id)
+            """, ([SCOPES.index(scope) for scope, _ in subjects],
+                  [subject_id for _, subject_id in subjects], ADVISORY_LOCK_CLASS))
+            return [(SCOPES[scope], subject_id) for scope, subject_id in cursor.fetchall()]
+
+        return self._transaction(lock)
+
+    def _stored_firing(self, keys):
+        from app.db import execute
+
+        def load(cursor):
+            execute(cursor, "alert_state_load", """
+                SELECT rule_id, subject_id, firing
+                FROM alert_state
+                WHERE (rule_id, subject_id) IN (SELECT * FROM unnest(%s::int[], %s::int[]))
+            """, ([k[0] for k in keys], [k[1] for k in keys]))
+            return {(rule_id, subject_id): firing for rule_id, subject_id, firing in cursor.fetchall()}
+
+        return self._transaction(load)
+
+    def _store(self, event):
+        """
+        Flip the stored firing flag and record the alert with it. Returns
+        False when the flag already matches, i.e. the transition was
+        recorded before (by a previous owner).
+        """
+        from app.db import execute
+
+        def record(cursor):
+            firing = event["state"] == "firing"
+            execute(cursor, "alert_state_flip", """
+                INSERT INTO alert_state (rule_id, subject_id, firing)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (rule_id, subject_id) DO UPDATE SET firing = EXCLUDED.firing
+                WHERE alert_state.firing <> EXCLUDED.firing
+                RETURNING 1
+            """, (event["rule_id"], event["subject_id"], firing))
+            if cursor.fetchone() is None:
+                return False
+
+            if firing:
+                execute(cursor, "alert_insert", """
+                    INSERT INTO alerts (rule_id, subject_id, sensor_id, value)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id
+                """, (event["rule_id"], event["subject_id"], event["sensor_id"], event["value"]))
+                event["alert_id"] = cursor.fetchone()[0]
+            else:
+                execute(cursor, "alert_resolve", """
+                    UPDATE alerts
+                    SET resolved_at = CURRENT_TIMESTAMP
+                    WHERE rule_id = %s AND subject_id = %s AND resolved_at IS NULL
+                """, (event["rule_id"], event["subject_id"]))
+            return True
+
+        return self._transaction(record)
+
+    def _event(self, rule, state, subject_id, sensor_id, value):
+        return {
+            "rule_id": rule.id,
+            "rule": rule.name,
+            "state": state,
+            "scope": rule.scope,
+            "subject_id": subject_id,
+            "sensor_id": sensor_id,
+            "metric": rule.metric,
+            "window": rule.window,
+            "value": round(float(value), 2),
+            "threshold": rule.threshold,
+            "at": time.time()
+        }
+
+    def _deliver(self, event):
+        try:
+            self.sink.send(event)
+        except Exception:
+            logger.exception("Alert sink failed for %s", event)
+
+
+engine = AlertEngine()
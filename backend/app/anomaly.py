@@ -0,0 +1,93 @@
+import os
+import threading
+import numpy as np
+
+# ==============================
+# Config
+# ==============================
+POLLUTANTS = ("PM2_5", "PM10", "NO2", "CO", "SO2", "O3", "NH3")
+
+EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.05"))
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0"))
+# Readings a sensor must contribute before it can be flagged
+WARMUP_READINGS = int(os.getenv("ANOMALY_WARMUP_READINGS", "20"))
+# Std floor as a fraction of the mean so near-constant series don't flag noise
+MIN_STD_FRACTION = float(os.getenv("ANOMALY_MIN_STD_FRACTION", "0.05"))
+MIN_STD_ABSOLUTE = 0.1
+
+
+class AnomalyDetector:
+    """
+    Per-sensor exponentially weighted mean and variance for each pollutant,
+    held in fixed-width arrays (one row per sensor). Scoring a reading is an
+    O(1) update of one row; history is never re-read.
+    """
+
+    def __init__(self, capacity=256):
+        width = len(POLLUTANTS)
+        self.mean = np.zeros((capacity, width))
+        self.var = np.zeros((capacity, width))
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, sensor_id):
+        slot = self.slots.get(sensor_id)
+        if slot is not None:
+            return slot
+
+        slot = len(self.slots)
+        if slot == len(self.count):
+            grow = len(self.count)
+            self.mean = np.vstack([self.mean, np.zeros_like(self.mean[:grow])])
+            self.var = np.vstack([self.var, np.zeros_like(self.var[:grow])])
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+        self.slots[sensor_id] = slot
+        return slot
+
+    def score(self, sensor_id, values):
+        """
+        Score a reading against the sensor's running statistics, then fold it
+        in. Returns (is_anomaly, max_abs_z, flagged_pollutant_names).
+        """
+        x = np.asarray(values, dtype=np.float64)
+
+        with self._lock:
+            slot = self._slot(sensor_id)
+            n = self.count[slot]
+            mean = self.mean[slot]
+            var = self.var[slot]
+
+            if n == 0:
+                mean[:] = x
+                var[:] = 0.0
+                self.count[slot] = 1
+                return False, 0.0, []
+
+            diff = x - mean
+            std = np.maximum(np.sqrt(var), np.maximum(np.abs(mean) * MIN_STD_FRACTION, MIN_STD_ABSOLUTE))
+            z = np.abs(diff) / std
+
+            # West's incremental EWMA update of mean and variance
+            incr = EWMA_ALPHA * diff
+            mean += incr
+            var[:] = (1 - EWMA_ALPHA) * (var + diff * incr)
+            self.count[slot] = n + 1
+
+        max_z = float(z.max())
+        if n < WARMUP_READINGS or max_z <= Z_THRESHOLD:
+            return False, max_z, []
+
+        flagged = [POLLUTANTS[i] for i in np.flatnonzero(z > Z_THRESHOLD)]
+        return True, max_z, flagged
+
+    def observe(self, sensor_id, values):
+        """
+        Fold in a reading another worker took (from its "reading" event), so
+        every worker's statistics and warm-up follow the sensor's whole
+        stream and not just the share the load balancer sent it.
+        """
+        self.score(sensor_id, values)
+
+
+detector = AnomalyDetector()
@@ -1,4 +1,9 @@
 import bcrypt
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 import os
@@ -10,6 +15,20 @@ SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret_key_change_this")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("ACCESS_TOKEN_EXPIRE_HOURS", "8"))
 
+# Verified tokens kept (by sha256) until they expire or are revoked
+TOKEN_CACHE_MAX = int(os.getenv("AUTH_TOKEN_CACHE_MAX", "10000"))
+
+# bcrypt runs on its own small pool so logins can't take every CPU; calls
+# beyond HASH_MAX_PENDING (running + queued) are refused outright
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "8"))
+
+# Per-username throttling of failed logins
+MAX_FAILURES = int(os.getenv("AUTH_MAX_FAILURES", "5"))
+FAILURE_WINDOW = float(os.getenv("AUTH_FAILURE_WINDOW", "300"))
+LOCKOUT_SECONDS = float(os.getenv("AUTH_LOCKOUT_SECONDS", "300"))
+MAX_TRACKED_USERNAMES = 10000
+
 
 # Password hashing
 def hash_password(password: str):
@@ -20,6 +39,62 @@ def verify_password(password: str, hashed: str):
     return bcrypt.checkpw(password.encode(), hashed.encode())
 
 
+class HashBusy(Exception):
+    pass
+
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+def run_hash(fn, *args):
+    """
+    Submit hash_password / verify_password to the bcrypt pool and return
+    the Future. Raises HashBusy when HASH_MAX_PENDING calls are in flight.
+    """
+    if not _hash_slots.acquire(blocking=False):
+        raise HashBusy()
+    future = _hash_executor.submit(fn, *args)
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return future
+
+
+# Login throttling
+_failures = OrderedDict()  # username -> [failures, window_start, locked_until]
+_failures_lock = threading.Lock()
+
+
+def login_retry_after(username):
+    """
+    Seconds the username is still locked out for, or 0.
+    """
+    with _failures_lock:
+        entry = _failures.get(username)
+        if entry is None:
+            return 0
+        return max(0, int(entry[2] - time.time() + 0.999))
+
+
+def record_login_failure(username):
+    now = time.time()
+    with _failures_lock:
+        entry = _failures.get(username)
+        if entry is None or now - entry[1] > FAILURE_WINDOW:
+            entry = [0, now, 0.0]
+            _failures[username] = entry
+        _failures.move_to_end(username)
+        entry[0] += 1
+        if entry[0] >= MAX_FAILURES:
+            entry[2] = now + LOCKOUT_SECONDS
+        while len(_failures) > MAX_TRACKED_USERNAMES:
+            _failures.popitem(last=False)
+
+
+def record_login_success(username):
+    with _failures_lock:
+        _failures.pop(username, None)
+
+
 # JWT
 def create_token(admin_id: int):
     payload = {
@@ -29,9 +104,72 @@ def create_token(admin_id: int):
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def verify_token(token: str):
+def token_hash(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+_token_cache = OrderedDict()  # token hash -> (admin_id, exp)
+_revoked = {}                 # token hash -> exp
+_token_lock = threading.Lock()
+
+
+def decode_token(token: str):
+    """
+    (admin_id, exp) of a valid token, else None. No caching.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload["admin_id"]
-    except JWTError:
-        return None
\ No newline at end of file
+        return payload["admin_id"], float(payload["exp"])
+    except (JWTError, KeyError):
+        return None
+
+
+def verify_token(token: str):
+    key = token_hash(token)
+    now = time.time()
+
+    with _token_lock:
+        if key in _revoked:
+            return None
+        cached = _token_cache.get(key)
+        if cached is not None:
+            if cached[1] > now:
+                _token_cache.move_to_end(key)
+                return cached[0]
+            del _token_cache[key]
+
+    decoded = decode_token(token)
+    if decoded is None:
+        return None
+
+    with _token_lock:
+        if key in _revoked:
+            return None
+        _token_cache[key] = decoded
+        while len(_token_cache) > TOKEN_CACHE_MAX:
+            _token_cache.popitem(last=False)
+    return decoded[0]
+
+
+def revoke(key, exp):
+    """
+    Reject the token with this hash until it would have expired anyway.
+    """
+    now = time.time()
+    with _token_lock:
+        _token_cache.pop(key, None)
+        _revoked[key] = exp
+        for stale in [k for k, e in _revoked.items() if e <= now]:
+            del _revoked[stale]
+
+
+def load_revocations(rows):
+    """
+    Replace the revocation set with (token_hash, exp) rows from storage.
+    """
+    now = time.time()
+    with _token_lock:
+        _revoked.clear()
+        _revoked.update({key: exp for key, exp in rows if exp > now})
+        for key in _revoked:
+            _token_cache.pop(key, None)
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Response
+from app.db import SHARDS
+from app.serialization import JSONBytesResponse
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "10"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+
+
+# ==============================
+# Data Versions
+# ==============================
+# Versions every worker and replica agrees on, so an ETag handed out by one
+# is honoured by all of them and survives restarts:
+#   "sensors"  - the cache_versions row bumped by each sensors event
+#   "readings" - per shard, the highest sensor_readings.id written there,
+#                learned from reading events and the database
+_versions = {"sensors": 0, "readings": [0] * len(SHARDS)}
+_versions_lock = threading.Lock()
+
+
+def set_version(name, value):
+    """
+    Move a shared version forward; an older value (a late event) is ignored.
+    """
+    with _versions_lock:
+        if value > _versions[name]:
+            _versions[name] = value
+
+
+def advance(name, value, shard=0):
+    """
+    Move one shard's watermark of `name` forward to `value`.
+    """
+    with _versions_lock:
+        marks = _versions[name]
+        if value > marks[shard]:
+            marks[shard] = value
+
+
+def version(name, shard=0):
+    with _versions_lock:
+        value = _versions[name]
+        return value[shard] if isinstance(value, list) else value
+
+
+def _part(value):
+    return ".".join(str(v) for v in value) if isinstance(value, list) else str(value)
+
+
+def etag_for(names, bucket=None):
+    """
+    Weak ETag from the shared data versions a response depends on, and
+    nothing else: it only changes when the data does. Scripts writing behind
+    the API's back announce it with events.publish_external_write().
+    Responses computed over a sliding window also pass the window's current
+    time bucket (aggregates.window_bucket).
+    """
+    with _versions_lock:
+        parts = [_part(_versions[n]) for n in names]
+    if bucket is not None:
+        parts.append(f"t{bucket}")
+    return f'W/"{"-".join(parts)}"'
+
+
+# ==============================
+# Shared Response Cache
+# ==============================
+class TTLCache:
+    """
+    Bounded LRU of encoded bodies shared by all requests. Concurrent misses
+    on one key wait for a single build instead of each running the query.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                value = self._get(key)
+            if value is None:
+                value = build()
+                with self._lock:
+                    self._data[key] = (time.monotonic() + self.ttl, value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.max_entries:
+                        self._data.popitem(last=False)
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+response_cache = TTLCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # Weak comparison: W/"x" and "x" name the same representation
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
+
+
+def cached_json(request, names, build, bucket=None):
+    """
+    Serve a read endpoint through its data versions (and time bucket, see
+    etag_for): 304 when the client already holds the current ETag,
+    otherwise the shared cached body, and only on a miss run `build` (which
+    returns encoded JSON bytes).
+    """
+    etag = etag_for(names, bucket)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (request.url.path, request.url.query, etag)
+    body = response_cache.get_or_build(key, build)
+    return JSONBytesResponse(body, headers=headers)
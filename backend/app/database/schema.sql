@@ -19,22 +19,26 @@ CREATE TABLE sensor_readings (
     sensor_id INTEGER REFERENCES sensors(id),
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
-    pm25 FLOAT,
-    pm10 FLOAT,
-    no2 FLOAT,
-    co FLOAT,
-    so2 FLOAT,
-    o3 FLOAT,
-    nh3 FLOAT,
+    pm25 REAL,
+    pm10 REAL,
+    no2 REAL,
+    co REAL,
+    so2 REAL,
+    o3 REAL,
+    nh3 REAL,
 
-    predicted_aqi FLOAT,
-    category VARCHAR(50)
+    predicted_aqi REAL,
+    -- Index into app.readings.CATEGORIES
+    category_code SMALLINT
 );
 
 -- Index for fast queries
 CREATE INDEX idx_readings_sensor_time
 ON sensor_readings(sensor_id, timestamp DESC);
 
+CREATE INDEX idx_readings_time_brin
+ON sensor_readings USING BRIN (timestamp);
+
 
 
 --Insert Regions
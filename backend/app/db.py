@@ -1,10 +1,30 @@
 import psycopg2
+import psycopg2.extras
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from app.metrics import (
+    DB_CONNECT_LATENCY, DB_QUERY_LATENCY, DB_QUERY_ERRORS, DB_READ_ROUTES, DB_REPLICA_EJECTIONS
+)
+from app import query_trace
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Return NUMERIC/DECIMAL columns as float instead of Decimal so rows can go
+# straight to the JSON encoder without a per-value conversion pass
+DEC2FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "DEC2FLOAT",
+    lambda value, cursor: float(value) if value is not None else None
+)
+psycopg2.extensions.register_type(DEC2FLOAT)
+
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "localhost"),
     "database": os.getenv("DB_NAME", "air_quality_db"),
@@ -15,5 +35,271 @@ DB_CONFIG = {
 
 
 def get_connection():
+    start = time.perf_counter()
     conn = psycopg2.connect(**DB_CONFIG)
-    return conn
\ No newline at end of file
+    DB_CONNECT_LATENCY.observe(time.perf_counter() - start)
+    return conn
+
+
+# ==============================
+# Read Replicas
+# ==============================
+# Comma-separated libpq DSNs, e.g. "host=replica1 dbname=air_quality_db user=postgres"
+READ_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("READ_REPLICA_DSNS", "").split(",") if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# How long a replica that failed to connect stays out of rotation
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+# Lag is probed at most this often per replica, not on every connection
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+
+# Zero when the replica has replayed everything it received, so an idle
+# primary does not read as lag; zero as well on a node not in recovery.
+# "Everything it received" only means caught up while the WAL receiver is
+# streaming: a disconnected replica reads as infinitely behind. Logins
+# without pg_read_all_stats see only the receiver's pid, so a running
+# receiver with a hidden status counts as streaming.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE pid IS NOT NULL AND COALESCE(status, 'streaming') = 'streaming'
+        ) THEN 'Infinity'::float8
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.ejected_until = 0.0
+        self.lag = 0.0
+        self.lag_checked_at = 0.0
+
+
+class ReplicaSet:
+    """
+    Round-robin over the configured replicas. A replica that fails to
+    connect is ejected for REPLICA_EJECT_SECONDS; one whose replication lag
+    exceeds REPLICA_MAX_LAG_SECONDS is skipped until its next lag probe.
+    When no replica qualifies the caller falls back to the primary.
+    """
+
+    def __init__(self, dsns):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _rotation(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+    def _eject(self, replica, reason):
+        replica.ejected_until = time.monotonic() + REPLICA_EJECT_SECONDS
+        DB_REPLICA_EJECTIONS.inc()
+        logger.warning("Ejecting read replica for %.0fs: %s", REPLICA_EJECT_SECONDS, reason)
+
+    def connect(self):
+        now = time.monotonic()
+        for replica in self._rotation():
+            if replica.ejected_until > now:
+                continue
+            if replica.lag > REPLICA_MAX_LAG_SECONDS and now - replica.lag_checked_at < REPLICA_LAG_CHECK_INTERVAL:
+                continue
+
+            start = time.perf_counter()
+            try:
+                conn = psycopg2.connect(replica.dsn, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+            except psycopg2.OperationalError as e:
+                self._eject(replica, e)
+                continue
+            DB_CONNECT_LATENCY.observe(time.perf_counter() - start)
+
+            if now - replica.lag_checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+                try:
+                    cursor = conn.cursor()
+                    execute(cursor, "replica_lag", LAG_QUERY)
+                    replica.lag = float(cursor.fetchone()[0])
+                    replica.lag_checked_at = now
+                    cursor.close()
+                    conn.rollback()
+                except psycopg2.Error as e:
+                    conn.close()
+                    self._eject(replica, e)
+                    continue
+
+            if replica.lag > REPLICA_MAX_LAG_SECONDS:
+                conn.close()
+                continue
+            return conn
+        return None
+
+
+replicas = ReplicaSet(READ_REPLICA_DSNS)
+
+
+def get_read_connection():
+    """
+    Read-only connection for queries that tolerate REPLICA_MAX_LAG_SECONDS
+    of staleness: a healthy replica when one is configured, else the primary.
+    """
+    conn = replicas.connect() if replicas.replicas else None
+    if conn is None:
+        conn = get_connection()
+        DB_READ_ROUTES.labels("primary").inc()
+    else:
+        DB_READ_ROUTES.labels("replica").inc()
+    conn.set_session(readonly=True)
+    return conn
+
+
+def with_cursor(fn, *args, readonly=False):
+    """
+    Run fn(cursor, *args) on a fresh connection and always close it.
+    readonly=True routes the call through get_read_connection().
+    """
+    return with_shard_cursor(0, fn, *args, readonly=readonly)
+
+
+# ==============================
+# Region Shards
+# ==============================
+# Shard 0 is the primary above. It holds the regions it is assigned plus
+# everything that isn't per-region data (admins, alert rules, jobs,
+# sketches, the event bus). SHARD_DSNS adds shards 1..n and SHARD_MAP
+# assigns regions to them; unmapped regions stay on shard 0. e.g.
+#   SHARD_DSNS="host=pg-east dbname=air_quality_db user=postgres"
+#   SHARD_MAP="3:1,8:1,9:1"
+# Every shard carries its own regions, sensors and sensor_readings tables.
+SHARD_DSNS = [dsn.strip() for dsn in os.getenv("SHARD_DSNS", "").split(",") if dsn.strip()]
+SHARD_MAP = {
+    int(region): int(shard)
+    for region, shard in (
+        pair.split(":") for pair in os.getenv("SHARD_MAP", "").split(",") if pair.strip()
+    )
+}
+SHARDS = list(range(1 + len(SHARD_DSNS)))
+SHARDED = len(SHARDS) > 1
+
+# Sensor and reading ids step by SHARD_ID_STRIDE with offset = shard number
+# (set up by init_db.py), so ids stay unique across shards
+SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", "64"))
+SCATTER_WORKERS = int(os.getenv("SHARD_SCATTER_WORKERS", "32"))
+
+for _region, _shard in SHARD_MAP.items():
+    if _shard not in SHARDS:
+        raise ValueError(f"SHARD_MAP sends region {_region} to shard {_shard}, only {len(SHARDS)} configured")
+
+_scatter_pool = ThreadPoolExecutor(max_workers=SCATTER_WORKERS, thread_name_prefix="shard") if SHARDED else None
+
+
+def shard_for_region(region_id):
+    return SHARD_MAP.get(region_id, 0)
+
+
+class ShardConnection(psycopg2.extensions.connection):
+    """
+    Connection to a region shard that knows which one, so query_trace can
+    re-run a slow query's EXPLAIN where it ran. Plain connections are shard 0.
+    """
+    shard = 0
+
+
+def shard_of(conn):
+    return getattr(conn, "shard", 0)
+
+
+def get_shard_connection(shard, readonly=False):
+    """
+    Connection to one shard. Shard 0 goes through the primary (and its
+    read replicas when readonly); the others are connected directly.
+    """
+    if shard == 0:
+        return get_read_connection() if readonly else get_connection()
+
+    start = time.perf_counter()
+    conn = psycopg2.connect(SHARD_DSNS[shard - 1], connection_factory=ShardConnection)
+    conn.shard = shard
+    DB_CONNECT_LATENCY.observe(time.perf_counter() - start)
+    if readonly:
+        conn.set_session(readonly=True)
+    return conn
+
+
+def with_shard_cursor(shard, fn, *args, readonly=False, commit=False):
+    """
+    with_cursor() on one shard; commit=True commits fn's writes.
+    """
+    conn = get_shard_connection(shard, readonly)
+    cursor = conn.cursor()
+    try:
+        result = fn(cursor, *args)
+        if commit:
+            conn.commit()
+        return result
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def scatter(fn, *args, readonly=False, shards=None, commit=False):
+    """
+    Run fn(cursor, *args) on every shard (or the given ones) in parallel
+    and return the results in shard order. With one shard it runs inline.
+    fn must not scatter itself: it runs on the shared pool. commit=True
+    commits each shard on its own; there are no cross-shard transactions.
+    """
+    shards = SHARDS if shards is None else shards
+    if len(shards) == 1:
+        return [with_shard_cursor(shards[0], fn, *args, readonly=readonly, commit=commit)]
+
+    futures = [
+        _scatter_pool.submit(with_shard_cursor, shard, fn, *args, readonly=readonly, commit=commit)
+        for shard in shards
+    ]
+    return [future.result() for future in futures]
+
+
+def gather_rows(fn, *args, readonly=False, shards=None):
+    """
+    scatter() for fn returning a list of rows, concatenated.
+    """
+    return [row for part in scatter(fn, *args, readonly=readonly, shards=shards) for row in part]
+
+
+def execute(cursor, name, query, params=None):
+    """
+    cursor.execute() with its latency recorded under a logical query name.
+    Slow queries are handed to query_trace when tracing is enabled.
+    """
+    start = time.perf_counter()
+    try:
+        cursor.execute(query, params)
+    except Exception:
+        DB_QUERY_ERRORS.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_QUERY_LATENCY.labels(name).observe(elapsed)
+        if query_trace.ENABLED:
+            query_trace.record(name, query, params, elapsed, shard_of(cursor.connection))
+
+
+def execute_values(cursor, name, query, rows, page_size=1000, fetch=False, template=None):
+    """
+    Multi-row VALUES insert/update (psycopg2.extras.execute_values) timed
+    under one logical query name.
+    """
+    start = time.perf_counter()
+    try:
+        return psycopg2.extras.execute_values(cursor, query, rows, template=template, page_size=page_size, fetch=fetch)
+    except Exception:
+        DB_QUERY_ERRORS.labels(name).inc()
+        raise
+    finally:
+        DB_QUERY_LATENCY.labels(name).observe(time.perf_counter() - start)
\ No newline at end of file
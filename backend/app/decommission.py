@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from app.db import get_connection, get_shard_connection, execute
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Config
+# ==============================
+BATCH_ROWS = int(os.getenv("DECOMMISSION_BATCH_ROWS", "5000"))
+# Pause between batches so the delete never hogs I/O, WAL or locks
+BATCH_PAUSE = float(os.getenv("DECOMMISSION_BATCH_PAUSE", "0.2"))
+# Fallback poll for jobs queued by other workers or left by a restart
+POLL_INTERVAL = float(os.getenv("DECOMMISSION_POLL_INTERVAL", "30"))
+
+# First key of the two-int advisory lock; the job id is the second
+ADVISORY_LOCK_CLASS = 4044
+
+_wakeup = threading.Event()
+
+
+def wake():
+    _wakeup.set()
+
+
+def _pending_jobs(cursor):
+    execute(cursor, "decommission_pending", """
+        SELECT id, sensor_id, shard
+        FROM decommission_jobs
+        WHERE status IN ('pending', 'running')
+        ORDER BY id
+    """)
+    return cursor.fetchall()
+
+
+def _job_status(cursor, job_id):
+    execute(cursor, "decommission_job_status", "SELECT status FROM decommission_jobs WHERE id = %s", (job_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _set_status(cursor, job_id, status, error=None):
+    execute(cursor, "decommission_status", """
+        UPDATE decommission_jobs
+        SET status = %s,
+            error = %s,
+            updated_at = CURRENT_TIMESTAMP,
+            finished_at = CASE WHEN %s IN ('done', 'failed') THEN CURRENT_TIMESTAMP END
+        WHERE id = %s
+    """, (status, error, status, job_id))
+
+
+def _delete_data(conn, cursor, data, job_id, sensor_id):
+    data_cursor = cursor if data is conn else data.cursor()
+    while True:
+        execute(data_cursor, "decommission_batch", """
+            DELETE FROM sensor_readings
+            WHERE id IN (
+                SELECT id FROM sensor_readings
+                WHERE sensor_id = %s
+                LIMIT %s
+            )
+        """, (sensor_id, BATCH_ROWS))
+        deleted = data_cursor.rowcount
+        if data is not conn:
+            data.commit()
+
+        execute(cursor, "decommission_progress", """
+            UPDATE decommission_jobs
+            SET rows_deleted = rows_deleted + %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (deleted, job_id))
+        conn.commit()
+
+        if deleted < BATCH_ROWS:
+            break
+        time.sleep(BATCH_PAUSE)
+
+    execute(data_cursor, "decommission_sensor", "DELETE FROM sensors WHERE id = %s", (sensor_id,))
+    data.commit()
+
+
+def run_job(conn, job_id, sensor_id, shard=0):
+    """
+    Delete the sensor's readings BATCH_ROWS at a time, each batch its own
+    short transaction with progress recorded alongside, then the sensor row.
+    Progress is durable, so a restart simply continues where it stopped.
+    Jobs live on the primary; the data on the sensor's region shard.
+    """
+    cursor = conn.cursor()
+    _set_status(cursor, job_id, "running")
+    conn.commit()
+
+    data = conn if shard == 0 else get_shard_connection(shard)
+    try:
+        _delete_data(conn, cursor, data, job_id, sensor_id)
+    finally:
+        if data is not conn:
+            data.close()
+
+    # Only the sensor's own alerts go: region-scope alerts it contributed to
+    # stay with their region
+    execute(cursor, "decommission_alerts", """
+        DELETE FROM alerts a
+        USING alert_rules r
+        WHERE a.rule_id = r.id AND r.scope = 'sensor' AND a.subject_id = %s
+    """, (sensor_id,))
+    execute(cursor, "decommission_alert_state", """
+        DELETE FROM alert_state s
+        USING alert_rules r
+        WHERE s.rule_id = r.id AND r.scope = 'sensor' AND s.subject_id = %s
+    """, (sensor_id,))
+    execute(cursor, "decommission_sketches", "DELETE FROM aqi_sketches WHERE scope = 'sensor' AND target_id = %s",
+            (sensor_id,))
+    _set_status(cursor, job_id, "done")
+    conn.commit()
+    cursor.close()
+    logger.info("Decommissioned sensor %s (job %s)", sensor_id, job_id)
+
+
+def process_pending():
+    """
+    Run every unfinished job this worker can lock. The advisory lock keeps
+    two workers (or two replicas of the API) off the same job; the status is
+    read again under it, since another worker may have finished the job
+    between the listing and the lock.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        jobs = _pending_jobs(cursor)
+        conn.commit()
+
+        for job_id, sensor_id, shard in jobs:
+            execute(cursor, "decommission_lock", "SELECT pg_try_advisory_lock(%s, %s)",
+                    (ADVISORY_LOCK_CLASS, job_id))
+            locked = cursor.fetchone()[0]
+            conn.commit()
+            if not locked:
+                continue
+
+            try:
+                status = _job_status(cursor, job_id)
+                conn.commit()
+                if status not in ("pending", "running"):
+                    continue
+                run_job(conn, job_id, sensor_id, shard)
+            except Exception as e:
+                conn.rollback()
+                logger.exception("Decommission job %s failed", job_id)
+                _set_status(cursor, job_id, "failed", str(e)[:500])
+                conn.commit()
+            finally:
+                execute(cursor, "decommission_unlock", "SELECT pg_advisory_unlock(%s, %s)",
+                        (ADVISORY_LOCK_CLASS, job_id))
+                conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def worker():
+    """
+    Background loop: picks up unfinished jobs at startup (resume after a
+    restart), then whenever a delete request wakes it or POLL_INTERVAL
+    passes.
+    """
+    while True:
+        try:
+            process_pending()
+        except Exception:
+            logger.exception("Decommission worker pass failed")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
@@ -0,0 +1,193 @@
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+import orjson
+from app.db import get_connection, get_shard_connection, execute
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Config
+# ==============================
+ENABLED = os.getenv("EVENT_BUS_ENABLED", "true").lower() in ("1", "true", "yes")
+CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "aqi_events")
+# How long the listener waits on its socket before a liveness probe
+POLL_TIMEOUT = float(os.getenv("EVENT_BUS_POLL_TIMEOUT", "30"))
+MAX_RECONNECT_DELAY = 30.0
+
+# Identifies this worker so it can skip the echo of its own events
+ORIGIN = uuid.uuid4().hex[:12]
+
+# Published by scripts that write sensors or readings behind the API's back
+# (seeders, psql fixes); every worker then drops its data versions
+EXTERNAL_WRITE = "external_write"
+
+_handlers = {}
+_versioned = set()
+_seen = {}
+_seen_lock = threading.Lock()
+_connect_hooks = []
+
+
+def subscribe(kind, handler, versioned=False):
+    """
+    Apply `kind` events published by other workers with handler(event).
+    Versioned kinds also bump a row in cache_versions, so an event lost
+    while disconnected is replayed (as {"k": kind, "v": version}) by the
+    version check after reconnecting.
+    """
+    _handlers[kind] = handler
+    if versioned:
+        _versioned.add(kind)
+
+
+def on_connect(hook):
+    """
+    hook(initial) runs each time a listener connects, for state that is
+    recovered some other way than cache_versions (e.g. the readings id
+    watermark). initial is True only for a listener's first connection.
+    """
+    _connect_hooks.append(hook)
+
+
+def is_versioned(kind):
+    return kind in _versioned
+
+
+def _mark_seen(kind, version):
+    with _seen_lock:
+        if version > _seen.get(kind, 0):
+            _seen[kind] = version
+            return True
+        return False
+
+
+def publish(cursor, kind, **fields):
+    """
+    Queue an event in the writer's transaction; Postgres delivers it to
+    every listener on commit and drops it on rollback. Keep fields small,
+    NOTIFY payloads are capped at 8000 bytes. Every worker listens on
+    every shard, so unversioned kinds can go out on whichever shard took
+    the write; versioned kinds need shard 0's cache_versions.
+    """
+    if not ENABLED:
+        return None
+
+    event = {"o": ORIGIN, "k": kind, **fields}
+    if kind in _versioned:
+        execute(cursor, "cache_version_bump", """
+            INSERT INTO cache_versions (name, version)
+            VALUES (%s, 1)
+            ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1
+            RETURNING version
+        """, (kind,))
+        event["v"] = cursor.fetchone()[0]
+
+    execute(cursor, "event_notify", "SELECT pg_notify(%s, %s)", (CHANNEL, orjson.dumps(event).decode()))
+    return event
+
+
+def publish_external_write(cursor):
+    """
+    For scripts: announce, in the script's transaction, that sensors or
+    readings changed outside the API. A sensors event goes with it, which
+    moves the shared "sensors" data version. Both are versioned, so a
+    worker that is disconnected at the time still catches them on reconnect.
+    """
+    _versioned.update((EXTERNAL_WRITE, "sensors"))
+    publish(cursor, "sensors")
+    return publish(cursor, EXTERNAL_WRITE)
+
+
+def publish_now(kind, **fields):
+    """
+    publish() in a transaction of its own on shard 0, for versioned kinds
+    written on another shard (sensor writes, not readings) or on several.
+    """
+    if not ENABLED:
+        return None
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        event = publish(cursor, kind, **fields)
+        conn.commit()
+        cursor.close()
+        return event
+    finally:
+        conn.close()
+
+
+def _dispatch(payload):
+    try:
+        event = orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        logger.warning("Ignoring malformed event %r", payload[:200])
+        return
+
+    kind = event.get("k")
+    if "v" in event:
+        _mark_seen(kind, event["v"])
+    if event.get("o") == ORIGIN:
+        return
+
+    handler = _handlers.get(kind)
+    if handler is None:
+        return
+    try:
+        handler(event)
+    except Exception:
+        logger.exception("Event handler for %s failed", kind)
+
+
+def _check_versions(cursor, apply):
+    execute(cursor, "cache_versions", "SELECT name, version FROM cache_versions")
+    for kind, version in cursor.fetchall():
+        if _mark_seen(kind, version) and apply and kind in _handlers:
+            logger.info("Recovering missed %s event (version %s)", kind, version)
+            _handlers[kind]({"k": kind, "v": version})
+
+
+
+def listen_forever(shard=0):
+    """
+    Listener loop for a background thread: one dedicated connection per
+    worker and shard. LISTEN is issued before the version check, so nothing
+    committed in between can slip through.
+    """
+    first = True
+    delay = 1.0
+
+    while True:
+        conn = None
+        try:
+            conn = get_connection() if shard == 0 else get_shard_connection(shard)
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CHANNEL}")
+
+            # Caches start cold, so the first check only records versions
+            if shard == 0:
+                _check_versions(cursor, apply=not first)
+            for hook in _connect_hooks:
+                hook(first)
+            first = False
+            delay = 1.0
+
+            while True:
+                if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                    cursor.execute("SELECT 1")  # surfaces a dead connection
+                else:
+                    conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0).payload)
+        except Exception:
+            logger.exception("Event listener lost its connection, retrying in %.0fs", delay)
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        finally:
+            if conn is not None:
+                conn.close()
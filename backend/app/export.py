@@ -0,0 +1,234 @@
+import csv
+import io
+import logging
+import os
+import threading
+from contextlib import aclosing
+import anyio
+from app.db import get_shard_connection, execute
+from app.readings import category_sql
+
+# Parquet output is optional; CSV needs nothing beyond the standard library
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Rows pulled from the server-side cursor per round trip; also the CSV chunk
+# and Parquet row-group size, so memory per export is bounded by this
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+
+COLUMNS = [
+    "reading_id", "sensor_id", "sensor_code", "region_id", "timestamp",
+    "pm25", "pm10", "no2", "co", "so2", "o3", "nh3",
+    "predicted_aqi", "category", "is_anomaly"
+]
+
+FORMATS = ("csv", "parquet")
+
+
+def parquet_available():
+    return pq is not None
+
+
+def build_query(sensor_id=None, region_id=None, start=None, end=None):
+    conditions = ["s.deleted_at IS NULL"]
+    params = []
+    if sensor_id is not None:
+        conditions.append("sr.sensor_id = %s")
+        params.append(sensor_id)
+    if region_id is not None:
+        conditions.append("s.region_id = %s")
+        params.append(region_id)
+    if start is not None:
+        conditions.append("sr.timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("sr.timestamp < %s")
+        params.append(end)
+
+    where = "WHERE " + " AND ".join(conditions)
+    query = f"""
+        SELECT sr.id, sr.sensor_id, s.sensor_code, s.region_id, sr.timestamp,
+               sr.pm25, sr.pm10, sr.no2, sr.co, sr.so2, sr.o3, sr.nh3,
+               sr.predicted_aqi, {category_sql("sr.category_code")}, sr.is_anomaly
+        FROM sensor_readings sr
+        JOIN sensors s ON s.id = sr.sensor_id
+        {where}
+        ORDER BY sr.id
+    """
+    return query, tuple(params)
+
+
+# ==============================
+# Encoders
+# ==============================
+class CSVEncoder:
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self):
+        self.writer.writerow(COLUMNS)
+        return self._drain()
+
+    def encode(self, rows):
+        self.writer.writerows(rows)
+        return self._drain()
+
+    def finish(self):
+        return b""
+
+    def _drain(self):
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands back whatever the Parquet writer has
+    produced since the last drain.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ParquetEncoder:
+    """
+    One row group per fetched batch, flushed to the client as it is written.
+    """
+
+    def __init__(self):
+        self.schema = pa.schema([
+            ("reading_id", pa.int64()), ("sensor_id", pa.int32()), ("sensor_code", pa.string()),
+            ("region_id", pa.int32()), ("timestamp", pa.timestamp("us")),
+            ("pm25", pa.float64()), ("pm10", pa.float64()), ("no2", pa.float64()),
+            ("co", pa.float64()), ("so2", pa.float64()), ("o3", pa.float64()),
+            ("nh3", pa.float64()), ("predicted_aqi", pa.float64()),
+            ("category", pa.string()), ("is_anomaly", pa.bool_())
+        ])
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="snappy")
+
+    def header(self):
+        return self.sink.drain()
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+        return self.sink.drain()
+
+    def finish(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+ENCODERS = {"csv": CSVEncoder, "parquet": ParquetEncoder}
+
+
+# ==============================
+# Streaming
+# ==============================
+async def _shard_batches(shard, query, params):
+    """
+    Row batches of the export query on one shard. Rows come from a named
+    (server-side) cursor in EXPORT_BATCH_ROWS batches fetched on a worker
+    thread, so only one batch is ever held in memory. If the client goes
+    away the stream is cancelled and the running query is cancelled on the
+    server before the connection is released. Connecting happens on the
+    worker thread too, so a slow shard never stalls the event loop.
+    """
+    lock = threading.Lock()
+    conn = None
+    finished = False
+    aborted = False
+
+    def open_cursor():
+        nonlocal conn
+        with lock:
+            conn = get_shard_connection(shard)
+            conn.set_session(readonly=True)
+            if aborted:
+                return None
+            cursor = conn.cursor(name="readings_export")
+            cursor.itersize = EXPORT_BATCH_ROWS
+            execute(cursor, "readings_export", query, params)
+            return cursor
+
+    def fetch(cursor):
+        with lock:
+            return cursor.fetchmany(EXPORT_BATCH_ROWS)
+
+    def release():
+        # Waits for any in-flight fetch (now cancelled) before closing
+        with lock:
+            if conn is not None:
+                conn.close()
+
+    try:
+        cursor = await anyio.to_thread.run_sync(open_cursor, abandon_on_cancel=True)
+        yield None
+
+        while True:
+            rows = await anyio.to_thread.run_sync(fetch, cursor, abandon_on_cancel=True)
+            if not rows:
+                break
+            yield rows
+
+        finished = True
+    finally:
+        if not finished:
+            logger.info("Readings export aborted, cancelling query")
+            aborted = True
+            if conn is not None:
+                conn.cancel()
+        threading.Thread(target=release, name="export-release", daemon=True).start()
+
+
+async def stream_readings(fmt, query, params, shards=(0,)):
+    """
+    Async byte stream of the export. Shards are read one after another,
+    each in id order; the header goes out once the first query is running.
+    """
+    encoder = ENCODERS[fmt]()
+    header = True
+
+    for shard in shards:
+        # aclosing: an aborted export cancels the shard query right away
+        async with aclosing(_shard_batches(shard, query, params)) as batches:
+            async for rows in batches:
+                if rows is None:
+                    if header:
+                        yield encoder.header()
+                        header = False
+                    continue
+                yield encoder.encode(rows)
+
+    yield encoder.finish()
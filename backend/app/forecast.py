@@ -0,0 +1,140 @@
+import os
+import threading
+import numpy as np
+from app.db import execute, gather_rows
+from app.metrics import timed_predict
+
+# ==============================
+# Config
+# ==============================
+MAX_HORIZON = int(os.getenv("FORECAST_MAX_HORIZON", "24"))
+
+# The forecast model reads lags 1, 2, 3 and 6 of the hourly AQI series
+FEATURE_LAGS = (1, 2, 3, 6)
+HISTORY = max(FEATURE_LAGS)
+
+
+def project(model, history, horizon):
+    """
+    Recursive multi-step forecast for many sensors at once: history is
+    (sensors, HISTORY) oldest first; each step predicts every sensor in one
+    call and shifts the prediction in as the newest lag. Returns
+    (sensors, horizon).
+    """
+    values = np.asarray(history, dtype=np.float64)
+    out = np.empty((len(values), horizon))
+    for step in range(horizon):
+        features = values[:, [-lag for lag in FEATURE_LAGS]]
+        out[:, step] = timed_predict("forecast", model, features)
+        values = np.column_stack([values[:, 1:], out[:, step]])
+    return out
+
+
+def _load_history(cursor, sensor_ids):
+    # Primaries, not replicas: the reading that invalidated a sensor must be
+    # visible. Runs on every shard; each returns the sensors it holds
+    execute(cursor, "forecast_lags_batch", """
+        SELECT s.id, h.aqi
+        FROM sensors s
+        CROSS JOIN LATERAL (
+            SELECT array_agg(predicted_aqi ORDER BY timestamp) AS aqi
+            FROM (
+                SELECT predicted_aqi, timestamp
+                FROM sensor_readings
+                WHERE sensor_id = s.id
+                ORDER BY timestamp DESC
+                LIMIT %s
+            ) recent
+        ) h
+        WHERE s.id = ANY(%s)
+          AND s.deleted_at IS NULL
+    """, (HISTORY, sensor_ids))
+    return cursor.fetchall()
+
+
+class ForecastService:
+    """
+    Full-horizon forecasts cached per sensor until that sensor's next
+    reading. A miss recomputes every invalidated sensor it knows of in one
+    vectorized pass, so the work tracks ingest, not dashboard polls.
+    """
+
+    def __init__(self):
+        self.model = None
+        self._forecasts = {}     # sensor_id -> array(MAX_HORIZON), None if too little data
+        self._generations = {}   # sensor_id -> bumped on every invalidation
+        self._stale = set()
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+
+    def set_model(self, model):
+        with self._lock:
+            self.model = model
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every cached forecast (new model, sensors changed).
+        """
+        with self._lock:
+            self._stale.update(self._forecasts)
+            self._forecasts.clear()
+            for sensor_id in self._generations:
+                self._generations[sensor_id] += 1
+
+    def invalidate(self, sensor_id):
+        with self._lock:
+            self._generations[sensor_id] = self._generations.get(sensor_id, 0) + 1
+            if sensor_id in self._forecasts:
+                # Watched sensors are recomputed together on the next miss
+                del self._forecasts[sensor_id]
+                self._stale.add(sensor_id)
+
+    def _compute(self, sensor_ids):
+        with self._lock:
+            model = self.model
+            generations = {s: self._generations.get(s, 0) for s in sensor_ids}
+
+        rows = gather_rows(_load_history, sorted(sensor_ids))
+        history = {sensor_id: aqi for sensor_id, aqi in rows if aqi and len(aqi) == HISTORY}
+        ready = sorted(history)
+        projected = project(model, [history[s] for s in ready], MAX_HORIZON) if ready else []
+
+        results = {sensor_id: None for sensor_id in sensor_ids}
+        results.update(zip(ready, projected))
+
+        with self._lock:
+            for sensor_id, forecast in results.items():
+                # A reading that landed mid-computation leaves the entry stale
+                if self._generations.get(sensor_id, 0) == generations[sensor_id]:
+                    self._forecasts[sensor_id] = forecast
+                    self._stale.discard(sensor_id)
+                else:
+                    self._stale.add(sensor_id)
+        return results
+
+    def get(self, sensor_id, horizon=1):
+        """
+        The first `horizon` hourly forecasts for a sensor, or None when it
+        has fewer than HISTORY readings (or doesn't exist).
+        """
+        with self._lock:
+            if sensor_id in self._forecasts:
+                return _first(self._forecasts[sensor_id], horizon)
+
+        # One computation at a time; requests queued behind it usually find
+        # their sensor already done
+        with self._compute_lock:
+            with self._lock:
+                if sensor_id in self._forecasts:
+                    return _first(self._forecasts[sensor_id], horizon)
+                batch = {sensor_id} | self._stale
+            forecast = self._compute(batch)[sensor_id]
+        return _first(forecast, horizon)
+
+
+def _first(forecast, horizon):
+    return None if forecast is None else forecast[:horizon]
+
+
+service = ForecastService()
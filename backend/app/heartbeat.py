@@ -0,0 +1,202 @@
+import logging
+import math
+import os
+import threading
+import time
+import numpy as np
+from app.db import gather_rows, execute
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Config
+# ==============================
+# Expected reporting interval until a sensor has shown its own cadence
+DEFAULT_INTERVAL = float(os.getenv("HEARTBEAT_DEFAULT_INTERVAL", "60"))
+MIN_INTERVAL = float(os.getenv("HEARTBEAT_MIN_INTERVAL", "10"))
+# A sensor is stale once silent for this many expected intervals
+STALE_FACTOR = float(os.getenv("HEARTBEAT_STALE_FACTOR", "3"))
+CHECK_INTERVAL = float(os.getenv("HEARTBEAT_CHECK_INTERVAL", "15"))
+# Flapping: this many stale -> healthy recoveries within roughly FLAP_WINDOW
+FLAP_THRESHOLD = float(os.getenv("HEARTBEAT_FLAP_THRESHOLD", "3"))
+FLAP_WINDOW = float(os.getenv("HEARTBEAT_FLAP_WINDOW", "3600"))
+INTERVAL_EWMA_ALPHA = 0.2
+
+
+class HeartbeatTable:
+    """
+    Last-seen time, learned reporting interval and stale/flap state for
+    every sensor, one array row per sensor. /predict touches one row; the
+    sweeper and the health report work on whole columns.
+
+    Flapping is an exponentially decayed count of recoveries, so it needs
+    no per-sensor history.
+    """
+
+    def __init__(self, capacity=256):
+        self.slots = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.full(capacity, np.nan)
+        self.interval = np.full(capacity, np.nan)
+        self.stale = np.zeros(capacity, dtype=bool)
+        self.stale_since = np.full(capacity, np.nan)
+        self.flap_score = np.zeros(capacity)
+        self.flap_at = np.zeros(capacity)
+        self.last_sweep = None
+        self._lock = threading.Lock()
+
+    def _slot(self, sensor_id):
+        slot = self.slots.get(sensor_id)
+        if slot is not None:
+            return slot
+
+        slot = len(self.slots)
+        if slot == len(self.ids):
+            grow = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.zeros(grow, dtype=np.int64)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(grow, np.nan)])
+            self.interval = np.concatenate([self.interval, np.full(grow, np.nan)])
+            self.stale = np.concatenate([self.stale, np.zeros(grow, dtype=bool)])
+            self.stale_since = np.concatenate([self.stale_since, np.full(grow, np.nan)])
+            self.flap_score = np.concatenate([self.flap_score, np.zeros(grow)])
+            self.flap_at = np.concatenate([self.flap_at, np.zeros(grow)])
+        self.ids[slot] = sensor_id
+        self.slots[sensor_id] = slot
+        return slot
+
+    def beat(self, sensor_id, now=None):
+        now = now or time.time()
+        with self._lock:
+            slot = self._slot(sensor_id)
+            previous = self.last_seen[slot]
+
+            if not np.isnan(previous) and now > previous:
+                gap = now - previous
+                # Gaps spent stale are outages, not cadence
+                if not self.stale[slot]:
+                    learned = self.interval[slot]
+                    self.interval[slot] = gap if np.isnan(learned) else (
+                        learned + INTERVAL_EWMA_ALPHA * (gap - learned)
+                    )
+            self.last_seen[slot] = max(now, previous) if not np.isnan(previous) else now
+
+            if self.stale[slot]:
+                self.stale[slot] = False
+                self.stale_since[slot] = np.nan
+                decay = math.exp(-(now - self.flap_at[slot]) / FLAP_WINDOW)
+                self.flap_score[slot] = self.flap_score[slot] * decay + 1.0
+                self.flap_at[slot] = now
+
+    def seed(self, rows):
+        """
+        Register sensors with their last reading time from the database,
+        keeping anything /predict has already recorded.
+        """
+        with self._lock:
+            for sensor_id, seen in rows:
+                slot = self._slot(sensor_id)
+                if seen is not None and (np.isnan(self.last_seen[slot]) or seen > self.last_seen[slot]):
+                    self.last_seen[slot] = seen
+
+    def expected_intervals(self, n):
+        learned = self.interval[:n]
+        return np.maximum(np.where(np.isnan(learned), DEFAULT_INTERVAL, learned), MIN_INTERVAL)
+
+    def sweep(self, now=None):
+        """
+        Mark every sensor silent for STALE_FACTOR expected intervals as stale.
+        Returns ids that went stale in this pass.
+        """
+        now = now or time.time()
+        with self._lock:
+            n = len(self.slots)
+            overdue = (now - self.last_seen[:n]) > STALE_FACTOR * self.expected_intervals(n)
+            newly = overdue & ~self.stale[:n]
+            self.stale[:n] |= overdue
+            self.stale_since[:n][newly] = now
+            self.last_sweep = now
+            return self.ids[:n][newly].tolist()
+
+    def report(self, active_ids=None, now=None):
+        """
+        Sensors split into stale, flapping and healthy. Sensors never heard
+        from are reported stale. Only ids in active_ids are included when
+        given, so decommissioned or disabled sensors drop out.
+        """
+        now = now or time.time()
+        with self._lock:
+            n = len(self.slots)
+            ids = self.ids[:n].copy()
+            last_seen = self.last_seen[:n].copy()
+            expected = self.expected_intervals(n)
+            stale = self.stale[:n] | np.isnan(last_seen)
+            stale_since = self.stale_since[:n].copy()
+            flaps = self.flap_score[:n] * np.exp(-(now - self.flap_at[:n]) / FLAP_WINDOW)
+
+        keep = np.isin(ids, list(active_ids)) if active_ids is not None else np.ones(n, dtype=bool)
+        flapping = keep & (flaps >= FLAP_THRESHOLD)
+        stale = keep & stale & ~flapping
+        healthy = keep & ~stale & ~flapping
+
+        def describe(rows):
+            return [
+                {
+                    "sensor_id": int(ids[i]),
+                    "last_seen": None if np.isnan(last_seen[i]) else float(last_seen[i]),
+                    "silent_seconds": None if np.isnan(last_seen[i]) else round(float(now - last_seen[i]), 1),
+                    "expected_interval": round(float(expected[i]), 1),
+                    "stale_since": None if np.isnan(stale_since[i]) else float(stale_since[i]),
+                    "recoveries": round(float(flaps[i]), 2)
+                }
+                for i in np.flatnonzero(rows)
+            ]
+
+        return {
+            "checked_at": self.last_sweep,
+            "counts": {
+                "healthy": int(healthy.sum()),
+                "stale": int(stale.sum()),
+                "flapping": int(flapping.sum())
+            },
+            "stale": describe(stale),
+            "flapping": describe(flapping),
+            "healthy": sorted(int(i) for i in ids[healthy])
+        }
+
+    def run(self):
+        """
+        Sweeper loop for a background thread.
+        """
+        while True:
+            newly = self.sweep()
+            if newly:
+                logger.warning("Sensors went stale: %s", newly)
+            time.sleep(CHECK_INTERVAL)
+
+
+def load_last_seen(cursor):
+    # One index probe per sensor via idx_readings_sensor_time
+    execute(cursor, "heartbeat_seed", """
+        SELECT s.id, EXTRACT(EPOCH FROM lr.timestamp AT TIME ZONE current_setting('TimeZone'))
+        FROM sensors s
+        LEFT JOIN LATERAL (
+            SELECT timestamp
+            FROM sensor_readings
+            WHERE sensor_id = s.id
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) lr ON TRUE
+        WHERE s.deleted_at IS NULL
+    """)
+    return [(sensor_id, float(seen) if seen is not None else None) for sensor_id, seen in cursor.fetchall()]
+
+
+heartbeats = HeartbeatTable()
+
+
+def monitor():
+    """
+    Seed last-seen times once from the database, then sweep forever.
+    """
+    heartbeats.seed(gather_rows(load_last_seen))
+    heartbeats.run()
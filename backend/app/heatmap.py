@@ -0,0 +1,228 @@
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from app.spatial import sensor_index, KM_PER_DEG_LAT
+
+# ==============================
+# Config
+# ==============================
+RASTER_SIZE = int(os.getenv("HEATMAP_RASTER_SIZE", "512"))
+MIN_INTERVAL = float(os.getenv("HEATMAP_MIN_INTERVAL", "60"))
+# Raster cells per side of a block evaluated in one NumPy pass
+BLOCK_SIZE = int(os.getenv("HEATMAP_BLOCK_SIZE", "64"))
+TILE_CACHE_SIZE = int(os.getenv("HEATMAP_TILE_CACHE_SIZE", "1024"))
+TILE_SIZE = 256
+
+# Category breakpoints (upper bounds) and colours, matching MapView.jsx
+BREAKPOINTS = np.array([50, 100, 200, 300, 400], dtype=np.float32)
+PALETTE = [
+    (0x22, 0xc5, 0x5e),  # Good
+    (0x84, 0xcc, 0x16),  # Satisfactory
+    (0xea, 0xb3, 0x08),  # Moderate
+    (0xf9, 0x73, 0x16),  # Poor
+    (0xef, 0x44, 0x44),  # Very Poor
+    (0x9f, 0x12, 0x39),  # Severe
+    (0x00, 0x00, 0x00),  # No coverage
+]
+ALPHA = [150, 150, 150, 150, 150, 150, 0]
+NO_DATA = len(PALETTE) - 1
+
+
+# ==============================
+# PNG Encoding
+# ==============================
+def _chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+
+def encode_png(indices):
+    """
+    8-bit palette PNG from a 2-D uint8 array of palette indices.
+    """
+    height, width = indices.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = indices  # filter byte 0 (None) per scanline
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+        + _chunk(b"PLTE", bytes(c for rgb in PALETTE for c in rgb))
+        + _chunk(b"tRNS", bytes(ALPHA))
+        + _chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + _chunk(b"IEND", b"")
+    )
+
+
+EMPTY_TILE = encode_png(np.full((TILE_SIZE, TILE_SIZE), NO_DATA, dtype=np.uint8))
+
+
+# ==============================
+# Raster
+# ==============================
+class Raster:
+    def __init__(self, version, bounds, values):
+        self.version = version
+        self.bounds = bounds  # (lat_min, lon_min, lat_max, lon_max)
+        self.values = values  # float32 [row (north->south), col (west->east)], NaN = no coverage
+        self.computed_at = time.time()
+
+
+def compute_raster(lat, lon, radius, aqi, size):
+    """
+    IDW-interpolated AQI over the bounding box of the given sensors. Each
+    cell takes inverse-square-distance weights from the sensors whose radius
+    covers it. The raster is evaluated in square blocks, each vectorized
+    against only the sensors whose coverage box overlaps that block, so cost
+    follows local sensor density rather than fleet size.
+    """
+    d_lat = radius / KM_PER_DEG_LAT
+    d_lon = d_lat / np.maximum(np.cos(np.radians(lat)), 0.01)
+    lat_min, lat_max = float((lat - d_lat).min()), float((lat + d_lat).max())
+    lon_min, lon_max = float((lon - d_lon).min()), float((lon + d_lon).max())
+
+    cell_lat = lat_max - (np.arange(size, dtype=np.float32) + 0.5) * (lat_max - lat_min) / size
+    cell_lon = lon_min + (np.arange(size, dtype=np.float32) + 0.5) * (lon_max - lon_min) / size
+
+    # Equirectangular distance is accurate to well under 1% at sensor radii
+    km_lon = np.float32(KM_PER_DEG_LAT * math.cos(math.radians((lat_min + lat_max) / 2)))
+    s_lat = lat.astype(np.float32)
+    s_lon = lon.astype(np.float32)
+    s_radius_sq = (radius.astype(np.float32)) ** 2
+    s_aqi = aqi.astype(np.float32)
+
+    s_lat_lo, s_lat_hi = s_lat - d_lat, s_lat + d_lat
+    s_lon_lo, s_lon_hi = s_lon - d_lon, s_lon + d_lon
+
+    values = np.full((size, size), np.nan, dtype=np.float32)
+
+    for r0 in range(0, size, BLOCK_SIZE):
+        r1 = min(size, r0 + BLOCK_SIZE)
+        b_lat = cell_lat[r0:r1]
+        in_band = (s_lat_hi >= b_lat[-1]) & (s_lat_lo <= b_lat[0])
+        if not in_band.any():
+            continue
+
+        for c0 in range(0, size, BLOCK_SIZE):
+            c1 = min(size, c0 + BLOCK_SIZE)
+            b_lon = cell_lon[c0:c1]
+            near = np.flatnonzero(in_band & (s_lon_hi >= b_lon[0]) & (s_lon_lo <= b_lon[-1]))
+            if len(near) == 0:
+                continue
+
+            dy = (b_lat[:, None] - s_lat[near][None, :]) * np.float32(KM_PER_DEG_LAT)
+            dx = (b_lon[:, None] - s_lon[near][None, :]) * km_lon
+            dist_sq = (dy * dy)[:, None, :] + (dx * dx)[None, :, :]  # [rows, cols, sensors]
+
+            weights = np.where(
+                dist_sq <= s_radius_sq[near], 1.0 / np.maximum(dist_sq, np.float32(1e-4)), np.float32(0)
+            )
+            total = weights.sum(axis=2)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values[r0:r1, c0:c1] = np.where(total > 0, (weights @ s_aqi[near]) / total, np.nan)
+
+    return (lat_min, lon_min, lat_max, lon_max), values
+
+
+class HeatmapService:
+    """
+    Holds the current raster and rendered tiles. New readings only mark the
+    raster dirty; it is recomputed on the next tile request at most once per
+    MIN_INTERVAL, and requests in between are served from the old raster.
+    """
+
+    def __init__(self):
+        self._raster = None
+        self._dirty = True
+        self._version = 0
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()
+        self._tiles_lock = threading.Lock()
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def raster(self):
+        current = self._raster
+        due = current is None or (self._dirty and time.time() - current.computed_at >= MIN_INTERVAL)
+        if not due:
+            return current
+
+        # One recompute at a time; everyone else keeps the previous raster
+        if not self._lock.acquire(blocking=current is None):
+            return current
+        try:
+            if self._raster is not current:
+                return self._raster
+            self._dirty = False
+            snap = sensor_index.snapshot()
+            usable = snap.active & ~np.isnan(snap.lat) & ~np.isnan(snap.lon) & ~np.isnan(snap.aqi)
+            self._version += 1
+
+            if usable.any():
+                bounds, values = compute_raster(
+                    snap.lat[usable], snap.lon[usable], snap.radius[usable], snap.aqi[usable], RASTER_SIZE
+                )
+                self._raster = Raster(self._version, bounds, values)
+            else:
+                self._raster = Raster(self._version, None, None)
+
+            with self._tiles_lock:
+                self._tiles.clear()
+            return self._raster
+        finally:
+            self._lock.release()
+
+    def tile(self, z, x, y):
+        raster = self.raster()
+        key = (raster.version, z, x, y)
+
+        with self._tiles_lock:
+            png = self._tiles.get(key)
+            if png is not None:
+                self._tiles.move_to_end(key)
+                return raster, png
+
+        png = self._render(raster, z, x, y)
+        with self._tiles_lock:
+            self._tiles[key] = png
+            while len(self._tiles) > TILE_CACHE_SIZE:
+                self._tiles.popitem(last=False)
+        return raster, png
+
+    def _render(self, raster, z, x, y):
+        if raster.bounds is None:
+            return EMPTY_TILE
+
+        lat_min, lon_min, lat_max, lon_max = raster.bounds
+        n = 2 ** z
+
+        # Web Mercator pixel centres of this tile
+        px = (x + (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE) / n
+        py = (y + (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE) / n
+        lon = px * 360.0 - 180.0
+        lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py))))
+
+        if lon[-1] < lon_min or lon[0] > lon_max or lat[0] < lat_min or lat[-1] > lat_max:
+            return EMPTY_TILE
+
+        size_r, size_c = raster.values.shape
+        rows = np.floor((lat_max - lat) / (lat_max - lat_min) * size_r).astype(np.int64)
+        cols = np.floor((lon - lon_min) / (lon_max - lon_min) * size_c).astype(np.int64)
+        row_ok = (rows >= 0) & (rows < size_r)
+        col_ok = (cols >= 0) & (cols < size_c)
+
+        sampled = raster.values[np.clip(rows, 0, size_r - 1)[:, None], np.clip(cols, 0, size_c - 1)[None, :]]
+        inside = row_ok[:, None] & col_ok[None, :] & ~np.isnan(sampled)
+
+        indices = np.full(sampled.shape, NO_DATA, dtype=np.uint8)
+        indices[inside] = np.searchsorted(BREAKPOINTS, sampled[inside], side="left")
+        return encode_png(indices)
+
+
+heatmap = HeatmapService()
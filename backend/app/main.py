@@ -1,14 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import joblib
 import numpy as np
 import psycopg2
-from app.db import get_connection
-from app.auth import hash_password, verify_password, create_token, verify_token
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from app.db import (
+    get_connection, get_read_connection, execute, with_cursor,
+    SHARDED, SHARDS, shard_for_region, get_shard_connection, scatter
+)
+from app.auth import (
+    hash_password, verify_password, create_token, verify_token, decode_token, token_hash,
+    run_hash, HashBusy, login_retry_after, record_login_failure, record_login_success,
+    revoke, load_revocations
+)
+from app.metrics import MetricsMiddleware, timed_predict, render_metrics
+from app.readings import get_category, category_code, category_label, stored
+from app.serialization import (
+    JSONBytesResponse, dump, dump_rows, rows_to_dicts, float_or, default_to,
+    shard_rows, merge_rows
+)
+from app.cache import cached_json, etag_matches, set_version, advance, version
+from app.spatial import sensor_index, cluster, CLUSTER_MAX_ZOOM
+from app.heatmap import heatmap, MIN_INTERVAL as HEATMAP_INTERVAL
+from app.anomaly import detector, POLLUTANTS
+from app.aggregates import aggregates, window_bucket, WINDOWS, WARMUP_ENABLED as AGGREGATES_WARMUP
+from app import alerts, export, events, admission, decommission, provisioning, sketches
+from app.heartbeat import heartbeats, monitor as heartbeat_monitor
+from app.forecast import service as forecasts, MAX_HORIZON as FORECAST_MAX_HORIZON
+from app import query_trace, profiler
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+import os
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        load_revoked_tokens()
+    except Exception:
+        logger.exception("Could not load revoked tokens")
+    try:
+        load_data_versions()
+    except Exception:
+        logger.exception("Could not load data versions")
+    start_background_tasks()
+    yield
+    try:
+        sketches.recorder.flush()
+    except Exception:
+        logger.exception("Final sketch flush failed")
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# Compress only payloads big enough to be worth the CPU (the list endpoints)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_BYTES", "1024")))
+
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,28 +87,165 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="admin/login")
 # ==============================
 # Load Models
 # ==============================
-model = joblib.load("models/aqi_model.pkl")
-forecast_model = joblib.load("models/aqi_forecast_model.pkl")
+def load_models():
+    global model, forecast_model
+    model = joblib.load("models/aqi_model.pkl")
+    forecast_model = joblib.load("models/aqi_forecast_model.pkl")
+    forecasts.set_model(forecast_model)
+
+
+load_models()
 
 # ==============================
-# Utility Functions
+# In-Memory State Hooks
 # ==============================
-def get_category(aqi):
-    if aqi <= 50:
-        return "Good"
-    elif aqi <= 100:
-        return "Satisfactory"
-    elif aqi <= 200:
-        return "Moderate"
-    elif aqi <= 300:
-        return "Poor"
-    elif aqi <= 400:
-        return "Very Poor"
+def on_new_reading(sensor_id, reading_id, aqi, pollutants=None, local=True, at=None, shard=0):
+    note_reading(reading_id, shard)
+    heartbeats.beat(sensor_id, at)
+    sensor_index.update_reading(sensor_id, aqi)
+    heatmap.mark_dirty()
+    region_id = sensor_index.region_of(sensor_id)
+    aggregates.add(sensor_id, region_id, at or time.time(), aqi)
+    forecasts.invalidate(sensor_id)
+    if not local and pollutants:
+        # The taking worker already scored it; the others just fold it in
+        detector.observe(sensor_id, [pollutants[p] for p in POLLUTANTS])
+
+    if local:
+        sketches.recorder.record(sensor_id, region_id, at or time.time(), aqi)
+    # Every worker advances the alert state of every reading in memory;
+    # only each subject's owner records what fires or resolves
+    try:
+        alerts.engine.evaluate(
+            sensor_id, region_id, dict(pollutants or {}, aqi=aqi), aggregates.window_mean
+        )
+    except Exception:
+        logger.exception("Alert evaluation failed for sensor %s", sensor_id)
+
+
+def note_reading(reading_id, shard=0):
+    # Interleaved ids only order readings within a shard, so each shard
+    # keeps its own watermark
+    advance("readings", reading_id, shard)
+
+
+def sensors_version(cursor):
+    execute(cursor, "sensors_version", "SELECT version FROM cache_versions WHERE name = 'sensors'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def load_reading_watermarks():
+    for shard, reading_id in zip(SHARDS, scatter(latest_reading_id)):
+        note_reading(reading_id, shard)
+
+
+def load_data_versions():
+    # The shared ETag versions as committed, for a worker that just started
+    set_version("sensors", with_cursor(sensors_version))
+    load_reading_watermarks()
+
+
+def on_sensors_changed(sensor_ids=None, sensors_version_seen=None):
+    # sensor_ids: the sensors added or removed, the only forecasts that
+    # change ([] for status flips); None when unknown drops every forecast.
+    # sensors_version_seen: the event's cache_versions value; a local write
+    # reads it back after committing
+    if sensors_version_seen is None:
+        if events.ENABLED:
+            sensors_version_seen = with_cursor(sensors_version)
+        else:
+            sensors_version_seen = version("sensors") + 1
+    set_version("sensors", sensors_version_seen)
+    # Sensor writes add or remove readings no reading event announces
+    load_reading_watermarks()
+    sensor_index.invalidate()
+    forget_unknown_sensors()
+    heatmap.mark_dirty()
+    if sensor_ids is None:
+        forecasts.reset()
     else:
-        return "Severe"
+        for sensor_id in sensor_ids:
+            forecasts.invalidate(sensor_id)
+
+
+# A sensors event names at most this many ids (NOTIFY payloads are capped
+# at 8000 bytes); past it the event carries none and receivers drop all
+MAX_EVENT_SENSOR_IDS = 500
+
+
+def sensor_event(sensor_ids):
+    """
+    Fields of a "sensors" event for on_sensors_changed on other workers.
+    """
+    if len(sensor_ids) > MAX_EVENT_SENSOR_IDS:
+        return {}
+    return {"ids": list(sensor_ids)}
+
+
+# Readings older than this many ids behind are not replayed after a reconnect;
+# the latest-AQI index is reloaded instead and rolling windows catch up live
+MAX_REPLAY_READINGS = int(os.getenv("EVENT_BUS_MAX_REPLAY", "50000"))
+
+
+def latest_reading_id(cursor):
+    execute(cursor, "readings_watermark", "SELECT COALESCE(MAX(id), 0) FROM sensor_readings")
+    return cursor.fetchone()[0]
+
+
+def on_external_write():
+    # A seed script or manual fix changed rows under every cache; the
+    # sensors event it publishes alongside handles the sensor side
+    load_reading_watermarks()
+
 
+def recover_missed_readings(initial):
+    if initial or SHARDED:
+        # Everything committed so far is already in the database-backed caches
+        if not initial:
+            # Ids don't order readings across shards, so there is no replay
+            # watermark; reload the latest-AQI index instead
+            sensor_index.invalidate()
+        load_reading_watermarks()
+        return
 
-def get_current_admin(token: str = Depends(oauth2_scheme)):
+    def load(cursor):
+        execute(cursor, "readings_replay", """
+            SELECT id, sensor_id, predicted_aqi,
+                   EXTRACT(EPOCH FROM timestamp AT TIME ZONE current_setting('TimeZone')),
+                   pm25, pm10, no2, co, so2, o3, nh3
+            FROM sensor_readings
+            WHERE id > %s AND predicted_aqi IS NOT NULL
+            ORDER BY id
+            LIMIT %s
+        """, (version("readings", 0), MAX_REPLAY_READINGS))
+        return cursor.fetchall()
+
+    missed = with_cursor(load)
+    for reading_id, sensor_id, aqi, at, *values in missed:
+        pollutants = dict(zip(POLLUTANTS, values)) if None not in values else None
+        on_new_reading(sensor_id, reading_id, aqi, pollutants, local=False, at=float(at))
+    if missed:
+        logger.info("Replayed %d readings missed while the event bus was down", len(missed))
+    if len(missed) == MAX_REPLAY_READINGS:
+        sensor_index.invalidate()
+
+
+events.subscribe("reading", lambda e: on_new_reading(
+    e["s"], e["r"], e["a"], dict(zip(POLLUTANTS, e["p"])) if "p" in e else None, local=False,
+    shard=e.get("h", 0)
+))
+# A replayed event ({"k", "v"} only) has no ids, so it drops every forecast
+events.subscribe("sensors", lambda e: on_sensors_changed(e.get("ids"), e["v"]), versioned=True)
+events.subscribe("alert_rules", lambda e: alerts.engine.invalidate(), versioned=True)
+events.subscribe("models", lambda e: load_models(), versioned=True)
+events.subscribe("tokens", lambda e: on_token_revoked(e), versioned=True)
+events.subscribe(events.EXTERNAL_WRITE, lambda e: on_external_write(), versioned=True)
+events.on_connect(recover_missed_readings)
+
+
+async def get_current_admin(token: str = Depends(oauth2_scheme)):
+    # Cached by token hash, so this is a dict lookup on the event loop
     admin_id = verify_token(token)
 
     if not admin_id:
@@ -81,6 +278,21 @@ class SensorCreate(BaseModel):
     longitude: float
     radius: int
 
+class BulkStatusUpdate(BaseModel):
+    is_active: bool
+    sensor_ids: list[int] = None
+    region_id: int = None
+
+class AlertRuleCreate(BaseModel):
+    name: str
+    scope: str = "sensor"
+    target_id: int = None
+    metric: str = "aqi"
+    window: str = "reading"
+    threshold: float
+    clear_threshold: float = None
+    consecutive: int = 1
+
 
 # ==============================
 # Public Routes
@@ -90,17 +302,34 @@ def home():
     return {"message": "AQI API Running"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 # ==============================
 # Admin Authentication
 # ==============================
 @app.post("/admin/register")
-def register_admin(username: str, email: str, password: str):
+async def register_admin(username: str, email: str, password: str):
+    # bcrypt runs in its own pool; waiting on it here holds no threadpool thread
+    try:
+        password_hash = await asyncio.wrap_future(run_hash(hash_password, password))
+    except HashBusy:
+        raise HTTPException(status_code=503, detail="Too many password operations in progress",
+                            headers={"Retry-After": "1"})
+
+    admin_id = await run_in_threadpool(create_admin, username, email, password_hash)
+
+    return {"message": "Admin registered", "admin_id": admin_id}
+
+
+def create_admin(username, email, password_hash):
     conn = get_connection()
     cursor = conn.cursor()
 
-    password_hash = hash_password(password)
-
-    cursor.execute("""
+    execute(cursor, "admin_register", """
         INSERT INTO admins (username, email, password_hash)
         VALUES (%s, %s, %s)
         RETURNING id
@@ -112,32 +341,47 @@ def register_admin(username: str, email: str, password: str):
     cursor.close()
     conn.close()
 
-    return {"message": "Admin registered", "admin_id": admin_id}
-
+    return admin_id
 
-@app.post("/admin/login")
-def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("""
+def admin_credentials(cursor, username):
+    execute(cursor, "admin_login", """
         SELECT id, password_hash
         FROM admins
         WHERE username = %s
-    """, (form_data.username,))
+    """, (username,))
+    return cursor.fetchone()
 
-    admin = cursor.fetchone()
-    cursor.close()
-    conn.close()
+
+@app.post("/admin/login")
+async def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
+    username = form_data.username
+
+    # Locked-out usernames are refused before any DB or bcrypt work
+    retry_after = login_retry_after(username)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many failed login attempts",
+                            headers={"Retry-After": str(retry_after)})
+
+    admin = await run_in_threadpool(with_cursor, admin_credentials, username)
 
     if not admin:
+        record_login_failure(username)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     admin_id, password_hash = admin
 
-    if not verify_password(form_data.password, password_hash):
+    try:
+        valid = await asyncio.wrap_future(run_hash(verify_password, form_data.password, password_hash))
+    except HashBusy:
+        raise HTTPException(status_code=503, detail="Too many login attempts in progress",
+                            headers={"Retry-After": "1"})
+
+    if not valid:
+        record_login_failure(username)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    record_login_success(username)
     token = create_token(admin_id)
 
     return {
@@ -146,60 +390,314 @@ def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
     }
 
 
+@app.post("/admin/logout")
+def logout_admin(token: str = Depends(oauth2_scheme), admin_id: int = Depends(get_current_admin)):
+    key = token_hash(token)
+    decoded = decode_token(token)
+    if decoded is None:
+        # Expired between get_current_admin and here: nothing left to revoke
+        return {"message": "Logged out"}
+    _, exp = decoded
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    execute(cursor, "token_revoke", """
+        INSERT INTO revoked_tokens (token_hash, expires_at)
+        VALUES (%s, to_timestamp(%s))
+        ON CONFLICT (token_hash) DO NOTHING
+    """, (key, exp))
+    execute(cursor, "token_revoke_prune", "DELETE FROM revoked_tokens WHERE expires_at < now()")
+    events.publish(cursor, "tokens", h=key, x=exp)
+    conn.commit()
+
+    cursor.close()
+    conn.close()
+
+    revoke(key, exp)
+
+    return {"message": "Logged out"}
+
+
+def load_revoked_tokens():
+    def load(cursor):
+        execute(cursor, "revoked_tokens", """
+            SELECT token_hash, EXTRACT(EPOCH FROM expires_at)
+            FROM revoked_tokens
+            WHERE expires_at > now()
+        """)
+        return cursor.fetchall()
+
+    load_revocations([(key, float(exp)) for key, exp in with_cursor(load)])
+
+
+def on_token_revoked(event):
+    # A version-check replay carries no token, so reload the whole set
+    if "h" in event:
+        revoke(event["h"], event["x"])
+    else:
+        load_revoked_tokens()
+
+
+# ==============================
+# Region Shard Routing
+# ==============================
+# Ids no shard holds are remembered this long, so a client posting an
+# unknown sensor_id doesn't send a lookup to every shard on each request.
+# A sensors event (a provision on another worker) forgets them all.
+UNKNOWN_SENSOR_TTL = float(os.getenv("UNKNOWN_SENSOR_TTL", "10"))
+MAX_UNKNOWN_SENSORS = 10000
+
+_unknown_sensors = OrderedDict()  # sensor_id -> expiry, oldest first
+_unknown_lock = threading.Lock()
+
+
+def _holds_sensor(cursor, sensor_id):
+    execute(cursor, "sensor_shard_lookup", "SELECT 1 FROM sensors WHERE id = %s", (sensor_id,))
+    return cursor.fetchone() is not None
+
+
+def forget_unknown_sensors():
+    with _unknown_lock:
+        _unknown_sensors.clear()
+
+
+def sensor_shard(sensor_id):
+    """
+    Shard holding a sensor's rows. The in-memory index knows every live
+    sensor's region; others (decommissioned, or provisioned by another
+    worker a moment ago) are looked for on every shard. Unknown ids go to
+    shard 0.
+    """
+    if not SHARDED:
+        return 0
+
+    region_id = sensor_index.region_of(sensor_id)
+    if region_id is not None:
+        return shard_for_region(region_id)
+
+    now = time.monotonic()
+    with _unknown_lock:
+        while _unknown_sensors and next(iter(_unknown_sensors.values())) <= now:
+            _unknown_sensors.popitem(last=False)
+        if sensor_id in _unknown_sensors:
+            return 0
+
+    held = scatter(_holds_sensor, sensor_id, readonly=True)
+    shard = next((shard for shard, found in zip(SHARDS, held) if found), None)
+    if shard is not None:
+        return shard
+
+    with _unknown_lock:
+        _unknown_sensors.pop(sensor_id, None)
+        _unknown_sensors[sensor_id] = now + UNKNOWN_SENSOR_TTL
+        if len(_unknown_sensors) > MAX_UNKNOWN_SENSORS:
+            _unknown_sensors.popitem(last=False)
+    return 0
+
+
+def sensor_shards(sensor_ids):
+    # Every shard once any of the sensors is unknown to the index
+    regions = {sensor_index.region_of(sensor_id) for sensor_id in sensor_ids}
+    if None in regions or not regions:
+        return SHARDS
+    return sorted({shard_for_region(region_id) for region_id in regions})
+
+
+def commit_and_publish(conn, cursor, shard, kind, **fields):
+    """
+    Commit a write made on `shard` and announce it. Every shard carries the
+    bus, so the event rides in the write's own transaction; only versioned
+    kinds, whose versions live on shard 0, are announced there right after
+    a write on another shard commits.
+    """
+    if shard == 0 or not events.is_versioned(kind):
+        events.publish(cursor, kind, **fields)
+        conn.commit()
+    else:
+        conn.commit()
+        events.publish_now(kind, **fields)
+
+
+def write_shards(shards, fn, *args, event=None, event_fields=None):
+    """
+    Run fn(cursor, *args) as one transaction per shard and return the
+    results in shard order; `event` (with event_fields) is published once
+    if any result is truthy. Partial failures across shards are not
+    rolled back.
+    """
+    event_fields = event_fields or {}
+    if len(shards) > 1:
+        results = scatter(fn, *args, shards=shards, commit=True)
+        if event and any(results):
+            events.publish_now(event, **event_fields)
+        return results
+
+    conn = get_shard_connection(shards[0])
+    cursor = conn.cursor()
+    try:
+        result = fn(cursor, *args)
+        if event and result:
+            commit_and_publish(conn, cursor, shards[0], event, **event_fields)
+        else:
+            conn.commit()
+        return [result]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def read_shards(fn, *args, shards=None):
+    return scatter(fn, *args, readonly=True, shards=shards)
+
+
 # ==============================
 # Prediction API (Public)
 # ==============================
 @app.post("/predict")
-def predict(data: AQIRequest):
+async def predict(data: AQIRequest):
+    # Shed floods on the event loop, before any feature building, model or
+    # DB work and before a threadpool thread is taken from other routes
+    try:
+        async with admission.admit(data.sensor_id):
+            return await run_in_threadpool(ingest_reading, data)
+    except admission.Rejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests ({e.reason})",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def ingest_reading(data):
     features = np.array([[
         data.PM2_5, data.PM10, data.NO2, data.CO,
         data.SO2, data.O3, data.NH3,
         data.hour, data.day, data.month, data.weekday
     ]])
 
-    prediction = float(model.predict(features)[0])
+    prediction = float(timed_predict("aqi", model, features)[0])
     category = get_category(prediction)
 
-    conn = get_connection()
+    # In-line score against this sensor's running statistics (no DB access)
+    is_anomaly, anomaly_score, flagged = detector.score(data.sensor_id, features[0, :7])
+
+    shard = sensor_shard(data.sensor_id)
+    conn = get_shard_connection(shard)
     cursor = conn.cursor()
 
-    cursor.execute("""
+    execute(cursor, "reading_insert", """
         INSERT INTO sensor_readings
-        (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category_code,
+         is_anomaly, anomaly_score, anomaly_pollutants)
+        SELECT %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s
+        WHERE NOT EXISTS (SELECT 1 FROM sensors WHERE id = %s AND deleted_at IS NOT NULL)
+        RETURNING id
     """, (
         data.sensor_id,
-        data.PM2_5,
-        data.PM10,
-        data.NO2,
-        data.CO,
-        data.SO2,
-        data.O3,
-        data.NH3,
-        prediction,
-        category
+        stored(data.PM2_5),
+        stored(data.PM10),
+        stored(data.NO2),
+        stored(data.CO),
+        stored(data.SO2),
+        stored(data.O3),
+        stored(data.NH3),
+        stored(prediction),
+        category_code(prediction),
+        is_anomaly,
+        anomaly_score,
+        ",".join(flagged) or None,
+        data.sensor_id
     ))
-
-    conn.commit()
+    row = cursor.fetchone()
+    if row is None:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        raise HTTPException(status_code=404, detail="Sensor has been decommissioned")
+    reading_id = row[0]
+    commit_and_publish(conn, cursor, shard, "reading", s=data.sensor_id, r=reading_id, a=prediction,
+                       p=features[0, :7].tolist(), h=shard)
     cursor.close()
     conn.close()
 
+    on_new_reading(data.sensor_id, reading_id, prediction, {
+        "PM2_5": data.PM2_5, "PM10": data.PM10, "NO2": data.NO2, "CO": data.CO,
+        "SO2": data.SO2, "O3": data.O3, "NH3": data.NH3
+    }, shard=shard)
+
     return {
         "predicted_AQI": prediction,
-        "category": category
+        "category": category,
+        "is_anomaly": is_anomaly
     }
 
 
 # ==============================
 # Public Data APIs
 # ==============================
-@app.get("/latest")
-def get_latest_aqi():
-    conn = get_connection()
-    cursor = conn.cursor()
+LATEST_FIELDS = [
+    ("region", None), ("sensor_id", None), ("aqi", None), ("category", category_label),
+    ("timestamp", None), ("PM2_5", None), ("PM10", None), ("NO2", None),
+    ("CO", None), ("SO2", None), ("O3", None), ("NH3", None)
+]
+
+PUBLIC_SENSOR_FIELDS = [
+    ("sensor_id", None), ("sensor_code", None),
+    ("latitude", float_or(None)), ("longitude", float_or(None)),
+    ("radius", float_or(20.0)), ("region", None), ("is_active", None)
+]
+
+HISTORY_FIELDS = [
+    ("timestamp", None), ("aqi", None),
+    ("pm25", default_to(0)), ("pm10", default_to(0))
+]
+
+ADMIN_SENSOR_FIELDS = [
+    ("sensor_id", None), ("sensor_code", None), ("region_id", None),
+    ("latitude", None), ("longitude", None), ("radius", None), ("is_active", None)
+]
+
+
+def viewport_params(min_lat: float = Query(None, ge=-90, le=90),
+                    min_lon: float = Query(None, ge=-180, le=180),
+                    max_lat: float = Query(None, ge=-90, le=90),
+                    max_lon: float = Query(None, ge=-180, le=180),
+                    zoom: int = Query(None, ge=0, le=22)):
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+    given = [v is not None for v in bbox]
 
-    cursor.execute("""
-        SELECT r.name, s.id, sr.predicted_aqi, sr.category, sr.timestamp,
+    if any(given) and not all(given):
+        raise HTTPException(status_code=400, detail="Bounding box needs min_lat, min_lon, max_lat and max_lon")
+    if all(given) and (min_lat > max_lat or min_lon > max_lon):
+        raise HTTPException(status_code=400, detail="Bounding box needs min_lat <= max_lat and min_lon <= max_lon")
+
+    return {"bbox": bbox if all(given) else None, "zoom": zoom}
+
+
+def viewport_sensor_ids(viewport):
+    # None means "no spatial filter"; the in-memory grid answers the bbox
+    if viewport is None or viewport["bbox"] is None:
+        return None
+    return sensor_index.in_bbox(*viewport["bbox"])
+
+
+def should_cluster(viewport):
+    return viewport is not None and viewport["zoom"] is not None and viewport["zoom"] < CLUSTER_MAX_ZOOM
+
+
+def _aqi_desc(row):
+    # ORDER BY predicted_aqi DESC, which puts NULLs first
+    return (row[2] is not None, -(row[2] or 0))
+
+
+# Bodies below read through run(fn, *args, shards=None), which calls
+# fn(cursor, *args) on each shard (all of them by default) and returns the
+# results in shard order; see read_shards() and snapshot_body().
+def _latest_rows(cursor, sensor_ids, clustered):
+    sensor_filter = "AND s.id = ANY(%s)" if sensor_ids is not None else ""
+    execute(cursor, "latest_join" if sensor_ids is None else "latest_join_bbox", f"""
+        SELECT r.name, s.id, sr.predicted_aqi, sr.category_code, sr.timestamp,
                sr.pm25, sr.pm10, sr.no2, sr.co, sr.so2, sr.o3, sr.nh3
         FROM regions r
         JOIN sensors s ON s.region_id = r.id
@@ -209,105 +707,91 @@ def get_latest_aqi():
             FROM sensor_readings
             WHERE sensor_id = s.id
         )
+        AND s.deleted_at IS NULL
+        {sensor_filter}
         ORDER BY sr.predicted_aqi DESC;
-    """)
+    """, (sensor_ids,) if sensor_ids is not None else None)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    return cursor.fetchall() if clustered else shard_rows(cursor, LATEST_FIELDS)
 
-    return [
-        {
-            "region": r[0],
-            "sensor_id": r[1],
-            "aqi": r[2],
-            "category": r[3],
-            "timestamp": r[4],
-            "PM2_5": r[5],
-            "PM10": r[6],
-            "NO2": r[7],
-            "CO": r[8],
-            "SO2": r[9],
-            "O3": r[10],
-            "NH3": r[11]
-        }
-        for r in rows
-    ]
 
+def latest_body(run, viewport=None):
+    sensor_ids = viewport_sensor_ids(viewport)
+    if sensor_ids == []:
+        return b"[]"
 
-@app.get("/public/sensors")
-def get_public_sensors():
-    conn = get_connection()
-    cursor = conn.cursor()
+    clustered = should_cluster(viewport)
+    parts = run(_latest_rows, sensor_ids, clustered)
+    if not clustered:
+        return merge_rows(parts, LATEST_FIELDS, key=_aqi_desc)
 
-    cursor.execute("""
+    rows = sorted((row for part in parts for row in part), key=_aqi_desc)
+    items = rows_to_dicts(rows, LATEST_FIELDS)
+    lat, lon, _ = sensor_index.coordinates([i["sensor_id"] for i in items])
+    aqi = np.array([i["aqi"] if i["aqi"] is not None else np.nan for i in items], dtype=np.float64)
+    return dump(cluster(items, lat, lon, aqi, viewport["zoom"]))
+
+
+def _public_sensor_rows(cursor, sensor_ids, clustered):
+    sensor_filter = "AND s.id = ANY(%s)" if sensor_ids is not None else ""
+    execute(cursor, "public_sensors" if sensor_ids is None else "public_sensors_bbox", f"""
         SELECT s.id, s.sensor_code, s.latitude, s.longitude, s.radius, r.name, s.is_active
         FROM sensors s
         JOIN regions r ON s.region_id = r.id
-    """)
+        WHERE s.deleted_at IS NULL
+        {sensor_filter}
+    """, (sensor_ids,) if sensor_ids is not None else None)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    return cursor.fetchall() if clustered else shard_rows(cursor, PUBLIC_SENSOR_FIELDS)
 
-    return [
-        {
-            "sensor_id": r[0],
-            "sensor_code": r[1],
-            "latitude": float(r[2]) if r[2] is not None else None,
-            "longitude": float(r[3]) if r[3] is not None else None,
-            "radius": float(r[4]) if r[4] is not None else 20.0,
-            "region": r[5],
-            "is_active": r[6]
-        }
-        for r in rows
-    ]
 
+def public_sensors_body(run, viewport=None):
+    sensor_ids = viewport_sensor_ids(viewport)
+    if sensor_ids == []:
+        return b"[]"
 
-@app.get("/history/{region_id}")
-def get_history(region_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+    clustered = should_cluster(viewport)
+    parts = run(_public_sensor_rows, sensor_ids, clustered)
+    if not clustered:
+        return merge_rows(parts, PUBLIC_SENSOR_FIELDS)
 
-    cursor.execute("""
+    items = rows_to_dicts([row for part in parts for row in part], PUBLIC_SENSOR_FIELDS)
+    lat = np.array([i["latitude"] if i["latitude"] is not None else np.nan for i in items], dtype=np.float64)
+    lon = np.array([i["longitude"] if i["longitude"] is not None else np.nan for i in items], dtype=np.float64)
+    _, _, aqi = sensor_index.coordinates([i["sensor_id"] for i in items])
+    return dump(cluster(items, lat, lon, aqi, viewport["zoom"]))
+
+
+def _history_rows(cursor, region_id):
+    execute(cursor, "history_region", """
         SELECT sr.timestamp, sr.predicted_aqi, sr.pm25, sr.pm10
         FROM sensor_readings sr
         JOIN sensors s ON s.id = sr.sensor_id
         WHERE s.region_id = %s
+          AND s.deleted_at IS NULL
         ORDER BY sr.timestamp DESC
         LIMIT 50;
     """, (region_id,))
-    
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
 
-    return [
-        {
-            "timestamp": r[0],
-            "aqi": r[1],
-            "pm25": r[2] if r[2] is not None else 0,
-            "pm10": r[3] if r[3] is not None else 0
-        }
-        for r in rows
-    ]
+    return shard_rows(cursor, HISTORY_FIELDS)
 
 
-@app.get("/top-polluted")
-def get_top_polluted():
-    conn = get_connection()
-    cursor = conn.cursor()
+def history_body(run, region_id):
+    # A region's sensors all live on one shard
+    return merge_rows(run(_history_rows, region_id, shards=[shard_for_region(region_id)]), HISTORY_FIELDS)
+
 
-    cursor.execute("""
+def _top_polluted_rows(cursor):
+    execute(cursor, "top_polluted", """
         SELECT 
             r.name AS region,
-            AVG(sr.predicted_aqi) AS avg_aqi,
+            AVG(sr.predicted_aqi::numeric) AS avg_aqi,
             CASE
-                WHEN AVG(sr.predicted_aqi) <= 50 THEN 'Good'
-                WHEN AVG(sr.predicted_aqi) <= 100 THEN 'Satisfactory'
-                WHEN AVG(sr.predicted_aqi) <= 200 THEN 'Moderate'
-                WHEN AVG(sr.predicted_aqi) <= 300 THEN 'Poor'
-                WHEN AVG(sr.predicted_aqi) <= 400 THEN 'Very Poor'
+                WHEN AVG(sr.predicted_aqi::numeric) <= 50 THEN 'Good'
+                WHEN AVG(sr.predicted_aqi::numeric) <= 100 THEN 'Satisfactory'
+                WHEN AVG(sr.predicted_aqi::numeric) <= 200 THEN 'Moderate'
+                WHEN AVG(sr.predicted_aqi::numeric) <= 300 THEN 'Poor'
+                WHEN AVG(sr.predicted_aqi::numeric) <= 400 THEN 'Very Poor'
                 ELSE 'Severe'
             END AS category
         FROM regions r
@@ -318,94 +802,393 @@ def get_top_polluted():
             FROM sensor_readings
             WHERE sensor_id = s.id
         )
+        AND s.deleted_at IS NULL
         GROUP BY r.name
         ORDER BY avg_aqi DESC
         LIMIT 5;
     """)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    return cursor.fetchall()
+
 
-    return [
+def top_polluted_body(run):
+    # Regions don't span shards, so the overall top 5 is among each shard's top 5
+    parts = run(_top_polluted_rows)
+    rows = [row for part in parts for row in part]
+    if len(parts) > 1:
+        rows = sorted(rows, key=lambda r: r[1], reverse=True)[:5]
+
+    return dump([
         {
             "region": r[0],
             "aqi": float(r[1]),
             "category": r[2]
         }
         for r in rows
-    ]
+    ])
+
+
+def forecast_body(sensor_id, horizon=1):
+    # Served from the per-sensor forecast cache; see app/forecast.py
+    projected = forecasts.get(sensor_id, horizon)
+
+    if projected is None:
+        return dump({"error": "Not enough data"})
+
+    forecast = float(projected[0])
+    category = get_category(forecast)
+
+    body = {
+        "sensor_id": sensor_id,
+        "next_hour_AQI": round(forecast, 2),
+        "category": category
+    }
+    if horizon > 1:
+        body["hourly"] = [
+            {"hour": hour, "aqi": round(value, 2), "category": get_category(value)}
+            for hour, value in enumerate(projected.tolist(), start=1)
+        ]
+    return dump(body)
+
+
+# Read endpoints answer from data versions first (304 / shared cache) and
+# only touch the database when the versions moved or the TTL ran out, and
+# then through a read replica when one is configured (see db.READ_REPLICA_DSNS).
+# /latest and /public/sensors take an optional viewport (bbox + zoom).
+@app.get("/latest")
+def get_latest_aqi(request: Request, viewport: dict = Depends(viewport_params)):
+    return cached_json(request, ("sensors", "readings"), lambda: latest_body(read_shards, viewport))
+
+
+@app.get("/public/sensors")
+def get_public_sensors(request: Request, viewport: dict = Depends(viewport_params)):
+    # Clusters carry AQI, so a clustered view also depends on readings
+    names = ("sensors", "readings") if should_cluster(viewport) else ("sensors",)
+    return cached_json(request, names, lambda: public_sensors_body(read_shards, viewport))
+
+
+@app.get("/history/{region_id}")
+def get_history(region_id: int, request: Request):
+    return cached_json(request, ("sensors", "readings"), lambda: history_body(read_shards, region_id))
+
+
+def top_polluted_window_body(window):
+    names = sensor_index.region_names()
+    means = aggregates.region_means(window)
+    ranked = sorted(means.items(), key=lambda item: item[1][0], reverse=True)[:5]
+
+    return dump([
+        {
+            "region": names.get(region_id, str(region_id)),
+            "aqi": mean,
+            "category": get_category(mean)
+        }
+        for region_id, (mean, _) in ranked
+    ])
+
+
+@app.get("/top-polluted")
+def get_top_polluted(request: Request, window: str = "latest"):
+    if window == "latest":
+        return cached_json(request, ("sensors", "readings"), lambda: top_polluted_body(read_shards))
+
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be latest or one of {', '.join(WINDOWS)}")
+
+    return cached_json(request, ("sensors", "readings"), lambda: top_polluted_window_body(window),
+                       bucket=window_bucket(window))
+
+
+@app.get("/regions/aggregates")
+def get_region_aggregates(request: Request, window: str = "24h", sensors: bool = False):
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+
+    def build():
+        names = sensor_index.region_names()
+        result = {
+            "window": window,
+            "regions": [
+                {
+                    "region_id": region_id,
+                    "region": names.get(region_id, str(region_id)),
+                    "mean_aqi": round(mean, 2),
+                    "readings": count,
+                    "category": get_category(mean)
+                }
+                for region_id, (mean, count) in sorted(
+                    aggregates.region_means(window).items(), key=lambda item: item[1][0], reverse=True
+                )
+            ]
+        }
+        if sensors:
+            # Decommissioned sensors are not in the index
+            known = sensor_index.snapshot().slots
+            result["sensors"] = [
+                {"sensor_id": sensor_id, "mean_aqi": round(mean, 2), "readings": count}
+                for sensor_id, (mean, count) in sorted(aggregates.sensor_means(window).items())
+                if sensor_id in known
+            ]
+        return dump(result)
+
+    return cached_json(request, ("sensors", "readings"), build, bucket=window_bucket(window))
+
+
+# ==============================
+# Percentiles
+# ==============================
+# Daily sketches in UTC days; today's reflects readings up to the last
+# flush (SKETCH_FLUSH_INTERVAL)
+PERCENTILE_DEFAULT_DAYS = 7
+PERCENTILE_MAX_DAYS = 3660
+
+
+def parse_percentiles(q):
+    try:
+        points = [float(p) for p in q.split(",") if p.strip()]
+    except ValueError:
+        points = []
+    if not points or not all(0 <= p <= 100 for p in points):
+        raise HTTPException(status_code=400, detail="q must be a comma-separated list of percentiles in 0-100")
+    return points
+
+
+def percentile_range(start, end):
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=PERCENTILE_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= PERCENTILE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {PERCENTILE_MAX_DAYS} days per query")
+    return start, end
+
+
+def percentiles_body(cursor, scope, target_id, start, end, points, daily):
+    first = int(datetime(start.year, start.month, start.day, tzinfo=timezone.utc).timestamp())
+    last = first + ((end - start).days + 1) * 86400
+    days = sketches.load(cursor, scope, target_id, "day", first, last)
+
+    def summarize(counts):
+        values = sketches.quantiles(counts, [p / 100 for p in points])
+        return {
+            "readings": int(counts.sum()),
+            "percentiles": {
+                f"p{p:g}": None if v is None else round(v, 2)
+                for p, v in zip(points, values)
+            }
+        }
+
+    total = sketches.empty()
+    for _, counts in days:
+        total += counts
+
+    result = {
+        "scope": scope,
+        "id": target_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        # Every reported value is within this fraction of the exact percentile
+        "relative_error": sketches.RELATIVE_ACCURACY,
+        **summarize(total)
+    }
+    if daily:
+        result["daily"] = [
+            {"date": datetime.fromtimestamp(bucket, timezone.utc).date().isoformat(), **summarize(counts)}
+            for bucket, counts in days
+        ]
+    return dump(result)
+
+
+@app.get("/regions/{region_id}/percentiles")
+def get_region_percentiles(region_id: int, request: Request, start: date = None, end: date = None,
+                           q: str = "50,90,99", daily: bool = False):
+    if region_id not in sensor_index.region_names():
+        raise HTTPException(status_code=404, detail="Region not found")
+    points = parse_percentiles(q)
+    start, end = percentile_range(start, end)
+
+    return cached_json(request, ("readings",), lambda: with_cursor(
+        percentiles_body, "region", region_id, start, end, points, daily, readonly=True
+    ))
+
+
+@app.get("/sensors/{sensor_id}/percentiles")
+def get_sensor_percentiles(sensor_id: int, request: Request, start: date = None, end: date = None,
+                           q: str = "50,90,99", daily: bool = False):
+    if sensor_id not in sensor_index.snapshot().slots:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+    points = parse_percentiles(q)
+    start, end = percentile_range(start, end)
+
+    return cached_json(request, ("readings",), lambda: with_cursor(
+        percentiles_body, "sensor", sensor_id, start, end, points, daily, readonly=True
+    ))
 
 
 @app.get("/forecast/{sensor_id}")
-def forecast_aqi(sensor_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+def forecast_aqi(sensor_id: int, request: Request, horizon: int = Query(1, ge=1, le=FORECAST_MAX_HORIZON)):
+    return cached_json(request, ("sensors", "readings"), lambda: forecast_body(sensor_id, horizon))
 
-    cursor.execute("""
-        SELECT predicted_aqi
-        FROM sensor_readings
-        WHERE sensor_id = %s
-        ORDER BY timestamp DESC
-        LIMIT 6
-    """, (sensor_id,))
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+# ==============================
+# Dashboard Bootstrap
+# ==============================
+SNAPSHOT_SECTIONS = {
+    "sensors": lambda run, p: public_sensors_body(run, p["viewport"]),
+    "latest": lambda run, p: latest_body(run, p["viewport"]),
+    "top_polluted": lambda run, p: top_polluted_body(run),
+    "history": lambda run, p: history_body(run, p["region_id"]),
+    "forecast": lambda run, p: forecast_body(p["sensor_id"]),
+}
+
+
+def snapshot_body(sections, params):
+    if SHARDED:
+        # No transaction spans shards: each section reads them as it runs
+        return _join_sections(sections, params, read_shards)
+
+    conn = get_read_connection()
+    try:
+        # One read-only REPEATABLE READ transaction so every section sees the same data
+        conn.set_session(
+            isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
+            readonly=True
+        )
+        cursor = conn.cursor()
+        body = _join_sections(sections, params, lambda fn, *args, shards=None: [fn(cursor, *args)])
+        conn.rollback()
+        cursor.close()
+    finally:
+        conn.close()
 
-    if len(rows) < 6:
-        return {"error": "Not enough data"}
+    return body
 
-    values = [r[0] for r in rows][::-1]
 
-    features = [
-        values[-1],
-        values[-2],
-        values[-3],
-        values[-6],
+def _join_sections(sections, params, run):
+    parts = [
+        dump(name) + b":" + SNAPSHOT_SECTIONS[name](run, params)
+        for name in sections
     ]
+    return b"{" + b",".join(parts) + b"}"
 
-    forecast = float(forecast_model.predict([features])[0])
-    category = get_category(forecast)
+
+@app.get("/dashboard/snapshot")
+def get_dashboard_snapshot(request: Request, sections: str = None,
+                           region_id: int = 1, sensor_id: int = 1,
+                           viewport: dict = Depends(viewport_params)):
+    wanted = [s.strip() for s in sections.split(",") if s.strip()] if sections else list(SNAPSHOT_SECTIONS)
+    unknown = [s for s in wanted if s not in SNAPSHOT_SECTIONS]
+
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+
+    params = {"region_id": region_id, "sensor_id": sensor_id, "viewport": viewport}
+    return cached_json(request, ("sensors", "readings"), lambda: snapshot_body(wanted, params))
+
+
+ANOMALY_FIELDS = [
+    ("reading_id", None), ("sensor_id", None), ("timestamp", None),
+    ("aqi", None), ("score", None),
+    ("pollutants", lambda v: v.split(",") if v else []),
+    ("PM2_5", None), ("PM10", None), ("NO2", None), ("CO", None),
+    ("SO2", None), ("O3", None), ("NH3", None)
+]
+
+
+def _anomaly_rows(cursor, sensor_id, limit):
+    sensor_filter = "AND sr.sensor_id = %s" if sensor_id is not None else ""
+    params = (sensor_id, limit) if sensor_id is not None else (limit,)
+
+    execute(cursor, "anomalies_recent", f"""
+        SELECT sr.id, sr.sensor_id, sr.timestamp, sr.predicted_aqi, sr.anomaly_score,
+               sr.anomaly_pollutants, sr.pm25, sr.pm10, sr.no2, sr.co, sr.so2, sr.o3, sr.nh3
+        FROM sensor_readings sr
+        JOIN sensors s ON s.id = sr.sensor_id AND s.deleted_at IS NULL
+        WHERE sr.is_anomaly
+        {sensor_filter}
+        ORDER BY sr.timestamp DESC
+        LIMIT %s
+    """, params)
+
+    return shard_rows(cursor, ANOMALY_FIELDS)
+
+
+def anomalies_body(sensor_id, limit):
+    shards = [sensor_shard(sensor_id)] if sensor_id is not None else None
+    parts = read_shards(_anomaly_rows, sensor_id, limit, shards=shards)
+    return merge_rows(parts, ANOMALY_FIELDS, key=lambda r: r[2], reverse=True, limit=limit)
+
+
+@app.get("/anomalies")
+def get_anomalies(request: Request, sensor_id: int = None,
+                  limit: int = Query(50, ge=1, le=500)):
+    return cached_json(request, ("readings",), lambda: anomalies_body(sensor_id, limit))
+
+
+@app.get("/aqi/at")
+def get_aqi_at(lat: float = Query(..., ge=-90, le=90),
+               lon: float = Query(..., ge=-180, le=180)):
+    result = sensor_index.interpolate(lat, lon)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="No active sensor covers this location")
 
     return {
-        "sensor_id": sensor_id,
-        "next_hour_AQI": round(forecast, 2),
-        "category": category
+        "latitude": lat,
+        "longitude": lon,
+        "aqi": round(result["aqi"], 2),
+        "category": get_category(result["aqi"]),
+        "sensors": result["sensors"]
+    }
+
+
+@app.get("/tiles/aqi/{z}/{x}/{y}.png")
+def get_aqi_tile(z: int, x: int, y: int, request: Request):
+    if not (0 <= z <= 18 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    _, png = heatmap.tile(z, x, y)
+    headers = {
+        # From the bytes, not the per-process raster version, so every
+        # worker agrees on it
+        "ETag": f'W/"aqi-{hashlib.blake2b(png, digest_size=8).hexdigest()}"',
+        "Cache-Control": f"public, max-age={int(HEATMAP_INTERVAL)}"
     }
 
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=png, media_type="image/png", headers=headers)
+
 
 # ==============================
 # Admin Sensor Management (Protected)
 # ==============================
-@app.get("/admin/sensors")
-def get_sensors(admin_id: int = Depends(get_current_admin)):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
+def _admin_sensor_rows(cursor):
+    execute(cursor, "admin_sensors", """
         SELECT id, sensor_code, region_id, latitude, longitude, radius, is_active
         FROM sensors
+        WHERE deleted_at IS NULL
         ORDER BY id
     """)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    return shard_rows(cursor, ADMIN_SENSOR_FIELDS)
+
+
+@app.get("/admin/sensors")
+def get_sensors(admin_id: int = Depends(get_current_admin)):
+    parts = scatter(_admin_sensor_rows)
+    return JSONBytesResponse(merge_rows(parts, ADMIN_SENSOR_FIELDS, key=lambda r: r[0]))
 
-    return [
-        {
-            "sensor_id": r[0],
-            "sensor_code": r[1],
-            "region_id": r[2],
-            "latitude": r[3],
-            "longitude": r[4],
-            "radius": r[5],
-            "is_active": r[6]
-        }
-        for r in rows
-    ]
+
+@app.get("/admin/sensors/health")
+def get_sensor_health(admin_id: int = Depends(get_current_admin)):
+    # Served from the in-memory heartbeat table; inactive sensors are left out
+    snap = sensor_index.snapshot()
+    active = snap.ids[snap.active].tolist()
+    heartbeats.seed((sensor_id, None) for sensor_id in active)
+
+    return heartbeats.report(active)
 
 
 @app.post("/admin/sensor")
@@ -413,64 +1196,32 @@ def add_sensor(
     payload: SensorCreate,
     admin_id: int = Depends(get_current_admin)
 ):
-    conn = get_connection()
+    shard = shard_for_region(payload.region_id)
+    if SHARDED and any(scatter(_code_taken, payload.sensor_code, shards=[s for s in SHARDS if s != shard])):
+        # The UNIQUE constraint only covers the region's own shard
+        raise HTTPException(status_code=400, detail="A sensor with this Identity Code already exists.")
+
+    conn = get_shard_connection(shard)
     cursor = conn.cursor()
 
     try:
         # Step 1: Insert Hardware Node
-        cursor.execute("""
+        execute(cursor, "sensor_insert", """
             INSERT INTO sensors (sensor_code, region_id, latitude, longitude, radius, is_active)
             VALUES (%s,%s,%s,%s,%s,TRUE)
             RETURNING id
         """, (payload.sensor_code, payload.region_id, payload.latitude, payload.longitude, payload.radius))
         new_sensor_id = cursor.fetchone()[0]
 
-        # Step 2: Auto-Generate Telemetry bounded to requested Environmental limits
-        import random
-        
-        # 1: Mumbai(high), 2: Pune(moderate), 3: Nagpur(good), 4: Nashik(good), 5: Aurangabad(high)
-        # 6: Kolhapur(good), 7: Solapur(very_high), 8: Chandrapur(severe), 9: Amravati(moderate), 10: Navi Mumbai(high).
-        # Matched broadly to the simulator mapping logic
-        region_levels = {
-            1: "high", 2: "moderate", 3: "good", 4: "good", 5: "high",
-            6: "good", 7: "very_high", 8: "severe", 9: "moderate", 10: "high"
-        }
-        
-        level_ranges = {
-            "good": (0, 50),
-            "low": (51, 100),
-            "moderate": (101, 200),
-            "high": (201, 300),
-            "very_high": (301, 400),
-            "severe": (401, 500)
-        }
-        
-        target_level = region_levels.get(payload.region_id, "moderate")
-        rng = level_ranges[target_level]
-        
-        generated_aqi = random.uniform(rng[0], rng[1])
-        pm25 = generated_aqi * 0.4
-        pm10 = generated_aqi * 0.6
-
-        # Step 3: Insert Initial Telemetry (sensor_readings)
-        cursor.execute("""
+        # Step 2: Insert Initial Telemetry bounded to the region's expected level
+        execute(cursor, "sensor_initial_reading", """
             INSERT INTO sensor_readings
-            (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+            (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category_code)
             VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        """, (
-            new_sensor_id,
-            pm25,
-            pm10,
-            15.0, # no2
-            0.5,  # co
-            5.0,  # so2
-            20.0, # o3
-            2.0,  # nh3
-            generated_aqi,
-            target_level
-        ))
+        """, provisioning.initial_reading(new_sensor_id, payload.region_id))
+        commit_and_publish(conn, cursor, shard, "sensors", **sensor_event([new_sensor_id]))
 
-        conn.commit()
+        on_sensors_changed([new_sensor_id])
         return {"message": "Sensor deployed successfully", "sensor_id": new_sensor_id}
     except psycopg2.errors.UniqueViolation:
         conn.rollback()
@@ -483,37 +1234,527 @@ def add_sensor(
         conn.close()
 
 
+@app.post("/admin/sensors/bulk")
+async def add_sensors_bulk(request: Request, admin_id: int = Depends(get_current_admin)):
+    body = await request.body()
+    try:
+        rows = provisioning.parse_rows(body, request.headers.get("content-type"))
+    except provisioning.BulkInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await run_in_threadpool(provision_sensors, rows)
+
+
+def _code_taken(cursor, sensor_code):
+    execute(cursor, "sensor_code_taken", "SELECT 1 FROM sensors WHERE sensor_code = %s", (sensor_code,))
+    return cursor.fetchone() is not None
+
+
+def provision_sensors(rows):
+    if SHARDED:
+        return provision_sensors_sharded(rows)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        # One transaction: invalid rows are reported and skipped, valid ones land together
+        created, errors = provisioning.provision(cursor, rows)
+        created_ids = [c["sensor_id"] for c in created]
+        if created:
+            events.publish(cursor, "sensors", **sensor_event(created_ids))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cursor.close()
+        conn.close()
+
+    if created:
+        on_sensors_changed(created_ids)
+
+    return {
+        "message": f"{len(created)} of {len(rows)} sensors deployed",
+        "created": created,
+        "errors": errors
+    }
+
+
+def provision_sensors_sharded(rows):
+    # Codes are checked against every shard, then each region shard gets
+    # its rows in one transaction of its own
+    valid, errors = provisioning.validate(rows)
+    created = []
+    try:
+        if valid:
+            found = scatter(provisioning.lookup, valid, readonly=True)
+            existing = set().union(*(codes for _, codes in found))
+            valid = provisioning.screen(valid, errors, found[0][0], existing)
+
+        by_shard = {}
+        for i, row in valid:
+            by_shard.setdefault(shard_for_region(row.region_id), []).append((i, row))
+        for shard, group in sorted(by_shard.items()):
+            created += write_shards([shard], provisioning.insert, group, errors)[0]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if created:
+            created_ids = [c["sensor_id"] for c in created]
+            events.publish_now("sensors", **sensor_event(created_ids))
+            on_sensors_changed(created_ids)
+
+    created.sort(key=lambda c: c["row"])
+    errors.sort(key=lambda e: e["row"])
+    return {
+        "message": f"{len(created)} of {len(rows)} sensors deployed",
+        "created": created,
+        "errors": errors
+    }
+
+
+def _set_status_bulk(cursor, payload):
+    if payload.sensor_ids is not None:
+        execute(cursor, "sensor_status_bulk_ids", """
+            UPDATE sensors
+            SET is_active = %s
+            WHERE id = ANY(%s) AND deleted_at IS NULL
+            RETURNING id
+        """, (payload.is_active, payload.sensor_ids))
+    else:
+        execute(cursor, "sensor_status_bulk_region", """
+            UPDATE sensors
+            SET is_active = %s
+            WHERE region_id = %s AND deleted_at IS NULL
+            RETURNING id
+        """, (payload.is_active, payload.region_id))
+    return [r[0] for r in cursor.fetchall()]
+
+
+@app.put("/admin/sensors/status")
+def update_status_bulk(payload: BulkStatusUpdate, admin_id: int = Depends(get_current_admin)):
+    if (payload.sensor_ids is None) == (payload.region_id is None):
+        raise HTTPException(status_code=400, detail="Give either sensor_ids or region_id")
+
+    if payload.sensor_ids is not None:
+        shards = sensor_shards(payload.sensor_ids)
+    else:
+        shards = [shard_for_region(payload.region_id)]
+    parts = write_shards(shards, _set_status_bulk, payload, event="sensors",
+                         event_fields=sensor_event([]))
+    updated = sorted(sensor_id for part in parts for sensor_id in part)
+
+    if updated:
+        on_sensors_changed([])
+
+    found = set(updated)
+    return {
+        "message": f"{len(updated)} sensors updated",
+        "updated": updated,
+        "errors": [
+            {"sensor_id": sensor_id, "error": "Sensor not found"}
+            for sensor_id in dict.fromkeys(payload.sensor_ids or [])
+            if sensor_id not in found
+        ]
+    }
+
+
 @app.put("/admin/sensor/{sensor_id}/status")
 def update_status(sensor_id: int, is_active: bool,
                   admin_id: int = Depends(get_current_admin)):
-    conn = get_connection()
+    shard = sensor_shard(sensor_id)
+    conn = get_shard_connection(shard)
     cursor = conn.cursor()
 
-    cursor.execute("""
+    execute(cursor, "sensor_status_update", """
         UPDATE sensors
         SET is_active = %s
-        WHERE id = %s
+        WHERE id = %s AND deleted_at IS NULL
     """, (is_active, sensor_id))
+    commit_and_publish(conn, cursor, shard, "sensors", **sensor_event([]))
 
-    conn.commit()
     cursor.close()
     conn.close()
 
+    on_sensors_changed([])
+
     return {"message": "Status updated"}
 
 
+DECOMMISSION_JOB_FIELDS = [
+    ("job_id", None), ("sensor_id", None), ("status", None), ("rows_deleted", None),
+    ("error", None), ("created_at", None), ("updated_at", None), ("finished_at", None)
+]
+
+
 @app.delete("/admin/sensor/{sensor_id}")
 def delete_sensor(sensor_id: int,
                   admin_id: int = Depends(get_current_admin)):
+    # Jobs live on the primary, the sensor on its region shard (often the same)
+    shard = sensor_shard(sensor_id)
     conn = get_connection()
     cursor = conn.cursor()
+    data = conn if shard == 0 else get_shard_connection(shard)
+    data_cursor = cursor if data is conn else data.cursor()
+
+    try:
+        # Hide the sensor now; its readings are removed in batches by the decommission worker
+        execute(data_cursor, "sensor_decommission", """
+            UPDATE sensors
+            SET deleted_at = CURRENT_TIMESTAMP, is_active = FALSE
+            WHERE id = %s AND deleted_at IS NULL
+        """, (sensor_id,))
+
+        if data_cursor.rowcount:
+            job_id = _insert_decommission_job(cursor, sensor_id, shard, admin_id)
+            events.publish(cursor, "sensors", **sensor_event([sensor_id]))
+        else:
+            # Already decommissioned: hand back its job, re-queued if it had failed
+            execute(cursor, "decommission_job_retry", """
+                UPDATE decommission_jobs
+                SET status = CASE WHEN status = 'failed' THEN 'pending' ELSE status END
+                WHERE id = (SELECT MAX(id) FROM decommission_jobs WHERE sensor_id = %s)
+                RETURNING id
+            """, (sensor_id,))
+            row = cursor.fetchone()
+            if row is None and data is not conn and _holds_sensor(data_cursor, sensor_id):
+                # Hidden on its shard by a request whose job insert never committed
+                row = (_insert_decommission_job(cursor, sensor_id, shard, admin_id),)
+            if row is None:
+                conn.rollback()
+                raise HTTPException(status_code=404, detail="Sensor not found")
+            job_id = row[0]
+
+        # Shard first: a job without a hidden sensor would delete a live one
+        if data is not conn:
+            data.commit()
+        conn.commit()
+    finally:
+        if data is not conn:
+            data_cursor.close()
+            data.close()
+        cursor.close()
+        conn.close()
+
+    on_sensors_changed([sensor_id])
+    decommission.wake()
+
+    return {"message": "Sensor decommissioned", "job_id": job_id}
+
+
+def _insert_decommission_job(cursor, sensor_id, shard, admin_id):
+    execute(cursor, "decommission_job_insert", """
+        INSERT INTO decommission_jobs (sensor_id, shard, requested_by)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    """, (sensor_id, shard, admin_id))
+    return cursor.fetchone()[0]
+
+
+@app.get("/admin/decommission-jobs")
+def get_decommission_jobs(job_id: int = None, limit: int = 50,
+                          admin_id: int = Depends(get_current_admin)):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    job_filter = "WHERE id = %s" if job_id is not None else ""
+    params = (job_id, limit) if job_id is not None else (limit,)
+    execute(cursor, "decommission_jobs", f"""
+        SELECT id, sensor_id, status, rows_deleted, error, created_at, updated_at, finished_at
+        FROM decommission_jobs
+        {job_filter}
+        ORDER BY id DESC
+        LIMIT %s
+    """, params)
+
+    body = dump_rows(cursor, DECOMMISSION_JOB_FIELDS)
+    cursor.close()
+    conn.close()
+
+    return JSONBytesResponse(body)
+
+
+# ==============================
+# Data Export (Protected)
+# ==============================
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+@app.get("/export/readings")
+def export_readings(fmt: str = Query("csv", alias="format"), sensor_id: int = None,
+                    region_id: int = None, start: datetime = None, end: datetime = None,
+                    admin_id: int = Depends(get_current_admin)):
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    query, params = export.build_query(sensor_id, region_id, start, end)
+    if region_id is not None:
+        shards = [shard_for_region(region_id)]
+    elif sensor_id is not None:
+        shards = [sensor_shard(sensor_id)]
+    else:
+        shards = SHARDS
+
+    return StreamingResponse(
+        export.stream_readings(fmt, query, params, shards),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="readings.{fmt}"'}
+    )
+
+
+# ==============================
+# Alerts (Protected)
+# ==============================
+ALERT_RULE_FIELDS = [
+    ("id", None), ("name", None), ("scope", None), ("target_id", None), ("metric", None),
+    ("window", None), ("threshold", None), ("clear_threshold", None), ("consecutive", None),
+    ("is_active", None)
+]
+
+ALERT_FIELDS = [
+    ("id", None), ("rule_id", None), ("rule", None), ("scope", None), ("subject_id", None),
+    ("sensor_id", None), ("value", None), ("triggered_at", None), ("resolved_at", None)
+]
+
+
+@app.get("/admin/alerts/rules")
+def get_alert_rules(admin_id: int = Depends(get_current_admin)):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    execute(cursor, "alert_rules", """
+        SELECT id, name, scope, target_id, metric, time_window,
+               threshold, clear_threshold, consecutive, is_active
+        FROM alert_rules
+        ORDER BY id
+    """)
+
+    body = dump_rows(cursor, ALERT_RULE_FIELDS)
+    cursor.close()
+    conn.close()
+
+    return JSONBytesResponse(body)
+
+
+@app.post("/admin/alerts/rules")
+def add_alert_rule(payload: AlertRuleCreate, admin_id: int = Depends(get_current_admin)):
+    if payload.scope not in alerts.SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(alerts.SCOPES)}")
+    if payload.metric not in alerts.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(alerts.METRICS)}")
+    if payload.window not in alerts.RULE_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(alerts.RULE_WINDOWS)}")
+    if payload.window != "reading" and payload.metric != "aqi":
+        raise HTTPException(status_code=400, detail="Rolling windows are only kept for aqi")
+    if payload.consecutive < 1:
+        raise HTTPException(status_code=400, detail="consecutive must be at least 1")
+    if payload.clear_threshold is not None and payload.clear_threshold > payload.threshold:
+        raise HTTPException(status_code=400, detail="clear_threshold cannot exceed threshold")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    execute(cursor, "alert_rule_insert", """
+        INSERT INTO alert_rules
+        (name, scope, target_id, metric, time_window, threshold, clear_threshold, consecutive, created_by)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        RETURNING id
+    """, (
+        payload.name, payload.scope, payload.target_id, payload.metric, payload.window,
+        payload.threshold, payload.clear_threshold, payload.consecutive, admin_id
+    ))
+    rule_id = cursor.fetchone()[0]
+    events.publish(cursor, "alert_rules")
 
-    # Explicitly clear child dependencies manually to fulfill Foreign Key constraints
-    cursor.execute("DELETE FROM sensor_readings WHERE sensor_id = %s", (sensor_id,))
-    cursor.execute("DELETE FROM sensors WHERE id = %s", (sensor_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    alerts.engine.invalidate()
+
+    return {"message": "Alert rule created", "rule_id": rule_id}
+
+
+@app.delete("/admin/alerts/rules/{rule_id}")
+def delete_alert_rule(rule_id: int, admin_id: int = Depends(get_current_admin)):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    execute(cursor, "alert_rule_delete", "DELETE FROM alert_rules WHERE id = %s", (rule_id,))
+    deleted = cursor.rowcount
+    if deleted:
+        events.publish(cursor, "alert_rules")
     conn.commit()
 
     cursor.close()
     conn.close()
 
-    return {"message": "Sensor deleted"}
\ No newline at end of file
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+
+    alerts.engine.invalidate()
+
+    return {"message": "Alert rule deleted"}
+
+
+@app.get("/admin/alerts")
+def get_alerts(open_only: bool = False, limit: int = 100,
+               admin_id: int = Depends(get_current_admin)):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    execute(cursor, "alerts_list", """
+        SELECT a.id, a.rule_id, r.name, r.scope, a.subject_id, a.sensor_id, a.value,
+               a.triggered_at, a.resolved_at
+        FROM alerts a
+        JOIN alert_rules r ON r.id = a.rule_id
+        WHERE NOT %s OR a.resolved_at IS NULL
+        ORDER BY a.triggered_at DESC
+        LIMIT %s
+    """, (open_only, min(max(limit, 1), 1000)))
+
+    body = dump_rows(cursor, ALERT_FIELDS)
+    cursor.close()
+    conn.close()
+
+    return JSONBytesResponse(body)
+
+
+# ==============================
+# Model Management (Protected)
+# ==============================
+@app.post("/admin/models/reload")
+def reload_models(admin_id: int = Depends(get_current_admin)):
+    # Load here first so a broken model file never reaches the other workers
+    try:
+        load_models()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {e}")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    event = events.publish(cursor, "models")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    return {"message": "Models reloaded", "version": event["v"] if event else None}
+
+
+# ==============================
+# Diagnostics (Protected)
+# ==============================
+@app.get("/admin/slow-queries")
+def get_slow_queries(limit: int = 20, admin_id: int = Depends(get_current_admin)):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Worst captured plans first; plans are only sampled, offenders cover every slow run
+    execute(cursor, "slow_query_plans", """
+        SELECT query_name, duration_ms, params, plan, captured_at
+        FROM slow_query_plans
+        ORDER BY duration_ms DESC
+        LIMIT %s
+    """, (limit,))
+
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    return {
+        "enabled": query_trace.ENABLED,
+        "threshold_ms": query_trace.SLOW_QUERY_MS,
+        "offenders": query_trace.worst_offenders(limit),
+        "plans": [
+            {
+                "query": r[0],
+                "duration_ms": r[1],
+                "params": r[2],
+                "plan": r[3],
+                "captured_at": r[4]
+            }
+            for r in rows
+        ]
+    }
+
+
+# Async endpoint -> the functions it runs in the threadpool or the bcrypt pool
+THREAD_SIDE = {
+    predict: (ingest_reading,),
+    add_sensors_bulk: (provision_sensors,),
+    login_admin: (admin_credentials, verify_password),
+    register_admin: (hash_password, create_admin),
+}
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def profile_process(seconds: float = 10, interval_ms: float = 5,
+                    route: str = None, include_idle: bool = False,
+                    admin_id: int = Depends(get_current_admin)):
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 60")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+
+    # Scope to one route by keeping only stacks that pass through its endpoint.
+    # Async endpoints never show up on a thread's stack, so those are matched
+    # by the functions they hand to a pool instead
+    scope_codes = None
+    if route:
+        endpoint = next(
+            (r.endpoint for r in app.routes
+             if getattr(r, "path", None) == route and hasattr(r, "endpoint")),
+            None
+        )
+        if endpoint is None:
+            raise HTTPException(status_code=404, detail="Unknown route")
+        if endpoint in THREAD_SIDE:
+            scope_codes = {fn.__code__ for fn in THREAD_SIDE[endpoint]}
+        elif asyncio.iscoroutinefunction(endpoint):
+            raise HTTPException(status_code=400, detail="Route runs on the event loop and can't be scoped")
+        else:
+            scope_codes = {endpoint.__code__}
+
+    try:
+        return profiler.collect(seconds, interval_ms / 1000, scope_codes, include_idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+
+# ==============================
+# Background Tasks
+# ==============================
+def run_in_background(name, target, *args):
+    def runner():
+        try:
+            target(*args)
+        except Exception:
+            logger.exception("Background task %s failed", name)
+
+    thread = threading.Thread(target=runner, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def start_background_tasks():
+    if AGGREGATES_WARMUP:
+        # Every shard's cutoff is read here, before the event listener
+        # starts and before any request is served
+        try:
+            cutoffs = scatter(latest_reading_id)
+        except Exception:
+            logger.exception("Could not read warm-up cutoffs, rolling aggregates start empty")
+        else:
+            run_in_background("aggregates-warmup", aggregates.warm_up, sensor_index.region_of, cutoffs)
+    run_in_background("heartbeat-monitor", heartbeat_monitor)
+    run_in_background("decommission-worker", decommission.worker)
+    run_in_background("sketch-flush", sketches.recorder.run)
+    run_in_background("alert-owners", alerts.engine.run)
+    if events.ENABLED:
+        for shard in SHARDS:
+            run_in_background(f"event-listener-{shard}", events.listen_forever, shard)
\ No newline at end of file
@@ -0,0 +1,128 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# ==============================
+# Metric Definitions
+# ==============================
+# Labels are kept to route templates and logical query names so the
+# series count stays bounded no matter how many sensors call in.
+REQUEST_LATENCY = Histogram(
+    "airinsight_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "airinsight_requests_in_flight",
+    "HTTP requests currently being served"
+)
+
+DB_QUERY_LATENCY = Histogram(
+    "airinsight_db_query_duration_seconds",
+    "Database query latency by logical query name",
+    ["query"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+DB_QUERY_ERRORS = Counter(
+    "airinsight_db_query_errors_total",
+    "Database queries that raised",
+    ["query"]
+)
+
+DB_CONNECT_LATENCY = Histogram(
+    "airinsight_db_connect_duration_seconds",
+    "Time spent in get_connection",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+DB_READ_ROUTES = Counter(
+    "airinsight_db_read_connections_total",
+    "Read-only connections by where they were served from",
+    ["target"]
+)
+
+DB_REPLICA_EJECTIONS = Counter(
+    "airinsight_db_replica_ejections_total",
+    "Replicas taken out of rotation after a failed connect or probe"
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "airinsight_admission_rejections_total",
+    "Ingestion requests shed with 429 by admission control",
+    ["reason"]
+)
+
+ADMISSION_WAITING = Gauge(
+    "airinsight_admission_queue_depth",
+    "Ingestion requests waiting for a concurrency slot"
+)
+
+MODEL_PREDICT_LATENCY = Histogram(
+    "airinsight_model_predict_duration_seconds",
+    "Model predict latency",
+    ["model"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+
+MODEL_BATCH_SIZE = Histogram(
+    "airinsight_model_batch_size",
+    "Rows per model predict call",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096)
+)
+
+
+# ==============================
+# Helpers
+# ==============================
+def timed_predict(name, estimator, features):
+    start = time.perf_counter()
+    result = estimator.predict(features)
+    MODEL_PREDICT_LATENCY.labels(name).observe(time.perf_counter() - start)
+    MODEL_BATCH_SIZE.labels(name).observe(len(features))
+    return result
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# ==============================
+# ASGI Middleware
+# ==============================
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware body buffering) that
+    records per-route latency and the in-flight gauge.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # FastAPI writes the matched route into the scope; unmatched
+            # paths are folded into one label to keep cardinality bounded
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status["code"])
+            ).observe(time.perf_counter() - start)
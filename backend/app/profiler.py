@@ -0,0 +1,75 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf functions of threads parked on a lock, queue or socket
+IDLE_LEAVES = {"wait", "select", "poll", "epoll", "acquire", "_wait_for_tstate_lock", "accept"}
+
+# "ThreadPoolExecutor-0_1" / "asyncio-portal-7f45..." -> one bucket per pool
+THREAD_SUFFIX = re.compile(r"(?:[-_](?:0x)?[0-9a-f]+)+$")
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collect(seconds, interval, scope_codes=None, include_idle=False):
+    """
+    Sample the stacks of every other thread in the process for `seconds`
+    and return them in collapsed-stack format ("root;...;leaf count"),
+    which flamegraph.pl and speedscope read directly.
+
+    When scope_codes is given only stacks that pass through one of those
+    code objects (a route's endpoint, or the functions an async endpoint
+    runs in a pool) are kept.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+
+    try:
+        me = threading.get_ident()
+        names = {}
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+
+                if not include_idle and frame.f_code.co_name in IDLE_LEAVES:
+                    continue
+
+                stack = []
+                in_scope = scope_codes is None
+                while frame is not None:
+                    if not in_scope and frame.f_code in scope_codes:
+                        in_scope = True
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+
+                if not in_scope:
+                    continue
+
+                if thread_id not in names:
+                    names = {
+                        t.ident: THREAD_SUFFIX.sub("", t.name)
+                        for t in threading.enumerate()
+                    }
+                stack.append(names.get(thread_id, str(thread_id)))
+                counts[";".join(reversed(stack))] += 1
+
+            time.sleep(interval)
+    finally:
+        _busy.release()
+
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
@@ -0,0 +1,236 @@
+import csv
+import io
+import os
+import random
+import orjson
+from pydantic import BaseModel, ValidationError
+from app.db import execute, execute_values
+from app.readings import category_code, stored
+
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "5000"))
+
+CSV_COLUMNS = ("sensor_code", "region_id", "latitude", "longitude", "radius")
+
+
+class SensorRow(BaseModel):
+    sensor_code: str
+    region_id: int
+    latitude: float
+    longitude: float
+    radius: int
+
+
+# ==============================
+# Initial Telemetry
+# ==============================
+# 1: Mumbai(high), 2: Pune(moderate), 3: Nagpur(good), 4: Nashik(good), 5: Aurangabad(high)
+# 6: Kolhapur(good), 7: Solapur(very_high), 8: Chandrapur(severe), 9: Amravati(moderate), 10: Navi Mumbai(high).
+# Matched broadly to the simulator mapping logic
+REGION_LEVELS = {
+    1: "high", 2: "moderate", 3: "good", 4: "good", 5: "high",
+    6: "good", 7: "very_high", 8: "severe", 9: "moderate", 10: "high"
+}
+
+LEVEL_RANGES = {
+    "good": (0, 50),
+    "low": (51, 100),
+    "moderate": (101, 200),
+    "high": (201, 300),
+    "very_high": (301, 400),
+    "severe": (401, 500)
+}
+
+
+def initial_reading(sensor_id, region_id):
+    """
+    Seed telemetry for a new sensor bounded to its region's expected level,
+    as a sensor_readings row (sensor_id, pm25, pm10, no2, co, so2, o3, nh3,
+    predicted_aqi, category_code).
+    """
+    target_level = REGION_LEVELS.get(region_id, "moderate")
+    low, high = LEVEL_RANGES[target_level]
+
+    generated_aqi = random.uniform(low, high)
+    return (
+        sensor_id,
+        stored(generated_aqi * 0.4),  # pm25
+        stored(generated_aqi * 0.6),  # pm10
+        15.0,  # no2
+        0.5,   # co
+        5.0,   # so2
+        20.0,  # o3
+        2.0,   # nh3
+        stored(generated_aqi),
+        category_code(generated_aqi)
+    )
+
+
+# ==============================
+# Bulk Provisioning
+# ==============================
+class BulkInputError(ValueError):
+    pass
+
+
+# DictReader key for the fields of a CSV row longer than the header
+EXTRA_FIELDS = "__extra__"
+
+
+def parse_rows(body, content_type):
+    """
+    Raw request rows from a CSV body (header row required) or a JSON array.
+    """
+    if "csv" in (content_type or ""):
+        try:
+            text = body.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise BulkInputError("CSV must be UTF-8 encoded")
+        # Fields past the header land under EXTRA_FIELDS and fail that row
+        reader = csv.DictReader(io.StringIO(text), restkey=EXTRA_FIELDS)
+        missing = set(CSV_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise BulkInputError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        rows = list(reader)
+    else:
+        try:
+            rows = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise BulkInputError("Body must be a JSON array or CSV")
+        if isinstance(rows, dict):
+            rows = rows.get("sensors")
+        if not isinstance(rows, list):
+            raise BulkInputError("Expected a JSON array of sensors")
+
+    if not rows:
+        raise BulkInputError("No sensors given")
+    if len(rows) > BULK_MAX_ROWS:
+        raise BulkInputError(f"At most {BULK_MAX_ROWS} sensors per request")
+    return rows
+
+
+def _field_errors(exc):
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors())
+
+
+def provision(cursor, raw_rows):
+    """
+    Validate every row up front, then create all valid sensors and their
+    seed readings with two multi-row statements. Invalid rows are reported
+    and skipped instead of aborting the batch. Returns (created, errors).
+    """
+    valid, errors = validate(raw_rows)
+    if valid:
+        valid = screen(valid, errors, *lookup(cursor, valid))
+    created = insert(cursor, valid, errors) if valid else []
+
+    errors.sort(key=lambda e: e["row"])
+    return created, errors
+
+
+def validate(raw_rows):
+    """
+    The checks that need no database. Returns (valid, errors), valid being
+    (row number, SensorRow) pairs.
+    """
+    errors = []
+    valid = []
+    seen_codes = set()
+
+    for i, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            errors.append({"row": i, "sensor_code": None, "error": "Row must be an object"})
+            continue
+        if EXTRA_FIELDS in raw:
+            errors.append({"row": i, "sensor_code": raw.get("sensor_code"),
+                           "error": "Row has more fields than the header"})
+            continue
+        try:
+            row = SensorRow(**raw)
+        except ValidationError as e:
+            errors.append({"row": i, "sensor_code": raw.get("sensor_code"), "error": _field_errors(e)})
+            continue
+        except (TypeError, ValueError) as e:
+            errors.append({"row": i, "sensor_code": raw.get("sensor_code"), "error": str(e)})
+            continue
+
+        code = row.sensor_code.strip()
+        if not code:
+            problem = "sensor_code is empty"
+        elif code in seen_codes:
+            problem = "Duplicate sensor_code in this batch"
+        elif not (-90 <= row.latitude <= 90 and -180 <= row.longitude <= 180):
+            problem = "Coordinates out of range"
+        elif row.radius <= 0:
+            problem = "radius must be positive"
+        else:
+            problem = None
+
+        if problem:
+            errors.append({"row": i, "sensor_code": code, "error": problem})
+            continue
+        seen_codes.add(code)
+        row.sensor_code = code
+        valid.append((i, row))
+
+    return valid, errors
+
+
+def lookup(cursor, valid):
+    """
+    (known region ids, sensor codes already taken) among the valid rows,
+    from one database; with region shards, union the codes of every shard.
+    """
+    execute(cursor, "bulk_regions", "SELECT id FROM regions WHERE id = ANY(%s)",
+            (sorted({row.region_id for _, row in valid}),))
+    regions = {r[0] for r in cursor.fetchall()}
+
+    execute(cursor, "bulk_existing_codes", "SELECT sensor_code FROM sensors WHERE sensor_code = ANY(%s)",
+            ([row.sensor_code for _, row in valid],))
+    existing = {r[0] for r in cursor.fetchall()}
+    return regions, existing
+
+
+def screen(valid, errors, regions, existing):
+    checked = []
+    for i, row in valid:
+        if row.region_id not in regions:
+            errors.append({"row": i, "sensor_code": row.sensor_code, "error": "Unknown region_id"})
+        elif row.sensor_code in existing:
+            errors.append({"row": i, "sensor_code": row.sensor_code, "error": "sensor_code already exists"})
+        else:
+            checked.append((i, row))
+    return checked
+
+
+def insert(cursor, valid, errors):
+    """
+    Create the screened sensors and their seed readings; returns the
+    created entries and appends codes lost to a concurrent insert to errors.
+    """
+    # ON CONFLICT covers codes inserted concurrently after the pre-check
+    inserted = execute_values(cursor, "bulk_sensor_insert", """
+        INSERT INTO sensors (sensor_code, region_id, latitude, longitude, radius, is_active)
+        VALUES %s
+        ON CONFLICT (sensor_code) DO NOTHING
+        RETURNING id, sensor_code, region_id
+    """, [
+        (row.sensor_code, row.region_id, row.latitude, row.longitude, row.radius, True)
+        for _, row in valid
+    ], fetch=True)
+    ids = {code: (sensor_id, region_id) for sensor_id, code, region_id in inserted}
+
+    created = []
+    for i, row in valid:
+        if row.sensor_code in ids:
+            created.append({"row": i, "sensor_id": ids[row.sensor_code][0], "sensor_code": row.sensor_code})
+        else:
+            errors.append({"row": i, "sensor_code": row.sensor_code, "error": "sensor_code already exists"})
+
+    if ids:
+        execute_values(cursor, "bulk_initial_readings", """
+            INSERT INTO sensor_readings
+            (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category_code)
+            VALUES %s
+        """, [initial_reading(sensor_id, region_id) for sensor_id, region_id in ids.values()])
+
+    return created
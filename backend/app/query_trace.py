@@ -0,0 +1,120 @@
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Config (opt-in)
+# ==============================
+ENABLED = os.getenv("QUERY_TRACE_ENABLED", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("QUERY_SLOW_MS", "200"))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+MAX_PENDING_PLANS = int(os.getenv("QUERY_MAX_PENDING_PLANS", "4"))
+
+# Queries whose parameters must never reach logs or the plans table
+REDACTED_QUERIES = {"admin_register"}
+
+_stats = {}
+_stats_lock = threading.Lock()
+_pending = 0
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+
+def _format_params(name, params):
+    if params is None:
+        return None
+    if name in REDACTED_QUERIES:
+        return "<redacted>"
+    return repr(params)
+
+
+def record(name, query, params, seconds, shard=0):
+    """
+    Called by db.execute() for every query when tracing is enabled.
+    Fast queries return immediately; slow ones are logged, folded into the
+    per-name offender stats and, for a sampled fraction of read queries,
+    re-run under EXPLAIN (ANALYZE, BUFFERS) on a background thread, on the
+    shard the query ran on.
+    """
+    global _pending
+
+    duration_ms = seconds * 1000
+    if duration_ms < SLOW_QUERY_MS:
+        return
+
+    shown_params = _format_params(name, params)
+    logger.warning("Slow query %s took %.1f ms params=%s", name, duration_ms, shown_params)
+
+    with _stats_lock:
+        entry = _stats.setdefault(name, {
+            "query": name, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_params": None
+        })
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+        if duration_ms >= entry["max_ms"]:
+            entry["max_ms"] = duration_ms
+            entry["last_params"] = shown_params
+
+        # ANALYZE executes the statement, so only plain reads are re-run
+        sample = (
+            random.random() < EXPLAIN_SAMPLE_RATE
+            and query.lstrip().upper().startswith("SELECT")
+            and _pending < MAX_PENDING_PLANS
+        )
+        if sample:
+            _pending += 1
+
+    if sample:
+        _executor.submit(_capture_plan, name, query, params, duration_ms, shown_params, shard)
+
+
+def _capture_plan(name, query, params, duration_ms, shown_params, shard=0):
+    global _pending
+
+    from app.db import get_connection, get_shard_connection
+
+    conn = None
+    try:
+        # The plan comes from the shard's own data and statistics
+        explain = get_shard_connection(shard)
+        try:
+            explain.set_session(readonly=True)
+            with explain.cursor() as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                plan = "\n".join(r[0] for r in cursor.fetchall())
+            explain.rollback()
+        finally:
+            explain.close()
+
+        # Plans are kept on the primary
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO slow_query_plans (query_name, duration_ms, params, plan)
+            VALUES (%s, %s, %s, %s)
+        """, (name, duration_ms, shown_params, plan))
+        conn.commit()
+        cursor.close()
+    except Exception as e:
+        logger.warning("Could not capture plan for %s: %s", name, e)
+    finally:
+        if conn is not None:
+            conn.close()
+        with _stats_lock:
+            _pending -= 1
+
+
+def worst_offenders(limit=20):
+    with _stats_lock:
+        entries = [
+            {**e, "avg_ms": e["total_ms"] / e["count"]}
+            for e in _stats.values()
+        ]
+    entries.sort(key=lambda e: e["max_ms"], reverse=True)
+    return entries[:limit]
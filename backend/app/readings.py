@@ -0,0 +1,49 @@
+# ==============================
+# sensor_readings Storage Layout
+# ==============================
+# Pollutants and AQI are REAL rounded to 2 decimals on write, which is what
+# the old DECIMAL(10, 2) columns kept; REAL prints them back exactly.
+# The category is a SMALLINT index into CATEGORIES: append only, never
+# reorder, stored codes depend on it.
+CATEGORIES = ("Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe")
+CATEGORY_BOUNDS = (50, 100, 200, 300, 400)
+
+# Seed scripts used to write the band names instead of labels
+LEGACY_LABELS = {
+    "good": "Good", "low": "Satisfactory", "moderate": "Moderate",
+    "high": "Poor", "very_high": "Very Poor", "severe": "Severe"
+}
+
+_CODES = {label: code for code, label in enumerate(CATEGORIES)}
+
+
+def category_code(aqi):
+    for code, bound in enumerate(CATEGORY_BOUNDS):
+        if aqi <= bound:
+            return code
+    return len(CATEGORY_BOUNDS)
+
+
+def get_category(aqi):
+    return CATEGORIES[category_code(aqi)]
+
+
+def code_of_label(label):
+    return _CODES.get(LEGACY_LABELS.get(label, label))
+
+
+def category_label(code):
+    return CATEGORIES[code] if code is not None else None
+
+
+def category_sql(column):
+    """
+    SQL expression for the label of a category_code column, for queries
+    that stream rows straight out (exports).
+    """
+    labels = ", ".join(f"'{label}'" for label in CATEGORIES)
+    return f"(ARRAY[{labels}])[{column} + 1]"
+
+
+def stored(value):
+    return round(value, 2) if value is not None else None
@@ -0,0 +1,111 @@
+import orjson
+from fastapi import Response
+from app.db import SHARDED
+
+# Rows pulled from the cursor and encoded per orjson call
+FETCH_SIZE = 500
+
+
+class JSONBytesResponse(Response):
+    """
+    Response for bodies that are already JSON-encoded bytes, so FastAPI's
+    jsonable_encoder never walks them.
+    """
+    media_type = "application/json"
+
+
+def dump(value):
+    return orjson.dumps(value)
+
+
+def iter_dict_batches(cursor, fields):
+    """
+    Yield the remaining rows of an executed cursor as lists of dicts, at
+    most FETCH_SIZE at a time. `fields` is a list of (key, convert) pairs in
+    column order, where convert is None or a callable applied to that column.
+    """
+    return _dict_batches(iter(lambda: cursor.fetchmany(FETCH_SIZE), []), fields)
+
+
+def _row_batches(rows):
+    for start in range(0, len(rows), FETCH_SIZE):
+        yield rows[start:start + FETCH_SIZE]
+
+
+def _dict_batches(batches, fields):
+    keys = [key for key, _ in fields]
+    converters = [(i, convert) for i, (_, convert) in enumerate(fields) if convert is not None]
+
+    for rows in batches:
+        if converters:
+            batch = []
+            for row in rows:
+                row = list(row)
+                for i, convert in converters:
+                    row[i] = convert(row[i])
+                batch.append(dict(zip(keys, row)))
+        else:
+            batch = [dict(zip(keys, row)) for row in rows]
+
+        yield batch
+
+
+def dump_rows(cursor, fields):
+    """
+    Encode the remaining rows of an executed cursor as a JSON array of
+    objects, one batch at a time so only FETCH_SIZE Python tuples and dicts
+    are alive at once.
+    """
+    return _dump_batches(iter_dict_batches(cursor, fields))
+
+
+def rows_to_dicts(rows, fields):
+    """
+    Rows already fetched (e.g. merged from several shards) as a list of
+    dicts, with the fields' converters applied.
+    """
+    return [item for batch in _dict_batches(_row_batches(rows), fields) for item in batch]
+
+
+def dump_fetched(rows, fields):
+    """
+    dump_rows() for rows already fetched (e.g. merged from several shards).
+    """
+    return _dump_batches(_dict_batches(_row_batches(rows), fields))
+
+
+def shard_rows(cursor, fields):
+    # One shard's rows: encoded straight off the cursor when it is the only
+    # shard, fetched for merge_rows() otherwise
+    return cursor.fetchall() if SHARDED else dump_rows(cursor, fields)
+
+
+def merge_rows(parts, fields, key=None, reverse=False, limit=None):
+    """
+    One JSON array from the shard_rows() of each shard read, re-sorted by
+    `key` and cut to `limit` as the single-database query would have been.
+    """
+    if not SHARDED:
+        return parts[0]
+
+    rows = [row for part in parts for row in part]
+    if key is not None:
+        rows.sort(key=key, reverse=reverse)
+    return dump_fetched(rows[:limit], fields)
+
+
+def _dump_batches(batches):
+    # Strip each batch's enclosing brackets so they join into one array
+    chunks = [orjson.dumps(batch)[1:-1] for batch in batches]
+    return b"[" + b",".join(chunks) + b"]"
+
+
+# ==============================
+# Column Converters
+# ==============================
+def float_or(default):
+    return lambda value: float(value) if value is not None else default
+
+
+def default_to(default):
+    return lambda value: value if value is not None else default
@@ -0,0 +1,279 @@
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from app.db import get_connection, execute, execute_values, gather_rows
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Sketch Layout
+# ==============================
+# DDSketch-style log buckets. A quantile read from a sketch (or any merge of
+# sketches) is within RELATIVE_ACCURACY of the true value for AQI >= 1;
+# smaller values are counted together and report as 0. Changing either
+# constant invalidates every persisted sketch.
+RELATIVE_ACCURACY = 0.01
+MAX_VALUE = 10000.0
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Slot 0 counts values below 1; slot k >= 1 counts (GAMMA^(k-2), GAMMA^(k-1)]
+N_SLOTS = int(math.ceil(math.log(MAX_VALUE) / LOG_GAMMA)) + 2
+SLOT_VALUES = np.concatenate([[0.0], 2 * GAMMA ** np.arange(N_SLOTS - 1) / (GAMMA + 1)])
+
+# Hourly sketches are the unit of ingestion; daily ones are rolled up from
+# the same deltas so long ranges read one row per day
+PERIODS = {"hour": 3600, "day": 86400}
+
+FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "60"))
+
+# Serializes read-merge-write of sketch rows across workers
+ADVISORY_LOCK_CLASS = 4047
+
+
+def slot_of(value):
+    if value < 1.0:
+        return 0
+    return int(math.ceil(math.log(min(value, MAX_VALUE)) / LOG_GAMMA)) + 1
+
+
+def empty():
+    return np.zeros(N_SLOTS, dtype=np.int64)
+
+
+def encode(counts):
+    """
+    Nonzero span of the counts as little-endian uint32, zlib-compressed.
+    An hour of one sensor is typically a few dozen bytes.
+    """
+    nonzero = np.flatnonzero(counts)
+    if len(nonzero) == 0:
+        return zlib.compress(struct.pack("<HH", 0, 0))
+    lo, hi = int(nonzero[0]), int(nonzero[-1]) + 1
+    return zlib.compress(struct.pack("<HH", lo, hi - lo) + counts[lo:hi].astype("<u4").tobytes())
+
+
+def decode(blob):
+    raw = zlib.decompress(blob)
+    lo, n = struct.unpack_from("<HH", raw)
+    counts = empty()
+    counts[lo:lo + n] = np.frombuffer(raw, dtype="<u4", count=n, offset=4)
+    return counts
+
+
+def quantiles(counts, qs):
+    """
+    Values at the given quantiles (0..1) of a sketch, None when empty.
+    """
+    total = counts.sum()
+    if not total:
+        return [None] * len(qs)
+    ranks = np.asarray(qs, dtype=float) * (total - 1)
+    return SLOT_VALUES[np.searchsorted(np.cumsum(counts), ranks, side="right")].tolist()
+
+
+# ==============================
+# Storage
+# ==============================
+def write(cursor, sketches, replace=False):
+    """
+    Merge {(scope, target_id, period, bucket_epoch): counts} into
+    aqi_sketches, or overwrite the rows when replace is set. Runs under a
+    transaction-level advisory lock; the caller commits.
+    """
+    execute(cursor, "sketch_lock", "SELECT pg_advisory_xact_lock(%s)", (ADVISORY_LOCK_CLASS,))
+    merged = {key: counts for key, counts in sketches.items()}
+
+    if not replace:
+        existing = execute_values(cursor, "sketch_existing", """
+            SELECT s.scope, s.target_id, s.period, EXTRACT(EPOCH FROM s.bucket_start)::bigint, s.sketch
+            FROM aqi_sketches s
+            JOIN (VALUES %s) AS k(scope, target_id, period, bucket_start)
+              ON s.scope = k.scope
+             AND s.target_id = k.target_id
+             AND s.period = k.period
+             AND s.bucket_start = to_timestamp(k.bucket_start)
+        """, list(merged), fetch=True)
+        for scope, target_id, period, bucket, blob in existing:
+            key = (scope, target_id, period, bucket)
+            merged[key] = merged[key] + decode(blob)
+
+    execute_values(cursor, "sketch_upsert", """
+        INSERT INTO aqi_sketches (scope, target_id, period, bucket_start, readings, sketch)
+        VALUES %s
+        ON CONFLICT (scope, target_id, period, bucket_start)
+        DO UPDATE SET readings = EXCLUDED.readings, sketch = EXCLUDED.sketch
+    """, [
+        (scope, target_id, period, bucket, int(counts.sum()), encode(counts))
+        for (scope, target_id, period, bucket), counts in merged.items()
+    ], template="(%s, %s, %s, to_timestamp(%s), %s, %s)")
+
+
+def load(cursor, scope, target_id, period, start, end):
+    """
+    [(bucket_epoch, counts)] for buckets starting in [start, end) epoch
+    seconds, oldest first.
+    """
+    execute(cursor, "sketch_range", """
+        SELECT EXTRACT(EPOCH FROM bucket_start)::bigint, sketch
+        FROM aqi_sketches
+        WHERE scope = %s
+          AND target_id = %s
+          AND period = %s
+          AND bucket_start >= to_timestamp(%s)
+          AND bucket_start < to_timestamp(%s)
+        ORDER BY bucket_start
+    """, (scope, target_id, period, start, end))
+    return [(bucket, decode(blob)) for bucket, blob in cursor.fetchall()]
+
+
+def rollup(hourly):
+    """
+    {(scope, target_id, "hour", epoch): counts} plus the matching daily
+    sketches.
+    """
+    sketches = {}
+    for (scope, target_id, _, hour), counts in hourly.items():
+        for period, span in PERIODS.items():
+            key = (scope, target_id, period, hour // span * span)
+            if key in sketches:
+                sketches[key] = sketches[key] + counts
+            else:
+                sketches[key] = counts.copy()
+    return sketches
+
+
+# ==============================
+# Ingestion
+# ==============================
+class SketchRecorder:
+    """
+    Per-sensor and per-region hourly deltas accumulated in memory and merged
+    into aqi_sketches every FLUSH_INTERVAL. A failed flush keeps its deltas
+    for the next attempt.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, sensor_id, region_id, t, value):
+        slot = slot_of(value)
+        hour = int(t // 3600) * 3600
+        keys = [("sensor", sensor_id, "hour", hour)]
+        if region_id is not None:
+            keys.append(("region", region_id, "hour", hour))
+
+        with self._lock:
+            for key in keys:
+                counts = self._pending.get(key)
+                if counts is None:
+                    counts = self._pending[key] = empty()
+                counts[slot] += 1
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, counts in pending.items():
+                if key in self._pending:
+                    self._pending[key] += counts
+                else:
+                    self._pending[key] = counts
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            write(cursor, rollup(pending))
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            self._restore(pending)
+            raise
+        finally:
+            conn.close()
+        return len(pending)
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Sketch flush failed, retrying next interval")
+
+
+recorder = SketchRecorder()
+
+
+# ==============================
+# Backfill
+# ==============================
+def _backfill_counts(cursor, start, end):
+    execute(cursor, "sketch_backfill", """
+        WITH r AS (
+            SELECT r.sensor_id,
+                   s.region_id,
+                   (floor(EXTRACT(EPOCH FROM r.timestamp AT TIME ZONE current_setting('TimeZone')) / 3600)
+                    * 3600)::bigint AS hour,
+                   CASE
+                       WHEN r.predicted_aqi < 1 THEN 0
+                       ELSE ceil(ln(LEAST(r.predicted_aqi, %s)) / %s)::int + 1
+                   END AS slot
+            FROM sensor_readings r
+            JOIN sensors s ON s.id = r.sensor_id
+            -- Bounds are converted to the column's local time, not the column
+            -- to UTC, so the timestamp index can serve the range
+            WHERE r.timestamp >= to_timestamp(%s) AT TIME ZONE current_setting('TimeZone')
+              AND r.timestamp < to_timestamp(%s) AT TIME ZONE current_setting('TimeZone')
+              AND r.predicted_aqi IS NOT NULL
+        )
+        SELECT sensor_id, region_id, hour, slot, COUNT(*)
+        FROM r
+        GROUP BY sensor_id, region_id, hour, slot
+    """, (MAX_VALUE, LOG_GAMMA, start, end))
+    return cursor.fetchall()
+
+
+def backfill(start, end):
+    """
+    Rebuild the sketches of every hour and day in [start, end) epoch
+    seconds (whole UTC days) from sensor_readings on every shard, replacing
+    what is stored. Slots are computed in SQL, so only per-hour bucket
+    counts leave the databases. Don't include the current day: readings
+    the API has taken but not yet flushed would be counted twice.
+    """
+    hourly = {}
+    for sensor_id, region_id, hour, slot, count in gather_rows(_backfill_counts, start, end):
+        for key in (("sensor", sensor_id, "hour", hour), ("region", region_id, "hour", hour)):
+            counts = hourly.get(key)
+            if counts is None:
+                counts = hourly[key] = empty()
+            counts[slot] += count
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        # Hours and days with no readings left must not keep stale sketches
+        execute(cursor, "sketch_lock", "SELECT pg_advisory_xact_lock(%s)", (ADVISORY_LOCK_CLASS,))
+        execute(cursor, "sketch_backfill_clear", """
+            DELETE FROM aqi_sketches
+            WHERE bucket_start >= to_timestamp(%s) AND bucket_start < to_timestamp(%s)
+        """, (start, end))
+        if hourly:
+            write(cursor, rollup(hourly), replace=True)
+        conn.commit()
+        cursor.close()
+        return len(hourly)
+    finally:
+        conn.close()
@@ -0,0 +1,280 @@
+import math
+import os
+import threading
+import numpy as np
+from app.db import gather_rows, execute
+
+# Grid cell edge in degrees (~28 km of latitude); a sensor is registered in
+# every cell its coverage circle touches, so a point lookup reads one cell
+GRID_CELL_DEG = float(os.getenv("SPATIAL_GRID_CELL_DEG", "0.25"))
+
+# Server-side clustering: sensors within this many screen pixels of each
+# other at the requested zoom are merged, below CLUSTER_MAX_ZOOM only
+CLUSTER_PIXELS = float(os.getenv("CLUSTER_PIXELS", "60"))
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "11"))
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+DEFAULT_RADIUS_KM = 20.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance; lat2/lon2 may be NumPy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _cell(lat, lon):
+    return (math.floor(lat / GRID_CELL_DEG), math.floor(lon / GRID_CELL_DEG))
+
+
+class SensorSnapshot:
+    """
+    Column arrays for every sensor plus the coverage grid. Built in one go
+    from the database; only the latest-AQI column is written afterwards.
+    """
+
+    def __init__(self, rows):
+        n = len(rows)
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.region_ids = np.array([r[1] or 0 for r in rows], dtype=np.int64)
+        self.region_names = [r[2] for r in rows]
+        self.lat = np.array([r[3] if r[3] is not None else np.nan for r in rows], dtype=np.float64)
+        self.lon = np.array([r[4] if r[4] is not None else np.nan for r in rows], dtype=np.float64)
+        self.radius = np.array([r[5] if r[5] is not None else DEFAULT_RADIUS_KM for r in rows], dtype=np.float64)
+        self.active = np.array([bool(r[6]) for r in rows], dtype=bool)
+        self.aqi = np.array([r[7] if r[7] is not None else np.nan for r in rows], dtype=np.float64)
+
+        self.slots = {int(sensor_id): i for i, sensor_id in enumerate(self.ids)}
+
+        self.grid = {}
+        for i in range(n):
+            if not self.active[i] or np.isnan(self.lat[i]) or np.isnan(self.lon[i]):
+                continue
+            d_lat = self.radius[i] / KM_PER_DEG_LAT
+            d_lon = d_lat / max(math.cos(math.radians(self.lat[i])), 0.01)
+            lat_lo, lon_lo = _cell(self.lat[i] - d_lat, self.lon[i] - d_lon)
+            lat_hi, lon_hi = _cell(self.lat[i] + d_lat, self.lon[i] + d_lon)
+            for ci in range(lat_lo, lat_hi + 1):
+                for cj in range(lon_lo, lon_hi + 1):
+                    self.grid.setdefault((ci, cj), []).append(i)
+
+        self.grid = {cell: np.array(rows_in_cell, dtype=np.int64) for cell, rows_in_cell in self.grid.items()}
+
+        # Sensors by their own position (active or not), for viewport queries
+        self.located = {}
+        for i in np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.lon)):
+            self.located.setdefault(_cell(self.lat[i], self.lon[i]), []).append(i)
+        self.located = {cell: np.array(rows_in_cell, dtype=np.int64) for cell, rows_in_cell in self.located.items()}
+
+
+def _load_rows(cursor):
+    execute(cursor, "sensor_index_load", """
+        SELECT s.id, s.region_id, r.name, s.latitude, s.longitude, s.radius, s.is_active,
+               lr.predicted_aqi
+        FROM sensors s
+        LEFT JOIN regions r ON r.id = s.region_id
+        LEFT JOIN LATERAL (
+            SELECT predicted_aqi
+            FROM sensor_readings
+            WHERE sensor_id = s.id
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) lr ON TRUE
+        WHERE s.deleted_at IS NULL
+        ORDER BY s.id
+    """)
+    return cursor.fetchall()
+
+
+class SensorIndex:
+    """
+    In-memory sensor geometry and latest AQI. Rebuilt lazily after admins
+    change sensors; readings update it in O(1) from /predict.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def snapshot(self):
+        if self._dirty or self._snapshot is None:
+            with self._lock:
+                if self._dirty or self._snapshot is None:
+                    # Clear first so an invalidate() during the load is not lost
+                    self._dirty = False
+                    try:
+                        rows = gather_rows(_load_rows)
+                        self._snapshot = SensorSnapshot(sorted(rows, key=lambda r: r[0]))
+                    except Exception:
+                        self._dirty = True
+                        raise
+        return self._snapshot
+
+    def update_reading(self, sensor_id, aqi):
+        snap = self._snapshot
+        if snap is None:
+            return
+        slot = snap.slots.get(sensor_id)
+        if slot is None:
+            # Sensor created elsewhere; pick it up on the next lookup
+            self._dirty = True
+            return
+        snap.aqi[slot] = aqi
+
+    def region_of(self, sensor_id):
+        snap = self.snapshot()
+        slot = snap.slots.get(sensor_id)
+        if slot is None or snap.region_ids[slot] == 0:
+            return None
+        return int(snap.region_ids[slot])
+
+    def region_names(self):
+        snap = self.snapshot()
+        return {int(rid): name for rid, name in zip(snap.region_ids, snap.region_names) if rid}
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Ids of all sensors (active or not) located inside the box. Only the
+        grid cells the box overlaps are read, so the cost follows the
+        viewport rather than the fleet.
+        """
+        snap = self.snapshot()
+        lat_lo, lon_lo = _cell(min_lat, min_lon)
+        lat_hi, lon_hi = _cell(max_lat, max_lon)
+
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) <= len(snap.located):
+            cells = ((ci, cj) for ci in range(lat_lo, lat_hi + 1) for cj in range(lon_lo, lon_hi + 1))
+            parts = [snap.located[cell] for cell in cells if cell in snap.located]
+        else:
+            # Box wider than the occupied grid: walk the occupied cells instead
+            parts = [
+                rows for (ci, cj), rows in snap.located.items()
+                if lat_lo <= ci <= lat_hi and lon_lo <= cj <= lon_hi
+            ]
+        if not parts:
+            return []
+
+        # Edge cells stick out of the box
+        rows = np.sort(np.concatenate(parts))
+        lat, lon = snap.lat[rows], snap.lon[rows]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return snap.ids[rows[inside]].tolist()
+
+    def coordinates(self, sensor_ids):
+        """
+        (lat, lon, latest_aqi) arrays for the given ids; NaN where unknown.
+        """
+        snap = self.snapshot()
+        slots = np.array([snap.slots.get(i, -1) for i in sensor_ids], dtype=np.int64)
+        known = slots >= 0
+        lat = np.full(len(slots), np.nan)
+        lon = np.full(len(slots), np.nan)
+        aqi = np.full(len(slots), np.nan)
+        lat[known] = snap.lat[slots[known]]
+        lon[known] = snap.lon[slots[known]]
+        aqi[known] = snap.aqi[slots[known]]
+        return lat, lon, aqi
+
+    def covering(self, lat, lon):
+        """
+        Active sensors with a reading whose coverage circle contains the
+        point, as (snapshot, rows, distances_km).
+        """
+        snap = self.snapshot()
+        candidates = snap.grid.get(_cell(lat, lon))
+        if candidates is None:
+            return snap, candidates, None
+
+        dist = haversine_km(lat, lon, snap.lat[candidates], snap.lon[candidates])
+        keep = (dist <= snap.radius[candidates]) & ~np.isnan(snap.aqi[candidates])
+        return snap, candidates[keep], dist[keep]
+
+    def interpolate(self, lat, lon):
+        """
+        Inverse-distance-weighted AQI (power 2) from the covering sensors,
+        or None when no active sensor covers the point.
+        """
+        snap, rows, dist = self.covering(lat, lon)
+        if rows is None or len(rows) == 0:
+            return None
+
+        values = snap.aqi[rows]
+        # Floor the distance so a point on top of a sensor takes its value
+        weights = 1.0 / np.maximum(dist, 0.01) ** 2
+        aqi = float(np.dot(weights, values) / weights.sum())
+
+        return {
+            "aqi": aqi,
+            "sensors": [
+                {
+                    "sensor_id": int(snap.ids[r]),
+                    "distance_km": round(float(d), 3),
+                    "aqi": float(snap.aqi[r])
+                }
+                for r, d in sorted(zip(rows, dist), key=lambda x: x[1])
+            ]
+        }
+
+
+sensor_index = SensorIndex()
+
+
+def cluster(items, lat, lon, aqi, zoom):
+    """
+    Merge items that fall in the same screen-space grid cell at `zoom`.
+    Cells holding one item keep it unchanged; others become an aggregate
+    point with count, mean position and max/mean AQI. The result keeps the
+    input order, each cell at the position of its first item; items
+    without coordinates can't be placed in a cell and pass through as is.
+    """
+    has_coords = ~np.isnan(lat) & ~np.isnan(lon)
+    if not has_coords.any():
+        return list(items)
+
+    idx = np.flatnonzero(has_coords)
+    cell_deg = CLUSTER_PIXELS * 360.0 / (256 * 2 ** zoom)
+    keys = np.stack([np.floor(lat[idx] / cell_deg), np.floor(lon[idx] / cell_deg)], axis=1)
+    _, group, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    group = group.reshape(-1)
+
+    n = len(counts)
+    mean_lat = np.bincount(group, weights=lat[idx], minlength=n) / counts
+    mean_lon = np.bincount(group, weights=lon[idx], minlength=n) / counts
+
+    values = aqi[idx]
+    has_aqi = ~np.isnan(values)
+    aqi_counts = np.bincount(group[has_aqi], minlength=n)
+    aqi_sums = np.bincount(group[has_aqi], weights=values[has_aqi], minlength=n)
+    aqi_max = np.full(n, -np.inf)
+    np.maximum.at(aqi_max, group[has_aqi], values[has_aqi])
+
+    first = np.full(n, -1, dtype=np.int64)
+    first[group[::-1]] = idx[::-1]
+    group_of = np.full(len(items), -1, dtype=np.int64)
+    group_of[idx] = group
+
+    result = []
+    for i, g in enumerate(group_of.tolist()):
+        if g < 0 or counts[g] == 1:
+            result.append(items[i])
+            continue
+        if first[g] != i:
+            continue
+        result.append({
+            "cluster": True,
+            "count": int(counts[g]),
+            "latitude": round(float(mean_lat[g]), 6),
+            "longitude": round(float(mean_lon[g]), 6),
+            "max_aqi": round(float(aqi_max[g]), 2) if aqi_counts[g] else None,
+            "mean_aqi": round(float(aqi_sums[g] / aqi_counts[g]), 2) if aqi_counts[g] else None
+        })
+    return result
@@ -1,5 +1,8 @@
 import psycopg2
-from app.db import get_connection
+from app.db import SHARDED, SHARDS, get_connection, get_shard_connection, shard_for_region
+from app import events
+from init_db import align_sequences
+from app.readings import code_of_label, stored
 import random
 import uuid
 
@@ -38,24 +41,35 @@ def seed_hardware():
     cursor.execute("SELECT id, name FROM regions")
     regions = {name: r_id for r_id, name in cursor.fetchall()}
 
+    # Each sensor and its telemetry go to its region's shard
+    shards = [conn] + [get_shard_connection(shard) for shard in SHARDS[1:]]
+    shard_cursors = [cursor] + [shard_conn.cursor() for shard_conn in shards[1:]]
+
     print("Injecting Base Hardware Sensors...")
     inserted = 0
     for s_id, r_name in SENSORS:
-        cursor.execute("SELECT id FROM sensors WHERE id = %s", (s_id,))
-        if not cursor.fetchone():
-            r_id = regions.get(r_name)
-            if not r_id:
-                cursor.execute("INSERT INTO regions (name) VALUES (%s) RETURNING id", (r_name,))
-                r_id = cursor.fetchone()[0]
-                regions[r_name] = r_id
+        r_id = regions.get(r_name)
+        if not r_id:
+            cursor.execute("INSERT INTO regions (name) VALUES (%s) RETURNING id", (r_name,))
+            r_id = cursor.fetchone()[0]
+            regions[r_name] = r_id
+            # Every shard carries the full region list, ids as on the primary
+            for shard_cursor in shard_cursors[1:]:
+                shard_cursor.execute("""
+                    INSERT INTO regions (id, name) VALUES (%s, %s)
+                    ON CONFLICT (id) DO NOTHING
+                """, (r_id, r_name))
+        data_cursor = shard_cursors[shard_for_region(r_id)]
 
+        data_cursor.execute("SELECT id FROM sensors WHERE id = %s", (s_id,))
+        if not data_cursor.fetchone():
             lat, lon = locs.get(r_name, (19.0, 73.0))
             lat += random.uniform(-0.15, 0.15)
             lon += random.uniform(-0.15, 0.15)
             rad = random.randint(15, 45)
             sensor_code = f"SNS-{uuid.uuid4().hex[:8].upper()}"
             
-            cursor.execute("""
+            data_cursor.execute("""
                 INSERT INTO sensors (id, sensor_code, region_id, latitude, longitude, radius, is_active)
                 VALUES (%s, %s, %s, %s, %s, %s, TRUE)
             """, (s_id, sensor_code, r_id, lat, lon, rad))
@@ -68,16 +82,29 @@ def seed_hardware():
             aqi = max(pm25 * 3, pm10 * 1.5)
             cat = "Moderate" if aqi > 100 else "Satisfactory"
             
-            cursor.execute("""
+            data_cursor.execute("""
                 INSERT INTO sensor_readings
-                (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+                (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category_code)
                 VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """, (s_id, pm25, pm10, no2, co, so2, o3, nh3, aqi, cat))
+            """, (s_id, *(stored(v) for v in (pm25, pm10, no2, co, so2, o3, nh3, aqi)), code_of_label(cat)))
             
     # Sync sequences so new organically added hardware nodes don't collide with factory-seeded IDs
-    cursor.execute("SELECT setval(pg_get_serial_sequence('sensors', 'id'), COALESCE(MAX(id), 1)) FROM sensors")
-    cursor.execute("SELECT setval(pg_get_serial_sequence('sensor_readings', 'id'), COALESCE(MAX(id), 1)) FROM sensor_readings")
+    if SHARDED:
+        # Re-interleave every shard's ids above the seeded ones
+        align_sequences(shards)
+        for shard_cursor in shard_cursors[1:]:
+            shard_cursor.execute("SELECT setval('regions_id_seq', GREATEST(MAX(id), 1)) FROM regions")
+    else:
+        cursor.execute("SELECT setval(pg_get_serial_sequence('sensors', 'id'), COALESCE(MAX(id), 1)) FROM sensors")
+        cursor.execute("SELECT setval(pg_get_serial_sequence('sensor_readings', 'id'), COALESCE(MAX(id), 1)) FROM sensor_readings")
 
+    # Shards first, then the primary, whose commit tells running APIs to
+    # drop their cached responses
+    for shard_conn, shard_cursor in zip(shards[1:], shard_cursors[1:]):
+        shard_conn.commit()
+        shard_cursor.close()
+        shard_conn.close()
+    events.publish_external_write(cursor)
     conn.commit()
     cursor.close()
     conn.close()
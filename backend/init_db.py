@@ -1,6 +1,231 @@
 import psycopg2
-from app.db import get_connection
+from app.db import SHARDED, SHARDS, SHARD_ID_STRIDE, get_connection, get_shard_connection
 from app.auth import hash_password
+from app.readings import CATEGORIES, CATEGORY_BOUNDS, LEGACY_LABELS
+
+POLLUTANT_COLUMNS = ("pm25", "pm10", "no2", "co", "so2", "o3", "nh3", "predicted_aqi")
+
+# Per-region data; created on every shard
+SHARD_TABLES = """
+    CREATE TABLE IF NOT EXISTS regions (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) UNIQUE NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS sensors (
+        id SERIAL PRIMARY KEY,
+        sensor_code VARCHAR(50) UNIQUE NOT NULL,
+        region_id INTEGER REFERENCES regions(id),
+        latitude DECIMAL(10, 8),
+        longitude DECIMAL(11, 8),
+        radius DECIMAL(5, 2) DEFAULT 20.0,
+        is_active BOOLEAN DEFAULT TRUE
+    );
+
+    -- Set on decommission; the row itself is removed by the background job
+    ALTER TABLE sensors ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+    CREATE TABLE IF NOT EXISTS sensor_readings (
+        id SERIAL PRIMARY KEY,
+        sensor_id INTEGER REFERENCES sensors(id),
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        pm25 REAL,
+        pm10 REAL,
+        no2 REAL,
+        co REAL,
+        so2 REAL,
+        o3 REAL,
+        nh3 REAL,
+        predicted_aqi REAL,
+        -- Index into app.readings.CATEGORIES
+        category_code SMALLINT,
+        is_anomaly BOOLEAN DEFAULT FALSE,
+        anomaly_score REAL,
+        anomaly_pollutants VARCHAR(64)
+    );
+
+    ALTER TABLE sensor_readings ADD COLUMN IF NOT EXISTS is_anomaly BOOLEAN DEFAULT FALSE;
+    ALTER TABLE sensor_readings ADD COLUMN IF NOT EXISTS anomaly_score REAL;
+    ALTER TABLE sensor_readings ADD COLUMN IF NOT EXISTS anomaly_pollutants VARCHAR(64);
+
+    CREATE INDEX IF NOT EXISTS idx_readings_sensor_time
+    ON sensor_readings(sensor_id, timestamp DESC);
+
+    -- Readings arrive in time order, so a few block ranges cover any
+    -- time window (exports, warm-up, backfills) at a tiny index size
+    CREATE INDEX IF NOT EXISTS idx_readings_time_brin
+    ON sensor_readings USING BRIN (timestamp);
+
+    -- Flagged readings are rare; a partial index keeps /anomalies cheap
+    CREATE INDEX IF NOT EXISTS idx_readings_anomalies
+    ON sensor_readings(timestamp DESC) WHERE is_anomaly;
+"""
+
+# Everything else lives on shard 0 (the primary) only
+HOME_TABLES = """
+    CREATE TABLE IF NOT EXISTS admins (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS slow_query_plans (
+        id SERIAL PRIMARY KEY,
+        query_name VARCHAR(100) NOT NULL,
+        duration_ms DOUBLE PRECISION NOT NULL,
+        params TEXT,
+        plan TEXT NOT NULL,
+        captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- scope 'sensor' | 'region'; a NULL target_id applies to every sensor/region
+    CREATE TABLE IF NOT EXISTS alert_rules (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        scope VARCHAR(10) NOT NULL,
+        target_id INTEGER,
+        metric VARCHAR(10) NOT NULL DEFAULT 'aqi',
+        time_window VARCHAR(10) NOT NULL DEFAULT 'reading',
+        threshold DOUBLE PRECISION NOT NULL,
+        clear_threshold DOUBLE PRECISION,
+        consecutive INTEGER NOT NULL DEFAULT 1,
+        is_active BOOLEAN DEFAULT TRUE,
+        created_by INTEGER REFERENCES admins(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS alerts (
+        id SERIAL PRIMARY KEY,
+        rule_id INTEGER REFERENCES alert_rules(id) ON DELETE CASCADE,
+        subject_id INTEGER,
+        sensor_id INTEGER,
+        value DOUBLE PRECISION,
+        triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        resolved_at TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_alerts_open
+    ON alerts(rule_id, subject_id) WHERE resolved_at IS NULL;
+
+    -- Firing flag per (rule, subject) as recorded by the subject's owning
+    -- worker, kept across restarts and handovers (app/alerts.py)
+    CREATE TABLE IF NOT EXISTS alert_state (
+        rule_id INTEGER REFERENCES alert_rules(id) ON DELETE CASCADE,
+        subject_id INTEGER NOT NULL,
+        streak INTEGER NOT NULL DEFAULT 0,
+        firing BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (rule_id, subject_id)
+    );
+
+    -- Alerts left open before alert_state existed keep firing
+    INSERT INTO alert_state (rule_id, subject_id, firing)
+    SELECT DISTINCT rule_id, subject_id, TRUE
+    FROM alerts
+    WHERE resolved_at IS NULL AND rule_id IS NOT NULL AND subject_id IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    CREATE TABLE IF NOT EXISTS decommission_jobs (
+        id SERIAL PRIMARY KEY,
+        sensor_id INTEGER NOT NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        rows_deleted BIGINT NOT NULL DEFAULT 0,
+        error TEXT,
+        requested_by INTEGER REFERENCES admins(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+
+    -- Region shard holding the sensor's data (app.db.SHARD_MAP)
+    ALTER TABLE decommission_jobs ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0;
+
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        token_hash CHAR(64) PRIMARY KEY,
+        expires_at TIMESTAMPTZ NOT NULL
+    );
+
+    -- Bumped alongside each cross-worker event so listeners can detect misses
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    );
+
+    -- Mergeable AQI quantile sketches (app/sketches.py), hourly and daily
+    CREATE TABLE IF NOT EXISTS aqi_sketches (
+        scope VARCHAR(10) NOT NULL,
+        target_id INTEGER NOT NULL,
+        period VARCHAR(10) NOT NULL,
+        bucket_start TIMESTAMPTZ NOT NULL,
+        readings BIGINT NOT NULL,
+        sketch BYTEA NOT NULL,
+        PRIMARY KEY (scope, target_id, period, bucket_start)
+    );
+"""
+
+# Tables whose SERIAL ids must stay unique across shards
+SHARDED_SEQUENCES = ("sensors_id_seq", "sensor_readings_id_seq")
+
+
+def compact_readings(cursor):
+    """
+    Move a sensor_readings table from the old layout (DECIMAL(10, 2)
+    values, VARCHAR category) to REAL values and a SMALLINT category_code.
+    All columns change in one ALTER TABLE, so the table is rewritten once;
+    it holds an exclusive lock for the duration, run it in a quiet window.
+    """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'sensor_readings' AND column_name = 'category'
+    """)
+    if not cursor.fetchone():
+        return
+
+    print("Migrating sensor_readings to the compact layout...")
+    labels = []
+    for code, label in enumerate(CATEGORIES):
+        names = [label] + [old for old, new in LEGACY_LABELS.items() if new == label]
+        labels.append(f"WHEN category IN ({', '.join(repr(n) for n in names)}) THEN {code}")
+    # Anything else is re-derived from the AQI, as the API labels it
+    bands = [f"WHEN predicted_aqi <= {bound} THEN {code}" for code, bound in enumerate(CATEGORY_BOUNDS)]
+
+    cursor.execute(f"""
+        ALTER TABLE sensor_readings
+            {", ".join(f"ALTER COLUMN {c} TYPE REAL" for c in POLLUTANT_COLUMNS)},
+            ALTER COLUMN category TYPE SMALLINT USING (CASE
+                {" ".join(labels)}
+                WHEN predicted_aqi IS NULL THEN NULL
+                {" ".join(bands)}
+                ELSE {len(CATEGORY_BOUNDS)}
+            END)
+    """)
+    cursor.execute("ALTER TABLE sensor_readings RENAME COLUMN category TO category_code")
+
+
+def align_sequences(connections):
+    """
+    Interleave the sharded id sequences: shard k hands out ids congruent to
+    k modulo SHARD_ID_STRIDE, starting above the highest id on any shard.
+    Re-running it leaves unused sequences where they are.
+    """
+    for sequence in SHARDED_SEQUENCES:
+        table = sequence[:-len("_id_seq")]
+        highest = 0
+        for conn in connections:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT GREATEST(COALESCE(MAX(id), 0),
+                                    (SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {sequence}))
+                    FROM {table}
+                """)
+                highest = max(highest, cursor.fetchone()[0])
+
+        base = highest - highest % SHARD_ID_STRIDE + SHARD_ID_STRIDE
+        for shard, conn in enumerate(connections):
+            with conn.cursor() as cursor:
+                cursor.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE} "
+                               f"MINVALUE 1 RESTART WITH {base + shard}")
+
 
 def setup_database():
     print("Connecting to db...")
@@ -8,44 +233,9 @@ def setup_database():
     cursor = conn.cursor()
 
     print("Creating tables if they don't exist...")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS regions (
-            id SERIAL PRIMARY KEY,
-            name VARCHAR(100) UNIQUE NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS sensors (
-            id SERIAL PRIMARY KEY,
-            sensor_code VARCHAR(50) UNIQUE NOT NULL,
-            region_id INTEGER REFERENCES regions(id),
-            latitude DECIMAL(10, 8),
-            longitude DECIMAL(11, 8),
-            radius DECIMAL(5, 2) DEFAULT 20.0,
-            is_active BOOLEAN DEFAULT TRUE
-        );
-
-        CREATE TABLE IF NOT EXISTS admins (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS sensor_readings (
-            id SERIAL PRIMARY KEY,
-            sensor_id INTEGER REFERENCES sensors(id),
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            pm25 DECIMAL(10, 2),
-            pm10 DECIMAL(10, 2),
-            no2 DECIMAL(10, 2),
-            co DECIMAL(10, 2),
-            so2 DECIMAL(10, 2),
-            o3 DECIMAL(10, 2),
-            nh3 DECIMAL(10, 2),
-            predicted_aqi DECIMAL(10, 2),
-            category VARCHAR(50)
-        );
-    """)
+    cursor.execute(SHARD_TABLES + HOME_TABLES)
+
+    compact_readings(cursor)
 
     print("Checking for default admin...")
     cursor.execute("SELECT * FROM admins WHERE username = 'admin1'")
@@ -62,9 +252,35 @@ def setup_database():
             cursor.execute("INSERT INTO regions (name) VALUES (%s)", (region,))
 
     conn.commit()
+
+    if SHARDED:
+        # Every shard gets the full region list, ids as on the primary
+        cursor.execute("SELECT id, name FROM regions ORDER BY id")
+        region_rows = cursor.fetchall()
+        shards = [conn] + [get_shard_connection(shard) for shard in SHARDS[1:]]
+        for shard, shard_conn in enumerate(shards[1:], start=1):
+            print(f"Setting up shard {shard}...")
+            with shard_conn.cursor() as shard_cursor:
+                shard_cursor.execute(SHARD_TABLES)
+                compact_readings(shard_cursor)
+                for region_id, name in region_rows:
+                    shard_cursor.execute("""
+                        INSERT INTO regions (id, name) VALUES (%s, %s)
+                        ON CONFLICT (id) DO NOTHING
+                    """, (region_id, name))
+                shard_cursor.execute("SELECT setval('regions_id_seq', GREATEST(MAX(id), 1)) FROM regions")
+            shard_conn.commit()
+
+        print(f"Interleaving sensor and reading ids across {len(shards)} shards...")
+        align_sequences(shards)
+        for shard_conn in shards:
+            shard_conn.commit()
+        for shard_conn in shards[1:]:
+            shard_conn.close()
+
     cursor.close()
     conn.close()
     print("Database successfully initialized!")
 
 if __name__ == '__main__':
-    setup_database()
+    setup_database()
\ No newline at end of file
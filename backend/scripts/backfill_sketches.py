@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import sketches  # noqa: E402
+
+# =====================================
+# Rebuild AQI percentile sketches from sensor_readings, one UTC day at a
+# time, ending yesterday (today is still being written by the API)
+# =====================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill aqi_sketches from sensor_readings")
+    parser.add_argument("--days", type=int, default=30, help="Whole days to rebuild, ending yesterday")
+    args = parser.parse_args()
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for offset in range(args.days, 0, -1):
+        day = today - timedelta(days=offset)
+        start = int(day.timestamp())
+        t = time.perf_counter()
+        keys = sketches.backfill(start, start + 86400)
+        print(f"{day.date()}: {keys} hourly sketches in {time.perf_counter() - t:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
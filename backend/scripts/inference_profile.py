@@ -0,0 +1,143 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+# =====================================
+# Config
+# =====================================
+BATCH_SIZES = [1, 16, 256, 4096]
+WARMUP_RUNS = 3
+MIN_RUNS = 20
+MIN_SECONDS = 0.5
+
+
+def get_rss_mb():
+    """
+    Current resident set size of this process in MB.
+    Falls back to peak RSS where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_predict(model, batch):
+    for _ in range(WARMUP_RUNS):
+        model.predict(batch)
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < MIN_RUNS or time.perf_counter() - started < MIN_SECONDS:
+        t0 = time.perf_counter()
+        model.predict(batch)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    timings = np.array(timings)
+    return {
+        "runs": int(len(timings)),
+        "mean_ms": round(float(timings.mean()), 4),
+        "p50_ms": round(float(np.percentile(timings, 50)), 4),
+        "p95_ms": round(float(np.percentile(timings, 95)), 4),
+        "p99_ms": round(float(np.percentile(timings, 99)), 4),
+        "per_row_us": round(float(timings.mean()) * 1000 / len(batch), 4),
+    }
+
+
+def measure(model_path, sample_rows, feature_names, metrics=None):
+    """
+    Load a saved model the way app/main.py does and measure what it costs
+    to serve: file size, load time, memory after load and predict latency
+    per batch size. The profile is written next to the model artifact.
+    """
+    rss_before = get_rss_mb()
+    t0 = time.perf_counter()
+    model = joblib.load(model_path)
+    load_seconds = time.perf_counter() - t0
+    rss_after = get_rss_mb()
+
+    # The API feeds float64 rows in training column order
+    sample_rows = np.asarray(sample_rows, dtype=np.float64)
+
+    latency = {}
+    for size in BATCH_SIZES:
+        idx = np.arange(size) % len(sample_rows)
+        batch = np.ascontiguousarray(sample_rows[idx])
+        latency[str(size)] = time_predict(model, batch)
+
+    profile = {
+        "model_path": model_path,
+        "features": list(feature_names),
+        "file_size_mb": round(os.path.getsize(model_path) / (1024 * 1024), 3),
+        "load_seconds": round(load_seconds, 4),
+        "rss_after_load_mb": round(rss_after, 2),
+        "rss_load_delta_mb": round(rss_after - rss_before, 2),
+        "predict_latency": latency,
+        "metrics": metrics or {},
+    }
+
+    if hasattr(model, "get_params"):
+        params = model.get_params()
+        profile["params"] = {
+            k: params[k] for k in ("iterations", "depth", "learning_rate")
+            if k in params
+        }
+
+    profile_path = os.path.splitext(model_path)[0] + ".profile.json"
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+    print("\nInference Profile")
+    print(f"File size: {profile['file_size_mb']} MB")
+    print(f"Load time: {profile['load_seconds']} s")
+    print(f"RSS after load: {profile['rss_after_load_mb']} MB "
+          f"(+{profile['rss_load_delta_mb']} MB)")
+    for size, stats in latency.items():
+        print(f"Batch {size:>5}: p50 {stats['p50_ms']} ms | "
+              f"p95 {stats['p95_ms']} ms | {stats['per_row_us']} us/row")
+    print("Profile saved at:", profile_path)
+
+    return profile
+
+
+def profile_model(model_path, sample_rows, feature_names, metrics=None):
+    """
+    Run measure() in a fresh interpreter so load time and RSS are not
+    skewed by the training data still held by the calling script.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_path = os.path.join(tmp, "sample.npy")
+        meta_path = os.path.join(tmp, "meta.json")
+        np.save(sample_path, np.asarray(sample_rows, dtype=np.float64))
+        with open(meta_path, "w") as f:
+            json.dump({"features": list(feature_names), "metrics": metrics or {}}, f)
+
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), model_path, sample_path, meta_path],
+            check=True
+        )
+
+    profile_path = os.path.splitext(model_path)[0] + ".profile.json"
+    with open(profile_path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    # Usage: python scripts/inference_profile.py <model.pkl> <sample.npy> [meta.json]
+    meta = {"features": [], "metrics": {}}
+    if len(sys.argv) > 3:
+        with open(sys.argv[3]) as f:
+            meta = json.load(f)
+
+    measure(sys.argv[1], np.load(sys.argv[2]), meta["features"], meta["metrics"])
@@ -0,0 +1,180 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.db import get_connection  # noqa: E402
+
+# =====================================
+# Config
+# =====================================
+SCHEMA = "layout_bench"
+SENSORS = 200
+MIN_RUNS = 5
+
+# The pre-migration sensor_readings layout, and the compact one init_db.py
+# now creates; same rows and same indexes in both, so only the layout differs
+LEGACY_TABLE = """
+    CREATE TABLE {schema}.legacy (
+        id SERIAL PRIMARY KEY,
+        sensor_id INTEGER,
+        timestamp TIMESTAMP,
+        pm25 DECIMAL(10, 2), pm10 DECIMAL(10, 2), no2 DECIMAL(10, 2), co DECIMAL(10, 2),
+        so2 DECIMAL(10, 2), o3 DECIMAL(10, 2), nh3 DECIMAL(10, 2),
+        predicted_aqi DECIMAL(10, 2),
+        category VARCHAR(50),
+        is_anomaly BOOLEAN DEFAULT FALSE,
+        anomaly_score REAL,
+        anomaly_pollutants VARCHAR(64)
+    );
+    CREATE INDEX ON {schema}.legacy (sensor_id, timestamp DESC);
+    CREATE INDEX ON {schema}.legacy USING BRIN (timestamp);
+"""
+
+COMPACT_TABLE = """
+    CREATE TABLE {schema}.compact (
+        id SERIAL PRIMARY KEY,
+        sensor_id INTEGER,
+        timestamp TIMESTAMP,
+        pm25 REAL, pm10 REAL, no2 REAL, co REAL, so2 REAL, o3 REAL, nh3 REAL,
+        predicted_aqi REAL,
+        category_code SMALLINT,
+        is_anomaly BOOLEAN DEFAULT FALSE,
+        anomaly_score REAL,
+        anomaly_pollutants VARCHAR(64)
+    );
+    CREATE INDEX ON {schema}.compact (sensor_id, timestamp DESC);
+    CREATE INDEX ON {schema}.compact USING BRIN (timestamp);
+"""
+
+SEED = """
+    INSERT INTO {schema}.legacy
+        (sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+    SELECT g %% {sensors} + 1,
+           now() - make_interval(secs => %s - g),
+           round((random() * 200)::numeric, 2), round((random() * 300)::numeric, 2),
+           round((random() * 60)::numeric, 2), round((random() * 2)::numeric, 2),
+           round((random() * 20)::numeric, 2), round((random() * 80)::numeric, 2),
+           round((random() * 10)::numeric, 2), a.aqi,
+           CASE WHEN a.aqi <= 50 THEN 'Good' WHEN a.aqi <= 100 THEN 'Satisfactory'
+                WHEN a.aqi <= 200 THEN 'Moderate' WHEN a.aqi <= 300 THEN 'Poor'
+                WHEN a.aqi <= 400 THEN 'Very Poor' ELSE 'Severe' END
+    FROM generate_series(1, %s) g,
+         LATERAL (SELECT round((random() * 500)::numeric, 2) AS aqi, g AS touch) a;
+
+    INSERT INTO {schema}.compact
+        (id, sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category_code)
+    SELECT id, sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi,
+           CASE category WHEN 'Good' THEN 0 WHEN 'Satisfactory' THEN 1 WHEN 'Moderate' THEN 2
+                         WHEN 'Poor' THEN 3 WHEN 'Very Poor' THEN 4 ELSE 5 END
+    FROM {schema}.legacy;
+"""
+
+# (name, query template); {table} and {category} are filled per layout
+QUERIES = [
+    ("sensor history (btree)", """
+        SELECT timestamp, predicted_aqi, pm25, pm10
+        FROM {table} WHERE sensor_id = 7
+        ORDER BY timestamp DESC LIMIT 50
+    """),
+    ("last hour scan", """
+        SELECT sensor_id, predicted_aqi, {category}
+        FROM {table} WHERE timestamp > now() - interval '1 hour'
+    """),
+    ("full fetch to python", """
+        SELECT sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, {category}
+        FROM {table}
+    """),
+]
+
+
+def table_size(cursor, table):
+    cursor.execute("""
+        SELECT pg_relation_size(%s), pg_indexes_size(%s)
+    """, (table, table))
+    heap, indexes = cursor.fetchone()
+    cursor.execute(f"SELECT avg(pg_column_size(t.*)) FROM {table} t")
+    return {"heap_mb": heap / 2 ** 20, "index_mb": indexes / 2 ** 20, "row_bytes": float(cursor.fetchone()[0])}
+
+
+def time_query(cursor, query):
+    timings = []
+    rows = 0
+    for _ in range(MIN_RUNS):
+        t0 = time.perf_counter()
+        cursor.execute(query)
+        rows = len(cursor.fetchall())
+        timings.append((time.perf_counter() - t0) * 1000)
+    return rows, float(np.median(timings))
+
+
+def legacy_connection():
+    """
+    A connection that reads DECIMAL as Decimal, as the API did with the
+    legacy layout: importing app.db registers a float caster process-wide.
+    """
+    conn = get_connection()
+    psycopg2.extensions.register_type(psycopg2.extensions.DECIMAL, conn)
+    conn.autocommit = True
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy and compact sensor_readings layouts")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true", help=f"Leave the {SCHEMA} schema in place")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    legacy_conn = None
+    try:
+        print(f"Seeding {args.rows} readings into {SCHEMA}.legacy and {SCHEMA}.compact...")
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+        cursor.execute(LEGACY_TABLE.format(schema=SCHEMA) + COMPACT_TABLE.format(schema=SCHEMA))
+        cursor.execute(SEED.format(schema=SCHEMA, sensors=SENSORS), (args.rows, args.rows))
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute(f"VACUUM ANALYZE {SCHEMA}.legacy")
+        cursor.execute(f"VACUUM ANALYZE {SCHEMA}.compact")
+
+        legacy_conn = legacy_connection()
+        legacy_cursor = legacy_conn.cursor()
+        layouts = {
+            "legacy": (legacy_cursor, f"{SCHEMA}.legacy", "category"),
+            "compact": (cursor, f"{SCHEMA}.compact", "category_code"),
+        }
+        sizes = {name: table_size(cursor, table) for name, (_, table, _) in layouts.items()}
+
+        print("\n===== SIZE =====")
+        for name, size in sizes.items():
+            print(f"{name:>8}: heap {size['heap_mb']:.1f} MB | indexes {size['index_mb']:.1f} MB | "
+                  f"row {size['row_bytes']:.1f} bytes")
+        print(f"   ratio: heap {sizes['compact']['heap_mb'] / sizes['legacy']['heap_mb']:.2f}x")
+
+        print("\n===== SPEED (median of %d) =====" % MIN_RUNS)
+        for label, template in QUERIES:
+            results = {}
+            for name, (layout_cursor, table, category) in layouts.items():
+                results[name] = time_query(layout_cursor, template.format(table=table, category=category))
+            legacy, compact = results["legacy"][1], results["compact"][1]
+            print(f"{label:<24} rows {results['compact'][0]:>8} | legacy {legacy:8.1f} ms | "
+                  f"compact {compact:8.1f} ms | {legacy / compact:.2f}x")
+    finally:
+        if legacy_conn is not None:
+            legacy_conn.close()
+        if not args.keep:
+            conn.rollback()
+            conn.autocommit = True
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from catboost import CatBoostRegressor
 import joblib
+from inference_profile import profile_model
 
 print("Loading dataset...")
 
@@ -55,6 +56,15 @@ rmse = np.sqrt(np.mean((preds - y_test) ** 2))
 print("Forecast RMSE:", rmse)
 
 # Save model
-joblib.dump(model, "models/aqi_forecast_model.pkl")
-
-print("Forecast model saved at models/aqi_forecast_model.pkl")
\ No newline at end of file
+MODEL_PATH = "models/aqi_forecast_model.pkl"
+joblib.dump(model, MODEL_PATH)
+
+print("Forecast model saved at", MODEL_PATH)
+
+# Serving cost of this configuration (size, load, RSS, predict latency)
+profile_model(
+    MODEL_PATH,
+    X_test.head(4096).to_numpy(),
+    features,
+    metrics={"rmse": float(rmse)}
+)
\ No newline at end of file
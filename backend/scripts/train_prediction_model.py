@@ -5,6 +5,7 @@ import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 from catboost import CatBoostRegressor
+from inference_profile import profile_model
 
 # Paths
 DATA_PATH = "data/processed/clean_air_quality.csv"
@@ -106,4 +107,15 @@ print("\nModel saved at:", MODEL_PATH)
 print("\nFeature Importance:")
 importance = model.get_feature_importance()
 for f, imp in zip(features, importance):
-    print(f"{f}: {imp:.2f}")
\ No newline at end of file
+    print(f"{f}: {imp:.2f}")
+
+# =====================================
+# Inference Profile
+# =====================================
+# Serving cost of this configuration (size, load, RSS, predict latency)
+profile_model(
+    MODEL_PATH,
+    X_test.head(4096).to_numpy(),
+    features,
+    metrics={"rmse": float(rmse), "r2": float(r2)}
+)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from app.db import get_connection
+from app import events
 import random
 
 locs = {
@@ -34,6 +35,7 @@ try:
             updated += 1
             print(f"Updated sensor {sensor_id} in {region_name}")
 
+    events.publish_external_write(cursor)
     conn.commit()
     print(f"Successfully injected map coordinates into {updated} backend sensors.")
 except Exception as e:
@@ -1,4 +1,5 @@
 from app.db import get_connection
+from app import events
 import random
 
 locs = {
@@ -27,6 +28,7 @@ try:
             cursor.execute("UPDATE sensors SET latitude=%s, longitude=%s, radius=%s WHERE id=%s", (lat + jitter_lat, lon + jitter_lon, rad, sensor_id))
             updated += 1
 
+    events.publish_external_write(cursor)
     conn.commit()
     print(f"Successfully injected map coordinates into {updated} backend sensors.")
 except Exception as e:
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.admission import ConcurrencyGate, Rejected, TokenBuckets
+
+
+def test_bucket_allows_burst_then_throttles():
+    buckets = TokenBuckets(rate=1.0, burst=3)
+    assert [buckets.take("a", now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("a", now=100.0) == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_rate():
+    buckets = TokenBuckets(rate=2.0, burst=2)
+    buckets.take("a", now=100.0)
+    buckets.take("a", now=100.0)
+    assert buckets.take("a", now=100.25) == pytest.approx(0.25)
+    assert buckets.take("a", now=100.75) == 0.0
+
+
+def test_buckets_are_per_key():
+    buckets = TokenBuckets(rate=1.0, burst=1)
+    assert buckets.take("a", now=100.0) == 0.0
+    assert buckets.take("b", now=100.0) == 0.0
+    assert buckets.take("a", now=100.0) > 0
+
+
+def test_table_grows_past_initial_capacity():
+    buckets = TokenBuckets(rate=1.0, burst=1, capacity=2)
+    for key in range(10):
+        assert buckets.take(key, now=100.0) == 0.0
+    assert all(buckets.take(key, now=100.0) > 0 for key in range(10))
+
+
+def test_full_table_turns_away_new_ids_while_buckets_refill():
+    buckets = TokenBuckets(rate=1.0, burst=2, max_tracked=2)
+    buckets.take("a", now=100.0)
+    buckets.take("a", now=100.0)
+    buckets.take("b", now=100.0)
+    assert buckets.take("junk", now=100.5) == pytest.approx(1.5)
+    # A flood of new ids must not reset a drained sensor
+    assert buckets.take("a", now=100.5) > 0
+
+
+def test_full_table_reuses_least_recently_used_refilled_slot():
+    buckets = TokenBuckets(rate=1.0, burst=1, max_tracked=2)
+    buckets.take("a", now=100.0)
+    buckets.take("b", now=101.0)
+    assert buckets.take("c", now=101.5) == 0.0
+    assert "a" not in buckets.slots
+    assert buckets.take("b", now=101.5) > 0
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_gate_sheds_past_queue_limit():
+    async def scenario():
+        gate = ConcurrencyGate(limit=1, max_queue=0, timeout=1)
+        async with gate.slot():
+            with pytest.raises(Rejected) as e:
+                async with gate.slot():
+                    pass
+        return e.value.reason
+
+    assert run(scenario()) == "queue_full"
+
+
+def test_gate_queue_timeout_keeps_every_permit():
+    async def scenario():
+        gate = ConcurrencyGate(limit=1, max_queue=4, timeout=0.01)
+        async with gate.slot():
+            with pytest.raises(Rejected) as e:
+                async with gate.slot():
+                    pass
+        assert e.value.reason == "queue_timeout"
+        await asyncio.sleep(0)
+        return gate._semaphore._value, gate.waiting
+
+    assert run(scenario()) == (1, 0)
+
+
+def test_gate_cancelled_waiter_keeps_every_permit():
+    async def scenario():
+        gate = ConcurrencyGate(limit=1, max_queue=4, timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        async def wait_in_queue():
+            async with gate.slot():
+                pass
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(wait_in_queue())
+        await asyncio.sleep(0)
+        # The holder frees its permit just as the waiter is cancelled
+        release.set()
+        waiter.cancel()
+        await holder
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return gate._semaphore._value, gate.waiting
+
+    assert run(scenario()) == (1, 0)
+
+
+def test_gate_admits_queued_caller_when_slot_frees():
+    async def scenario():
+        gate = ConcurrencyGate(limit=1, max_queue=4, timeout=1)
+        order = []
+
+        async def call(name, hold):
+            async with gate.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(call("first", 0.01), call("second", 0))
+        return order, gate._semaphore._value
+
+    assert run(scenario()) == (["first", "second"], 1)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from app.aggregates import RegionAggregates, RingWindow, WindowedMeans, window_bucket
+
+T0 = 1_700_000_000 // 3600 * 3600
+
+
+def totals(window, row, now):
+    sums, counts = window.totals(np.array([row]), now)
+    return float(sums[0]), int(counts[0])
+
+
+def test_ring_sums_within_span():
+    window = RingWindow(span=600, bucket=60, capacity=2)
+    window.add(0, T0 + 5, 10.0)
+    window.add(0, T0 + 65, 20.0)
+    window.add(0, T0 + 70, 30.0)
+    window.add(1, T0 + 5, 99.0)
+    assert totals(window, 0, T0 + 100) == (60.0, 3)
+    assert totals(window, 1, T0 + 100) == (99.0, 1)
+
+
+def test_buckets_expire_after_span():
+    window = RingWindow(span=600, bucket=60)
+    window.add(0, T0, 10.0)
+    window.add(0, T0 + 300, 20.0)
+    assert totals(window, 0, T0 + 599) == (30.0, 2)
+    assert totals(window, 0, T0 + 600) == (20.0, 1)
+    assert totals(window, 0, T0 + 900) == (0.0, 0)
+
+
+def test_slot_is_reset_when_the_ring_wraps():
+    window = RingWindow(span=600, bucket=60)
+    window.add(0, T0, 10.0)
+    # Same ring slot, ten buckets later
+    window.add(0, T0 + 600, 5.0)
+    assert totals(window, 0, T0 + 600) == (5.0, 1)
+
+
+def test_readings_older_than_the_slot_are_dropped():
+    window = RingWindow(span=600, bucket=60)
+    window.add(0, T0 + 600, 5.0)
+    window.add(0, T0, 10.0)
+    assert totals(window, 0, T0 + 600) == (5.0, 1)
+
+
+def test_grow_keeps_existing_rows():
+    window = RingWindow(span=600, bucket=60, capacity=1)
+    window.add(0, T0, 7.0)
+    window.grow(4)
+    window.add(3, T0, 1.0)
+    assert totals(window, 0, T0) == (7.0, 1)
+    assert totals(window, 3, T0) == (1.0, 1)
+    assert totals(window, 2, T0) == (0.0, 0)
+
+
+def test_windowed_means_past_initial_capacity():
+    means = WindowedMeans()
+    for key in range(100):
+        means.add(key, T0, float(key))
+        means.add(key, T0 + 30, float(key) + 2)
+    result = means.means("1h", T0 + 60)
+    assert len(result) == 100
+    assert result[42] == (43.0, 2)
+    assert means.mean(42, "1h", T0 + 60) == 43.0
+    assert means.mean("missing", "1h", T0 + 60) is None
+
+
+def test_windows_cover_their_own_spans():
+    aggregates = RegionAggregates()
+    aggregates.add(1, 10, T0, 100.0)
+    aggregates.add(1, 10, T0 + 2 * 3600, 200.0)
+    now = T0 + 2 * 3600 + 60
+    assert aggregates.window_mean("sensor", 1, "1h", now) == 200.0
+    assert aggregates.window_mean("sensor", 1, "8h", now) == 150.0
+    assert aggregates.region_means("24h", now) == {10: (150.0, 2)}
+
+
+def test_readings_without_region_count_for_the_sensor_only():
+    aggregates = RegionAggregates()
+    aggregates.add(1, None, T0, 50.0)
+    assert aggregates.sensor_means("1h", T0) == {1: (50.0, 1)}
+    assert aggregates.region_means("1h", T0) == {}
+
+
+def test_window_bucket_moves_at_the_window_bucket_width():
+    assert window_bucket("1h", T0) == window_bucket("1h", T0 + 59) != window_bucket("1h", T0 + 60)
+    assert window_bucket("24h", T0) == window_bucket("24h", T0 + 899)
+    assert window_bucket("24h", T0 + 900) == window_bucket("24h", T0) + 1
@@ -0,0 +1,167 @@
+import pytest
+
+from app import db
+from app.alerts import AlertEngine, Rule, step
+
+
+def make_rule(threshold=100.0, clear_threshold=None, consecutive=1):
+    return Rule((1, "test", "sensor", None, "aqi", "reading", threshold, clear_threshold, consecutive))
+
+
+def run(rule, values, streak=0, firing=False):
+    transitions = []
+    for value in values:
+        streak, firing, transition = step(rule, streak, firing, value)
+        transitions.append(transition)
+    return streak, firing, transitions
+
+
+def test_fires_after_consecutive_breaches():
+    rule = make_rule(consecutive=3)
+    streak, firing, transitions = run(rule, [120, 130, 140])
+    assert transitions == [None, None, "firing"]
+    assert (streak, firing) == (3, True)
+
+
+def test_streak_resets_on_a_non_breach():
+    rule = make_rule(consecutive=3)
+    _, firing, transitions = run(rule, [120, 130, 95, 120, 130])
+    assert transitions == [None] * 5
+    assert not firing
+
+
+def test_fires_once_while_breaching():
+    rule = make_rule()
+    _, firing, transitions = run(rule, [150, 160, 170, 180])
+    assert transitions == ["firing", None, None, None]
+    assert firing
+
+
+def test_hysteresis_keeps_firing_until_clear_threshold():
+    rule = make_rule(threshold=100, clear_threshold=80)
+    _, firing, transitions = run(rule, [150, 95, 85, 101, 79])
+    assert transitions == ["firing", None, None, None, "resolved"]
+    assert not firing
+
+
+def test_default_clear_threshold_is_a_fraction_of_threshold():
+    rule = make_rule(threshold=100)
+    assert rule.clear_threshold == 90
+    _, _, transitions = run(rule, [150, 91, 90])
+    assert transitions == ["firing", None, "resolved"]
+
+
+def test_refires_after_resolving():
+    rule = make_rule(consecutive=2)
+    _, firing, transitions = run(rule, [150, 150, 50, 150, 150])
+    assert transitions == [None, "firing", "resolved", None, "firing"]
+    assert firing
+
+
+def test_stored_firing_state_is_not_fired_again():
+    # A restarted worker resumes from the stored state and must not re-fire
+    rule = make_rule()
+    _, firing, transitions = run(rule, [150, 150], streak=4, firing=True)
+    assert transitions == [None, None]
+    assert firing
+
+
+class FakeSink:
+    def __init__(self):
+        self.events = []
+
+    def send(self, event):
+        self.events.append(event)
+
+
+@pytest.fixture
+def no_database(monkeypatch):
+    def refuse():
+        raise AssertionError("evaluating a reading must not open a connection")
+    monkeypatch.setattr(db, "get_connection", refuse)
+
+
+def make_engine(rules, owned=True):
+    """
+    An engine with its rules and database side replaced: claims succeed
+    only when `owned`, and stored firing flags live in a dict.
+    """
+    engine = AlertEngine(sink=FakeSink())
+    engine._dirty = False
+    for rule in rules:
+        engine._index.setdefault((rule.scope, rule.target_id), []).append(rule)
+        engine._rules[rule.id] = rule
+    engine.stored = {}
+    engine.claims = []
+
+    def claim(subjects):
+        engine.claims.append(sorted(subjects))
+        return list(subjects) if owned else []
+
+    def store(event):
+        key = (event["rule_id"], event["subject_id"])
+        firing = event["state"] == "firing"
+        if engine.stored.get(key, False) == firing:
+            return False
+        engine.stored[key] = firing
+        return True
+
+    engine._claim = claim
+    engine._store = store
+    engine._stored_firing = lambda keys: {k: engine.stored[k] for k in keys if k in engine.stored}
+    return engine
+
+
+def feed(engine, sensor_id, region_id, values):
+    for value in values:
+        engine.evaluate(sensor_id, region_id, {"aqi": value}, lambda *args: None)
+    engine._dispatcher.submit(lambda: None).result()
+
+
+def test_engine_fires_and_resolves_from_memory(no_database):
+    engine = make_engine([make_rule(consecutive=2)])
+    feed(engine, 7, 3, [150, 150, 160, 50])
+    assert [e["state"] for e in engine.sink.events] == ["firing", "resolved"]
+    assert engine.sink.events[0]["subject_id"] == 7
+    # The subject is claimed once, with its first transition
+    assert engine.claims == [[("sensor", 7)]]
+    assert engine._state[(1, 7)] == [0, False]
+
+
+def test_engine_only_evaluates_matching_rules(no_database):
+    region_rule = Rule((2, "region", "region", 3, "aqi", "reading", 100.0, None, 1))
+    other_sensor = Rule((3, "other", "sensor", 8, "aqi", "reading", 100.0, None, 1))
+    engine = make_engine([region_rule, other_sensor])
+    feed(engine, 7, 3, [150])
+    assert [(e["rule_id"], e["subject_id"]) for e in engine.sink.events] == [(2, 3)]
+
+
+def test_engine_leaves_other_owners_subjects_alone(no_database):
+    engine = make_engine([make_rule()], owned=False)
+    feed(engine, 7, 3, [150, 50, 150])
+    # State still advances, ready for a takeover, but nothing is recorded
+    assert engine.sink.events == []
+    assert engine.stored == {}
+    assert engine._state[(1, 7)] == [1, True]
+    assert ("sensor", 7) in engine._unowned
+
+
+def test_takeover_resumes_from_stored_firing_flag(no_database):
+    engine = make_engine([make_rule()], owned=False)
+    feed(engine, 7, 3, [50])
+    # The previous owner recorded a fire this worker did not see
+    engine.stored[(1, 7)] = True
+    engine._owned.clear()
+    engine._claim = lambda subjects: list(subjects)
+    engine._claim_unowned()
+    assert engine._owned == {("sensor", 7)}
+    feed(engine, 7, 3, [150, 40])
+    assert [e["state"] for e in engine.sink.events] == ["resolved"]
+    assert engine.stored[(1, 7)] is False
+
+
+def test_recorded_transition_is_not_delivered_twice(no_database):
+    engine = make_engine([make_rule()])
+    engine.stored[(1, 7)] = True
+    feed(engine, 7, 3, [150])
+    assert engine.sink.events == []
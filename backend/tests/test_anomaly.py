@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from app.anomaly import EWMA_ALPHA, POLLUTANTS, WARMUP_READINGS, AnomalyDetector
+
+BASE = [40.0, 80.0, 20.0, 1.0, 6.0, 30.0, 4.0]
+
+
+def reference_ewma(series):
+    # Textbook exponentially weighted mean and variance, one value at a time
+    mean, var = series[0], 0.0
+    for x in series[1:]:
+        diff = x - mean
+        mean += EWMA_ALPHA * diff
+        var = (1 - EWMA_ALPHA) * (var + EWMA_ALPHA * diff * diff)
+    return mean, var
+
+
+def test_running_statistics_match_reference():
+    rng = np.random.default_rng(3)
+    readings = rng.normal(BASE, 2.0, (200, len(POLLUTANTS)))
+    detector = AnomalyDetector(capacity=1)
+    for values in readings:
+        detector.score(9, values)
+
+    slot = detector.slots[9]
+    for i in range(len(POLLUTANTS)):
+        mean, var = reference_ewma(readings[:, i].tolist())
+        assert detector.mean[slot, i] == pytest.approx(mean, rel=1e-12)
+        assert detector.var[slot, i] == pytest.approx(var, rel=1e-9)
+    assert detector.count[slot] == 200
+
+
+def test_nothing_flags_during_warmup():
+    detector = AnomalyDetector()
+    detector.score(1, BASE)
+    spike = list(BASE)
+    spike[0] = 10_000.0
+    for _ in range(WARMUP_READINGS - 1):
+        is_anomaly, _, flagged = detector.score(1, spike)
+        assert not is_anomaly and flagged == []
+
+
+def test_spike_after_warmup_flags_its_pollutant():
+    rng = np.random.default_rng(5)
+    detector = AnomalyDetector()
+    for values in rng.normal(BASE, 1.0, (WARMUP_READINGS + 10, len(POLLUTANTS))):
+        assert not detector.score(1, values)[0]
+
+    spike = list(BASE)
+    spike[POLLUTANTS.index("NO2")] = 200.0
+    is_anomaly, max_z, flagged = detector.score(1, spike)
+    assert is_anomaly
+    assert flagged == ["NO2"]
+    assert max_z > 4
+
+
+def test_constant_series_does_not_flag_small_changes():
+    detector = AnomalyDetector()
+    for _ in range(WARMUP_READINGS + 5):
+        detector.score(1, BASE)
+    # Zero variance, but the std floor is 5% of the mean
+    nudged = [v * 1.1 for v in BASE]
+    assert not detector.score(1, nudged)[0]
+
+
+def test_sensors_are_independent_and_table_grows():
+    detector = AnomalyDetector(capacity=2)
+    for sensor_id in range(10):
+        detector.score(sensor_id, [float(sensor_id)] * len(POLLUTANTS))
+    assert len(detector.count) >= 10
+    for sensor_id in range(10):
+        slot = detector.slots[sensor_id]
+        assert detector.mean[slot].tolist() == [float(sensor_id)] * len(POLLUTANTS)
+        assert detector.count[slot] == 1
+
+
+def test_observe_folds_in_like_score():
+    rng = np.random.default_rng(8)
+    readings = rng.normal(BASE, 2.0, (50, len(POLLUTANTS)))
+    scored, observed = AnomalyDetector(), AnomalyDetector()
+    for values in readings:
+        scored.score(1, values)
+        observed.observe(1, values)
+    assert np.array_equal(scored.mean, observed.mean)
+    assert np.array_equal(scored.var, observed.var)
+    assert np.array_equal(scored.count, observed.count)
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.cache import TTLCache, etag_matches
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    monkeypatch.setattr(cache, "_versions", {"sensors": 0, "readings": [0, 0]})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_etag_matches_exact_and_weak_forms():
+    etag = 'W/"abc-1-2"'
+    assert etag_matches('W/"abc-1-2"', etag)
+    assert etag_matches('"abc-1-2"', etag)
+    assert etag_matches('"other", W/"abc-1-2"', etag)
+    assert etag_matches("*", etag)
+
+
+def test_etag_matches_rejects_others():
+    etag = 'W/"abc-1-2"'
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches('W/"abc-1-3"', etag)
+
+
+def test_etag_changes_only_with_data_versions(versions):
+    before = cache.etag_for(("sensors", "readings"))
+    assert cache.etag_for(("sensors", "readings")) == before
+    cache.set_version("sensors", 3)
+    bumped = cache.etag_for(("sensors", "readings"))
+    assert bumped != before
+    # Versions only ever move forward, so a late event changes nothing
+    cache.set_version("sensors", 2)
+    cache.advance("readings", 10, shard=1)
+    advanced = cache.etag_for(("sensors", "readings"))
+    cache.advance("readings", 5, shard=1)
+    assert cache.etag_for(("sensors", "readings")) == advanced != bumped
+    assert advanced == 'W/"3-0.10"'
+
+
+def test_etag_is_the_same_in_every_process(versions):
+    # Built from shared versions only: nothing process-local goes in
+    cache.set_version("sensors", 7)
+    cache.advance("readings", 128, shard=0)
+    cache.advance("readings", 65, shard=1)
+    assert cache.etag_for(("sensors", "readings")) == 'W/"7-128.65"'
+    assert cache.etag_for(("readings",)) == 'W/"128.65"'
+    assert cache.version("readings", 1) == 65
+
+
+def test_ttl_cache_serves_until_expiry(clock):
+    ttl_cache = TTLCache(ttl=10, max_entries=8)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return len(builds)
+
+    assert ttl_cache.get_or_build("k", build) == 1
+    clock[0] += 9
+    assert ttl_cache.get_or_build("k", build) == 1
+    clock[0] += 2
+    assert ttl_cache.get_or_build("k", build) == 2
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    ttl_cache = TTLCache(ttl=10, max_entries=2)
+    ttl_cache.get_or_build("a", lambda: "a1")
+    ttl_cache.get_or_build("b", lambda: "b1")
+    ttl_cache.get_or_build("a", lambda: "a2")
+    ttl_cache.get_or_build("c", lambda: "c1")
+    assert ttl_cache.get_or_build("a", lambda: "a3") == "a1"
+    assert ttl_cache.get_or_build("b", lambda: "b2") == "b2"
+
+
+def test_ttl_cache_clear(clock):
+    ttl_cache = TTLCache(ttl=10, max_entries=2)
+    ttl_cache.get_or_build("a", lambda: "a1")
+    ttl_cache.clear()
+    assert ttl_cache.get_or_build("a", lambda: "a2") == "a2"
+
+
+def test_concurrent_misses_build_once():
+    ttl_cache = TTLCache(ttl=10, max_entries=8)
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return "body"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(ttl_cache.get_or_build("k", build)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["body"] * 8
+    assert len(builds) == 1
+    assert ttl_cache._key_locks == {}
+
+
+def test_window_responses_change_with_the_time_bucket(versions):
+    cache.set_version("sensors", 2)
+    assert cache.etag_for(("sensors",), bucket=41) == 'W/"2-t41"'
+    assert cache.etag_for(("sensors",), bucket=42) != cache.etag_for(("sensors",), bucket=41)
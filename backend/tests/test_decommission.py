@@ -0,0 +1,110 @@
+import pytest
+
+from app import decommission
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, query, params=None):
+        sql = " ".join(query.split())
+        self.connection.log.append((sql, params))
+        self.rowcount = 0
+        self._row = None
+        if sql.startswith("DELETE FROM sensor_readings"):
+            self.rowcount = self.connection.batches.pop(0)
+        elif "pg_try_advisory_lock" in sql:
+            self._row = (True,)
+        elif sql.startswith("SELECT status FROM decommission_jobs"):
+            self._row = (self.connection.status,)
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return self.connection.jobs
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, batches=(), status="pending", jobs=()):
+        self.batches = list(batches)
+        self.status = status
+        self.jobs = list(jobs)
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append(("COMMIT", None))
+
+    def rollback(self):
+        self.log.append(("ROLLBACK", None))
+
+    def close(self):
+        pass
+
+    def statements(self, prefix):
+        return [params for sql, params in self.log if sql.startswith(prefix)]
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(decommission, "BATCH_ROWS", 2)
+    monkeypatch.setattr(decommission, "BATCH_PAUSE", 0)
+
+
+def test_readings_are_deleted_in_batches_with_progress():
+    conn = FakeConnection(batches=[2, 2, 1])
+    decommission.run_job(conn, 5, 42)
+
+    assert conn.statements("DELETE FROM sensor_readings") == [(42, 2)] * 3
+    assert conn.statements("UPDATE decommission_jobs SET rows_deleted") == [(2, 5), (2, 5), (1, 5)]
+    # Each batch commits with its progress before the next one starts
+    kinds = [sql.split()[0] for sql, _ in conn.log]
+    first_batch = kinds.index("DELETE")
+    assert kinds[first_batch:first_batch + 3] == ["DELETE", "UPDATE", "COMMIT"]
+    assert conn.statements("DELETE FROM sensors") == [(42,)]
+    assert conn.statements("UPDATE decommission_jobs SET status")[-1][0] == "done"
+
+
+def test_only_sensor_scope_alerts_are_deleted():
+    conn = FakeConnection(batches=[0])
+    decommission.run_job(conn, 5, 42)
+
+    alert_deletes = [
+        (sql, params) for sql, params in conn.log
+        if sql.startswith(("DELETE FROM alerts", "DELETE FROM alert_state"))
+    ]
+    assert len(alert_deletes) == 2
+    for sql, params in alert_deletes:
+        assert "r.scope = 'sensor'" in sql and "subject_id = %s" in sql
+        assert params == (42,)
+
+
+def test_job_finished_by_another_worker_is_skipped(monkeypatch):
+    conn = FakeConnection(status="done", jobs=[(5, 42, 0)])
+    monkeypatch.setattr(decommission, "get_connection", lambda: conn)
+    ran = []
+    monkeypatch.setattr(decommission, "run_job", lambda *args: ran.append(args))
+    decommission.process_pending()
+
+    assert ran == []
+    # The lock is still released
+    assert conn.statements("SELECT pg_advisory_unlock") == [(decommission.ADVISORY_LOCK_CLASS, 5)]
+
+
+def test_pending_job_runs_under_the_lock(monkeypatch):
+    conn = FakeConnection(status="running", jobs=[(5, 42, 0)])
+    monkeypatch.setattr(decommission, "get_connection", lambda: conn)
+    ran = []
+    monkeypatch.setattr(decommission, "run_job", lambda *args: ran.append(args))
+    decommission.process_pending()
+
+    assert ran == [(conn, 5, 42, 0)]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from app.forecast import HISTORY, project
+
+
+class LinearModel:
+    """
+    Stand-in for the forecast regressor: a fixed linear map of the lag
+    features, row by row, like estimator.predict.
+    """
+
+    def __init__(self, weights, bias):
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = bias
+
+    def predict(self, features):
+        return np.asarray(features, dtype=float) @ self.weights + self.bias
+
+
+def step_by_step(model, values, horizon):
+    # The original single-sensor forecast, applied recursively
+    values = list(values)
+    out = []
+    for _ in range(horizon):
+        features = [values[-1], values[-2], values[-3], values[-6]]
+        forecast = float(model.predict([features])[0])
+        out.append(forecast)
+        values.append(forecast)
+    return out
+
+
+def test_project_matches_per_sensor_loop():
+    model = LinearModel([0.5, 0.2, 0.1, 0.15], 3.0)
+    rng = np.random.default_rng(11)
+    history = rng.uniform(20, 300, (25, HISTORY))
+
+    projected = project(model, history, 24)
+
+    assert projected.shape == (25, 24)
+    for row, values in zip(projected, history):
+        np.testing.assert_allclose(row, step_by_step(model, values, 24), rtol=1e-12)
+
+
+def test_first_step_uses_lags_1_2_3_and_6():
+    model = LinearModel([1000.0, 100.0, 10.0, 1.0], 0.0)
+    # Oldest first: lag 6 is 1, lag 3 is 4, lag 2 is 5, lag 1 is 6
+    projected = project(model, [[1, 2, 3, 4, 5, 6]], 1)
+    assert projected[0, 0] == 6000 + 500 + 40 + 1
+
+
+def test_project_leaves_history_untouched():
+    model = LinearModel([0.25, 0.25, 0.25, 0.25], 0.0)
+    history = np.array([[10.0, 20.0, 30.0, 40.0, 50.0, 60.0]])
+    project(model, history, 5)
+    assert history.tolist() == [[10.0, 20.0, 30.0, 40.0, 50.0, 60.0]]
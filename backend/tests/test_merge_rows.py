@@ -0,0 +1,49 @@
+import orjson
+import pytest
+
+from app import serialization
+from app.serialization import dump_fetched, float_or, merge_rows
+
+FIELDS = [("region", None), ("sensor_id", None), ("aqi", float_or(0.0))]
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(serialization, "SHARDED", True)
+
+
+def aqi_desc(row):
+    # ORDER BY aqi DESC, NULLs first, as Postgres sorts it
+    return (row[2] is not None, -(row[2] or 0))
+
+
+def test_single_database_part_is_passed_through():
+    body = dump_fetched([("Pune", 1, 50.0)], FIELDS)
+    assert merge_rows([body], FIELDS) is body
+
+
+def test_parts_are_concatenated_in_shard_order(sharded):
+    parts = [[("Pune", 1, 50.0)], [], [("Nagpur", 7, 80.0), ("Nagpur", 9, 10.0)]]
+    assert orjson.loads(merge_rows(parts, FIELDS)) == [
+        {"region": "Pune", "sensor_id": 1, "aqi": 50.0},
+        {"region": "Nagpur", "sensor_id": 7, "aqi": 80.0},
+        {"region": "Nagpur", "sensor_id": 9, "aqi": 10.0},
+    ]
+
+
+def test_merge_matches_one_sorted_query(sharded):
+    rows = [("A", i, float(v)) for i, v in enumerate([40, 300, 12, 95, 150, 7, 220])]
+    rows.append(("A", 99, None))
+    parts = [rows[0::3], rows[1::3], rows[2::3]]
+    merged = orjson.loads(merge_rows(parts, FIELDS, key=aqi_desc, limit=4))
+    expected = orjson.loads(dump_fetched(sorted(rows, key=aqi_desc)[:4], FIELDS))
+    assert merged == expected
+    # The NULL row sorts first and is converted by the field's converter
+    assert merged[0] == {"region": "A", "sensor_id": 99, "aqi": 0.0}
+    assert [r["aqi"] for r in merged[1:]] == [300.0, 220.0, 150.0]
+
+
+def test_reverse_key_and_no_limit(sharded):
+    parts = [[("B", 3, 1.0)], [("A", 1, 2.0), ("C", 2, 3.0)]]
+    merged = orjson.loads(merge_rows(parts, FIELDS, key=lambda row: row[1], reverse=True))
+    assert [r["sensor_id"] for r in merged] == [3, 2, 1]
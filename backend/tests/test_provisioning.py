@@ -0,0 +1,63 @@
+import pytest
+
+from app.provisioning import BulkInputError, parse_rows, validate
+
+HEADER = b"sensor_code,region_id,latitude,longitude,radius\n"
+
+
+def test_csv_rows_are_parsed_with_header():
+    rows = parse_rows(HEADER + b"S-1,1,19.1,72.9,20\n", "text/csv")
+    assert rows == [{"sensor_code": "S-1", "region_id": "1", "latitude": "19.1",
+                     "longitude": "72.9", "radius": "20"}]
+
+
+def test_csv_must_be_utf8():
+    with pytest.raises(BulkInputError):
+        parse_rows(HEADER + "S-é,1,19.1,72.9,20\n".encode("latin-1"), "text/csv")
+
+
+def test_csv_row_longer_than_header_is_a_row_error():
+    rows = parse_rows(HEADER + b"S-1,1,19.1,72.9,20,oops\nS-2,1,19.2,72.8,25\n", "text/csv")
+    valid, errors = validate(rows)
+    assert [i for i, _ in valid] == [1]
+    assert errors == [{"row": 0, "sensor_code": "S-1", "error": "Row has more fields than the header"}]
+
+
+def test_csv_row_shorter_than_header_is_a_row_error():
+    rows = parse_rows(HEADER + b"S-1,1\n", "text/csv")
+    valid, errors = validate(rows)
+    assert valid == []
+    assert errors[0]["row"] == 0 and "latitude" in errors[0]["error"]
+
+
+def test_json_row_with_non_string_keys_or_bad_values():
+    valid, errors = validate([
+        {"sensor_code": "S-1", "region_id": 1, "latitude": 19.1, "longitude": 72.9, "radius": 20},
+        {"sensor_code": "S-2", "region_id": "x", "latitude": 19.1, "longitude": 72.9, "radius": 20},
+        {1: "not a field name"},
+        "not an object",
+    ])
+    assert [i for i, _ in valid] == [0]
+    assert [e["row"] for e in errors] == [1, 2, 3]
+
+
+def test_batch_level_errors():
+    with pytest.raises(BulkInputError):
+        parse_rows(b"sensor_code,region_id\nS-1,1\n", "text/csv")
+    with pytest.raises(BulkInputError):
+        parse_rows(b"{not json", "application/json")
+    with pytest.raises(BulkInputError):
+        parse_rows(b"[]", "application/json")
+
+
+def test_rows_screened_for_duplicates_and_ranges():
+    valid, errors = validate([
+        {"sensor_code": " S-1 ", "region_id": 1, "latitude": 19.1, "longitude": 72.9, "radius": 20},
+        {"sensor_code": "S-1", "region_id": 1, "latitude": 19.1, "longitude": 72.9, "radius": 20},
+        {"sensor_code": "S-3", "region_id": 1, "latitude": 95.0, "longitude": 72.9, "radius": 20},
+        {"sensor_code": "S-4", "region_id": 1, "latitude": 19.1, "longitude": 72.9, "radius": 0},
+    ])
+    assert [(i, row.sensor_code) for i, row in valid] == [(0, "S-1")]
+    assert [e["error"] for e in errors] == [
+        "Duplicate sensor_code in this batch", "Coordinates out of range", "radius must be positive"
+    ]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from app import sketches
+from app.sketches import (
+    MAX_VALUE, RELATIVE_ACCURACY, SLOT_VALUES, decode, empty, encode, quantiles, rollup, slot_of
+)
+
+
+def sketch_of(values):
+    counts = empty()
+    for value in values:
+        counts[slot_of(value)] += 1
+    return counts
+
+
+def test_values_below_one_share_slot_zero():
+    assert slot_of(0.0) == 0
+    assert slot_of(0.99) == 0
+    assert slot_of(1.0) == 1
+
+
+def test_slot_value_is_within_relative_accuracy():
+    for value in np.geomspace(1, MAX_VALUE, 2000):
+        estimate = SLOT_VALUES[slot_of(value)]
+        assert abs(estimate - value) <= RELATIVE_ACCURACY * value * (1 + 1e-9)
+
+
+def test_values_above_max_land_in_the_last_slot():
+    assert slot_of(MAX_VALUE * 10) == slot_of(MAX_VALUE)
+    assert slot_of(MAX_VALUE) < len(SLOT_VALUES)
+
+
+def test_encode_round_trips():
+    counts = sketch_of([3, 3, 50, 120, 480])
+    assert np.array_equal(decode(encode(counts)), counts)
+    assert np.array_equal(decode(encode(empty())), empty())
+
+
+def test_quantiles_of_empty_sketch():
+    assert quantiles(empty(), [0.5, 0.9]) == [None, None]
+
+
+def test_quantiles_match_exact_within_accuracy():
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(4, 0.8, 5000)
+    counts = sketch_of(values)
+    exact = np.sort(values)
+    for q, estimate in zip([0.1, 0.5, 0.9, 0.99], quantiles(counts, [0.1, 0.5, 0.9, 0.99])):
+        true = exact[int(q * (len(values) - 1))]
+        assert estimate == pytest.approx(true, rel=RELATIVE_ACCURACY * 1.01)
+
+
+def test_merged_sketch_equals_sketch_of_union():
+    a, b = [5, 40, 80, 300], [2, 90, 90, 1000]
+    merged = sketch_of(a) + sketch_of(b)
+    assert np.array_equal(merged, sketch_of(a + b))
+    assert quantiles(merged, [0.5]) == quantiles(sketch_of(a + b), [0.5])
+
+
+def test_rollup_sums_hours_into_days():
+    day = 86400 * 20000
+    hourly = {
+        ("sensor", 1, "hour", day): sketch_of([10]),
+        ("sensor", 1, "hour", day + 3600): sketch_of([20, 30]),
+        ("sensor", 1, "hour", day + 86400): sketch_of([40]),
+    }
+    rolled = rollup(hourly)
+    assert rolled[("sensor", 1, "day", day)].sum() == 3
+    assert rolled[("sensor", 1, "day", day + 86400)].sum() == 1
+    assert np.array_equal(rolled[("sensor", 1, "hour", day + 3600)], sketch_of([20, 30]))
+    # Rolling up must not alias the input arrays
+    rolled[("sensor", 1, "day", day)][0] += 1
+    assert hourly[("sensor", 1, "hour", day)][0] == 0
+
+
+def test_recorder_counts_sensor_and_region():
+    recorder = sketches.SketchRecorder()
+    recorder.record(1, 9, 7200.5, 42)
+    recorder.record(1, 9, 7300, 42)
+    recorder.record(2, None, 7200, 42)
+    pending = recorder._pending
+    assert pending[("sensor", 1, "hour", 7200)].sum() == 2
+    assert pending[("region", 9, "hour", 7200)].sum() == 2
+    assert ("region", None, "hour", 7200) not in pending
@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.spatial import GRID_CELL_DEG, SensorIndex, SensorSnapshot, cluster
+
+
+def make_index(positions):
+    # rows: id, region_id, region, lat, lon, radius, is_active, latest aqi
+    rows = [(i + 1, 1, "R", lat, lon, 20.0, i % 3 != 0, 50.0) for i, (lat, lon) in enumerate(positions)]
+    index = SensorIndex()
+    index._snapshot = SensorSnapshot(rows)
+    index._dirty = False
+    return index
+
+
+def brute_force(positions, min_lat, min_lon, max_lat, max_lon):
+    return [
+        i + 1 for i, (lat, lon) in enumerate(positions)
+        if lat is not None and min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+    ]
+
+
+def test_in_bbox_matches_a_full_scan():
+    rng = np.random.default_rng(11)
+    positions = [(float(lat), float(lon)) for lat, lon in rng.uniform([18, 72], [21, 75], (300, 2))]
+    positions += [(None, None), (19.0, 73.0), (19.0 + GRID_CELL_DEG, 73.0)]
+    index = make_index(positions)
+
+    boxes = [(18.5, 72.5, 19.5, 73.5), (19.0, 73.0, 19.0 + GRID_CELL_DEG, 73.0), (0, 0, 90, 180),
+             (19.01, 73.01, 19.02, 73.02)]
+    for box in boxes:
+        # Inactive sensors are included, sensors without coordinates never
+        assert index.in_bbox(*box) == brute_force(positions, *box)
+
+
+def test_in_bbox_outside_the_fleet_is_empty():
+    index = make_index([(19.0, 73.0)])
+    assert index.in_bbox(-10, -10, -5, -5) == []
+
+
+def items_at(positions):
+    items = [{"sensor_id": i, "aqi": 100.0 + i} for i in range(len(positions))]
+    lat = np.array([p[0] if p else np.nan for p in positions], dtype=np.float64)
+    lon = np.array([p[1] if p else np.nan for p in positions], dtype=np.float64)
+    aqi = np.array([i["aqi"] for i in items], dtype=np.float64)
+    return items, lat, lon, aqi
+
+
+def test_cluster_merges_nearby_items_in_input_order():
+    # 3 and 0 sit together; 1 and 2 are far from everything
+    items, lat, lon, aqi = items_at([(19.0, 73.0), (25.0, 80.0), (10.0, 70.0), (19.001, 73.001)])
+    result = cluster(items, lat, lon, aqi, zoom=5)
+    assert result[0]["cluster"] and result[0]["count"] == 2
+    assert result[0]["max_aqi"] == 103.0 and result[0]["mean_aqi"] == 101.5
+    assert result[1:] == [items[1], items[2]]
+
+
+def test_cluster_keeps_items_without_coordinates_in_place():
+    items, lat, lon, aqi = items_at([(19.0, 73.0), None, (19.001, 73.001), (25.0, 80.0)])
+    result = cluster(items, lat, lon, aqi, zoom=5)
+    assert [r.get("sensor_id") for r in result] == [None, 1, 3]
+    assert result[0]["count"] == 2
+
+    items, lat, lon, aqi = items_at([None, None])
+    assert cluster(items, lat, lon, aqi, zoom=5) == items
+
+
+def test_cluster_at_high_zoom_keeps_every_item():
+    # Cells are ~0.08 degrees wide at zoom 10
+    items, lat, lon, aqi = items_at([(19.0, 73.0), (19.2, 73.2), (19.4, 73.4)])
+    assert cluster(items, lat, lon, aqi, zoom=10) == items
@@ -2,7 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { MapContainer, TileLayer, Marker, Popup, Circle, Tooltip } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import { useAppContext } from '../context/AppContext';
-import { fetchPublicSensors, fetchLatestAQI } from '../services/api';
+import { fetchDashboardSnapshot, fetchPublicSensors, fetchLatestAQI, AQI_TILE_URL } from '../services/api';
 import { Activity, Radio } from 'lucide-react';
 import { getHealthAdvisory } from '../utils/health';
 
@@ -28,15 +28,23 @@ export default function MapView() {
             try {
                 // Fetch physical sensor locations and radius from backend database
                 // This ensures admin portal modifications dynamically sync with the public frontend
-                const sensorsRes = await fetchPublicSensors();
-                const dbSensors = sensorsRes.data;
-
-                // Always fetch latest global AQI to fallback for sensors that aren't actively pinging in the 50-item liveData array
+                // Latest global AQI comes in the same round trip as a fallback for sensors that aren't actively pinging in the 50-item liveData array
+                let dbSensors;
                 let fallbackData = [];
                 try {
-                    const latestRes = await fetchLatestAQI();
-                    fallbackData = latestRes.data || [];
-                } catch (e) { }
+                    const snapshotRes = await fetchDashboardSnapshot(['sensors', 'latest']);
+                    dbSensors = snapshotRes.data.sensors;
+                    fallbackData = snapshotRes.data.latest || [];
+                } catch (e) {
+                    // Snapshot failed as a whole: load each section on its own, the latest AQI being optional
+                    console.error("Dashboard snapshot failed, loading sections separately", e);
+                    const sensorsRes = await fetchPublicSensors();
+                    dbSensors = sensorsRes.data;
+                    try {
+                        const latestRes = await fetchLatestAQI();
+                        fallbackData = latestRes.data || [];
+                    } catch (e) { }
+                }
 
                 // Map live or latest AQI data onto the physical hardware nodes
                 const mappedSensors = dbSensors.map(sensor => {
@@ -92,6 +100,8 @@ export default function MapView() {
 
                 <MapContainer center={[19.6, 75.8]} zoom={6} className="h-full w-full">
                     <TileLayer url="https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png" />
+                    {/* Server-rendered interpolated AQI surface, cached per raster version */}
+                    <TileLayer url={AQI_TILE_URL} opacity={0.6} />
 
                     {sensors.filter(s => s.latitude != null && s.longitude != null).map((sensor, i) => (
                         <React.Fragment key={`sensor - ${sensor.sensor_id} -${i} `}>
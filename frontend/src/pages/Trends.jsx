@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { LineChart, Line, AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ReferenceArea, ResponsiveContainer } from 'recharts';
 import ChartContainer from '../components/ChartContainer';
-import { fetchHistory, fetchForecast } from '../services/api';
+import { fetchDashboardSnapshot, fetchHistory, fetchForecast } from '../services/api';
 import { Activity, TrendingUp, TrendingDown, Minus } from 'lucide-react';
 import { useAppContext } from '../context/AppContext';
 
@@ -28,11 +28,26 @@ export default function Trends() {
     useEffect(() => {
         const fetchDashboardData = async () => {
             try {
-                // Fetch history from API (fallback to region 1)
-                const histRes = await fetchHistory(1);
+                // Fetch history (fallback to region 1) and forecast in one round trip
+                let history;
+                let forecast = null;
+                try {
+                    const snapshotRes = await fetchDashboardSnapshot(['history', 'forecast'], { region_id: 1, sensor_id: 1 });
+                    history = snapshotRes.data.history;
+                    forecast = snapshotRes.data.forecast;
+                } catch (e) {
+                    // A failing section (e.g. no forecast for the sensor) fails the snapshot; load each on its own, the forecast being optional
+                    console.error("Dashboard snapshot failed, loading sections separately", e);
+                    const histRes = await fetchHistory(1);
+                    history = histRes.data;
+                    try {
+                        const fRes = await fetchForecast(1);
+                        forecast = fRes.data;
+                    } catch (e) { console.error("Forecast API fetch error", e); }
+                }
                 let data = [];
-                if (histRes.data && histRes.data.length > 0) {
-                    data = histRes.data.map(d => ({
+                if (history && history.length > 0) {
+                    data = history.map(d => ({
                         time: new Date(d.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
                         timestamp: new Date(d.timestamp).getTime(),
                         AQI: parseFloat(d.aqi.toFixed(1)),
@@ -42,12 +57,9 @@ export default function Trends() {
                 }
 
                 let forecastVal = null;
-                try {
-                    const fRes = await fetchForecast(1);
-                    if (fRes.data && fRes.data.next_hour_AQI) {
-                        forecastVal = parseFloat(fRes.data.next_hour_AQI.toFixed(2));
-                    }
-                } catch (e) { console.error("Forecast API fetch error", e); }
+                if (forecast && forecast.next_hour_AQI) {
+                    forecastVal = parseFloat(forecast.next_hour_AQI.toFixed(2));
+                }
 
                 if (data.length > 0) {
                     const current = data[data.length - 1].AQI;
@@ -23,6 +23,9 @@ export const predictAQI = (data) => api.post('/predict', data);
 export const fetchForecast = (sensorId) => api.get(`/forecast/${sensorId}`);
 export const fetchTopPolluted = () => api.get('/top-polluted');
 export const fetchPublicSensors = () => api.get('/public/sensors');
+export const fetchDashboardSnapshot = (sections, params = {}) =>
+    api.get('/dashboard/snapshot', { params: { sections: sections.join(','), ...params } });
+export const AQI_TILE_URL = `${API_BASE_URL}/tiles/aqi/{z}/{x}/{y}.png`;
 
 export const registerAdmin = (username, email, password) =>
     api.post(`/admin/register?username=${encodeURIComponent(username)}&email=${encodeURIComponent(email)}&password=${encodeURIComponent(password)}`);